@@ -1,12 +1,14 @@
+import asyncio
 import os
-import shutil
 import logging
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Depends, Body
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Depends, Body, Request, Header
 from typing import List, Optional
 
 from ...core.config import settings
-from ...services import processing_service, vectorstore_service
-from ...models.schemas import StagedUploadResponse, DeleteRequest, DeleteResponse, FileDeleteStatus, ProcessRequest, ProcessResponse, FileProcessStatus
+from ...services import vectorstore_service, job_queue, blob_store, chunk_manifest, upload_sessions
+from ...services.upload_sessions import UploadSessionError, UploadSessionNotFound
+from ...services.chunk_manifest import file_content_hash
+from ...models.schemas import StagedUploadResponse, UploadSessionCreateRequest, UploadSessionResponse, UploadFinalizeRequest, DeleteRequest, DeleteResponse, FileDeleteStatus, ProcessRequest, ProcessResponse, FileProcessStatus, JobStatusResponse, IndexedFile, IndexedFilesResponse
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -20,41 +22,158 @@ async def stage_upload_api( # Renamed function for clarity
 ):
     """
     Handles uploading a single PDF document and staging it for later processing.
-    File is saved to a user-specific directory in STAGED_FILES_DIR.
+    The upload is hashed while it streams into the content-addressed blob store, and the
+    staged file in STAGED_FILES_DIR/<user_id> is a link to that blob, so uploading content
+    that is already stored takes no extra space.
     """
-    user_staging_dir = settings.STAGED_FILES_DIR / user_id
-    user_staging_dir.mkdir(parents=True, exist_ok=True)
-
     # Sanitize filename (optional, but good practice)
     # filename = secure_filename(file.filename) # Example, if using a utility
     filename = file.filename # Assuming filename is generally safe for now
-    staged_file_path = user_staging_dir / filename
+    staged_file_path = settings.STAGED_FILES_DIR / user_id / filename
 
-    # Save the uploaded file to staging area
+    # Store the upload and stage a link to it
     try:
-        with open(staged_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        logger.info(f"File '{filename}' staged to '{staged_file_path}' for user '{user_id}'.")
+        blob = await blob_store.blob_store.store_upload(file)
+        await asyncio.to_thread(blob_store.blob_store.link, blob, staged_file_path)
+        logger.info(
+            f"File '{filename}' staged to '{staged_file_path}' for user '{user_id}' "
+            f"({blob.size_bytes} bytes, sha256 {blob.content_hash[:12]}, {'duplicate' if blob.deduplicated else 'new'} content)."
+        )
     except Exception as e:
         logger.error(f"Error staging uploaded file '{filename}' for user '{user_id}': {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Could not stage file: {str(e)}")
     finally:
-        file.file.close()
+        await file.close()
+
+    indexed_as = await asyncio.to_thread(chunk_manifest.chunk_manifest.find_files_by_content_hash, user_id, blob.content_hash)
+    return StagedUploadResponse(
+        filename=filename,
+        message="File successfully staged for processing.",
+        user_id=user_id,
+        staged_path=str(staged_file_path), # Return the path for reference if needed
+        content_hash=blob.content_hash,
+        size_bytes=blob.size_bytes,
+        deduplicated=blob.deduplicated,
+        already_indexed_as=(filename if filename in indexed_as else indexed_as[0]) if indexed_as else None
+    )
+
+def _session_response(session: dict) -> UploadSessionResponse:
+    return UploadSessionResponse(
+        session_id=session["id"],
+        user_id=session["user_id"],
+        filename=session["filename"],
+        size_bytes=session["size_bytes"],
+        chunk_size=session["chunk_size"],
+        chunk_count=session["chunk_count"],
+        received_chunks=session["received_chunks"],
+        missing_chunks=session["missing_chunks"],
+        expires_at=session["expires_at"]
+    )
+
+def _session_error(e: UploadSessionError) -> HTTPException:
+    return HTTPException(status_code=404 if isinstance(e, UploadSessionNotFound) else 409, detail=str(e))
+
+
+@router.post("/upload/sessions/", response_model=UploadSessionResponse)
+async def create_upload_session_api(request: UploadSessionCreateRequest = Body(...)):
+    """
+    Starts a resumable, chunked upload of a large file. The client then PUTs each chunk
+    (`chunk_size` bytes at offset index * chunk_size) to /upload/sessions/{session_id}/chunk,
+    in any order and in parallel, and finishes with /upload/sessions/{session_id}/finalize.
+    A user can have several sessions open at once (one per file).
+    """
+    try:
+        session = await asyncio.to_thread(
+            upload_sessions.upload_sessions.create, request.user_id, request.filename, request.size_bytes, request.chunk_size
+        )
+    except UploadSessionError as e:
+        raise _session_error(e)
+    logger.info(
+        f"Opened upload session {session['id']} for '{request.filename}' of user '{request.user_id}' "
+        f"({request.size_bytes} bytes in {session['chunk_count']} chunk(s))."
+    )
+    return _session_response(session)
+
+@router.get("/upload/sessions/{session_id}", response_model=UploadSessionResponse)
+async def get_upload_session_api(session_id: str):
+    """Returns which chunks of an upload have been received (what to send when resuming)."""
+    try:
+        session = await asyncio.to_thread(upload_sessions.upload_sessions.get, session_id)
+    except UploadSessionError as e:
+        raise _session_error(e)
+    return _session_response(session)
+
+@router.put("/upload/sessions/{session_id}/chunk", response_model=UploadSessionResponse)
+async def upload_session_chunk_api(
+    session_id: str,
+    request: Request,
+    offset: int,
+    x_chunk_sha256: Optional[str] = Header(None)
+):
+    """
+    Receives one chunk as the raw request body and writes it straight to its offset in the
+    upload. An optional X-Chunk-SHA256 header is checked before the chunk is accepted; a
+    chunk that is rejected or interrupted can simply be sent again.
+    """
+    try:
+        session = await upload_sessions.upload_sessions.write_chunk(session_id, offset, request.stream(), x_chunk_sha256)
+    except UploadSessionError as e:
+        raise _session_error(e)
+    return _session_response(session)
 
+@router.post("/upload/sessions/{session_id}/finalize", response_model=StagedUploadResponse)
+async def finalize_upload_session_api(session_id: str, request: UploadFinalizeRequest = Body(...)):
+    """
+    Completes a chunked upload: checks that every chunk arrived and that the file matches
+    the given sha256, then moves it into the blob store and stages it like /upload/ does.
+    """
+    try:
+        session, blob = await asyncio.to_thread(upload_sessions.upload_sessions.finalize, session_id, request.sha256)
+    except UploadSessionError as e:
+        raise _session_error(e)
+    user_id, filename = session["user_id"], session["filename"]
+    staged_file_path = settings.STAGED_FILES_DIR / user_id / filename
+    try:
+        await asyncio.to_thread(blob_store.blob_store.link, blob, staged_file_path)
+    except Exception as e:
+        logger.error(f"Error staging finalized upload '{filename}' for user '{user_id}': {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Could not stage file: {str(e)}")
+    logger.info(
+        f"Upload session {session_id} finalized: '{filename}' staged for user '{user_id}' "
+        f"({blob.size_bytes} bytes, sha256 {blob.content_hash[:12]}, {'duplicate' if blob.deduplicated else 'new'} content)."
+    )
+
+    indexed_as = await asyncio.to_thread(chunk_manifest.chunk_manifest.find_files_by_content_hash, user_id, blob.content_hash)
     return StagedUploadResponse(
         filename=filename,
         message="File successfully staged for processing.",
         user_id=user_id,
-        staged_path=str(staged_file_path) # Return the path for reference if needed
+        staged_path=str(staged_file_path),
+        content_hash=blob.content_hash,
+        size_bytes=blob.size_bytes,
+        deduplicated=blob.deduplicated,
+        already_indexed_as=(filename if filename in indexed_as else indexed_as[0]) if indexed_as else None
     )
 
+@router.delete("/upload/sessions/{session_id}")
+async def abort_upload_session_api(session_id: str):
+    """Aborts a chunked upload and frees the space of the chunks received so far."""
+    try:
+        await asyncio.to_thread(upload_sessions.upload_sessions.abort, session_id)
+    except UploadSessionError as e:
+        raise _session_error(e)
+    return {"session_id": session_id, "message": "Upload session aborted."}
+
 @router.post("/process/", response_model=ProcessResponse)
 async def process_staged_documents_api(
     request: ProcessRequest = Body(...)
 ):
     """
-    Processes a list of specified staged files for a user.
-    Moves files from staging to processed directory upon success.
+    Queues a list of specified staged files of a user for background processing.
+    Returns right away with one job ID per file; progress is available from
+    /process/jobs/{job_id}. Files are moved from staging to the processed directory
+    once their job succeeds. Files whose content is already indexed for the user are
+    skipped (status "already_indexed").
     """
     user_id = request.user_id
     filenames_to_process = request.filenames
@@ -66,66 +185,47 @@ async def process_staged_documents_api(
         raise HTTPException(status_code=400, detail="No filenames provided for processing.")
 
     user_staging_dir = settings.STAGED_FILES_DIR / user_id
-    user_processed_dir = settings.UPLOADED_FILES_DIR / user_id # For successfully processed files
-    user_processed_dir.mkdir(parents=True, exist_ok=True)
 
     for filename in filenames_to_process:
         staged_file_path = user_staging_dir / filename
-        processed_file_path = user_processed_dir / filename
-
-        current_file_status = FileProcessStatus(filename=filename, status="pending")
 
         if not staged_file_path.exists():
             logger.warning(f"File '{filename}' not found in staging for user '{user_id}'.")
-            current_file_status.status = "file_not_found_in_staging"
-            current_file_status.message = "File was not found in the staging area."
-            files_status.append(current_file_status)
+            files_status.append(FileProcessStatus(
+                filename=filename,
+                status="file_not_found_in_staging",
+                message="File was not found in the staging area."
+            ))
+            continue
+
+        # Content that is already indexed for this user is not processed again
+        content_hash = await asyncio.to_thread(file_content_hash, staged_file_path)
+        indexed_as = await asyncio.to_thread(chunk_manifest.chunk_manifest.find_files_by_content_hash, user_id, content_hash)
+        if indexed_as:
+            if filename in indexed_as:
+                processed_file_path = settings.UPLOADED_FILES_DIR / user_id / filename
+                await asyncio.to_thread(blob_store.blob_store.move, staged_file_path, processed_file_path)
+                message = "The same content is already indexed under this name; nothing to process."
+            else:
+                await asyncio.to_thread(staged_file_path.unlink)
+                message = f"The same content is already indexed as '{indexed_as[0]}'; nothing to process."
+            logger.info(f"Skipping '{filename}' for user '{user_id}': {message}")
+            files_status.append(FileProcessStatus(filename=filename, status="already_indexed", message=message))
             continue
 
-        try:
-            logger.info(f"Processing '{filename}' for user '{user_id}' from '{staged_file_path}'.")
-            processed_docs = processing_service.process_uploaded_pdf(
-                uploaded_file_path=str(staged_file_path),
-                original_filename=filename,
-                user_id=user_id
-            )
-
-            if not processed_docs:
-                logger.warning(f"No processable content in '{filename}' for user '{user_id}'.")
-                current_file_status.status = "processing_no_content"
-                current_file_status.message = "No processable text or table content was extracted."
-                # Optionally delete from staging if no content: staged_file_path.unlink(missing_ok=True)
-                files_status.append(current_file_status)
-                continue
-
-            current_file_status.table_chunks_extracted = sum(1 for doc in processed_docs if doc.metadata.get("content_type") == "table_chunk")
-            current_file_status.text_sections_extracted = sum(1 for doc in processed_docs if doc.metadata.get("content_type") == "text_section")
-            current_file_status.total_chunks_processed = len(processed_docs)
-
-            logger.info(f"Adding {len(processed_docs)} chunks of '{filename}' to vector store for user '{user_id}'.")
-            success_add = vectorstore_service.add_documents_to_store(
-                user_id=user_id,
-                documents=processed_docs
-            )
-
-            if not success_add:
-                raise Exception("Failed to add processed document chunks to the vector store.")
-
-            # Move file from staging to processed after successful processing and vector store addition
-            shutil.move(str(staged_file_path), str(processed_file_path))
-            logger.info(f"Moved '{filename}' from staging to processed directory for user '{user_id}'.")
-
-            current_file_status.status = "processed_successfully"
-            current_file_status.message = "File processed and indexed successfully."
-
-        except Exception as e:
-            logger.error(f"Error during processing or storage of '{filename}' for user '{user_id}': {e}", exc_info=True)
-            current_file_status.status = "processing_error"
-            current_file_status.message = str(e)
-
-        files_status.append(current_file_status)
-
-    overall_message = f"Processing attempt completed for {len(filenames_to_process)} file(s)."
+        job = await asyncio.to_thread(job_queue.job_queue.enqueue, user_id, filename)
+        logger.info(f"Queued '{filename}' for user '{user_id}' as job {job['id']}.")
+        files_status.append(FileProcessStatus(
+            filename=filename,
+            status=job["status"],
+            message="File queued for processing.",
+            job_id=job["id"]
+        ))
+
+    job_queue.notify_workers()
+
+    queued_count = sum(1 for fs in files_status if fs.job_id)
+    overall_message = f"Queued {queued_count} of {len(filenames_to_process)} file(s) for processing."
     return ProcessResponse(
         user_id=user_id,
         overall_message=overall_message,
@@ -133,6 +233,41 @@ async def process_staged_documents_api(
     )
 
 
+@router.get("/process/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_processing_job_api(job_id: str):
+    """
+    Returns the status of a background processing job, with per-stage progress
+    (parse, sections, tables, embed, persist) and the file's result once completed.
+    """
+    job = await asyncio.to_thread(job_queue.job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Processing job '{job_id}' not found.")
+    return JobStatusResponse(
+        job_id=job["id"],
+        user_id=job["user_id"],
+        filename=job["filename"],
+        status=job["status"],
+        current_stage=job["current_stage"],
+        stages=job["stages"],
+        attempts=job["attempts"],
+        max_attempts=job["max_attempts"],
+        error=job["error"],
+        result=FileProcessStatus(**job["result"], job_id=job["id"]) if job["result"] else None,
+        created_at=job["created_at"],
+        updated_at=job["updated_at"]
+    )
+
+
+@router.get("/files/{user_id}", response_model=IndexedFilesResponse)
+async def list_indexed_files_api(user_id: str):
+    """
+    Lists the user's indexed files from the chunk manifest, with their content hash
+    and chunk counts.
+    """
+    files = await asyncio.to_thread(vectorstore_service.list_indexed_files, user_id)
+    return IndexedFilesResponse(user_id=user_id, files=[IndexedFile(**f) for f in files])
+
+
 @router.post("/delete/", response_model=DeleteResponse)
 async def delete_documents_api( # Assuming this still deletes from PROCESSED files
     request: DeleteRequest = Body(...)
@@ -151,7 +286,8 @@ async def delete_documents_api( # Assuming this still deletes from PROCESSED fil
 
     # Attempt to delete from vector store first
     try:
-        vs_delete_success = vectorstore_service.delete_documents_from_store(
+        vs_delete_success = await asyncio.to_thread(
+            vectorstore_service.delete_documents_from_store,
             user_id=user_id,
             filenames=filenames_to_delete
         )
@@ -185,6 +321,8 @@ async def delete_documents_api( # Assuming this still deletes from PROCESSED fil
             logger.warning(f"File '{filename}' not found in filesystem for user '{user_id}' for deletion, but embeddings might have been removed.")
             files_status.append(FileDeleteStatus(filename=filename, status="not_found_in_storage", message="Embeddings removed (if existed), file not found in storage."))
 
+    await asyncio.to_thread(blob_store.blob_store.remove_unreferenced) # Stored uploads no file links to any more
+
     overall_message = f"Deletion process completed for {len(filenames_to_delete)} file(s)."
     # Check if all were successful
     if all(fs.status == "deleted_successfully" for fs in files_status):
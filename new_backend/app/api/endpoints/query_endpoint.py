@@ -1,14 +1,41 @@
+import json
 import logging
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
 
 from ...services import qa_service
-from ...models.schemas import QueryRequest, QueryResponse, SourceDocument
+from ...services.chunk_filter import ChunkFilter
+from ...models.schemas import QueryFilters, QueryRequest, QueryResponse, SourceDocument
 from ...core.config import settings
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=settings.LOG_LEVEL)
 
+def _parse_source(src_meta: dict, user_id: str) -> SourceDocument:
+    try:
+        # Ensure all required fields for SourceDocument are present or provide defaults
+        # 'filename' is the only strictly required field in SourceDocument model as defined.
+        # Optional fields will be None if not present in src_meta.
+        return SourceDocument(**src_meta)
+    except Exception as e: # Catch Pydantic validation errors or others
+        logger.warning(f"Could not parse source document metadata for user '{user_id}': {src_meta}. Error: {e}", exc_info=True)
+        # Optionally, append a placeholder or skip this source
+        return SourceDocument(filename=src_meta.get("filename", "Error parsing source"))
+
+def _chunk_filter(filters: Optional[QueryFilters]) -> Optional[ChunkFilter]:
+    """Request filters as a ChunkFilter (page numbers converted to the 0-based pages of chunk metadata)."""
+    if filters is None:
+        return None
+    chunk_filter = ChunkFilter(
+        filenames=tuple(filters.filenames or ()),
+        content_types=tuple(filters.content_types or ()),
+        page_ranges=tuple((page_range.start - 1, (page_range.end or page_range.start) - 1) for page_range in filters.page_ranges or ()),
+        section_titles=tuple(filters.section_titles or ())
+    )
+    return None if chunk_filter.is_empty() else chunk_filter
+
 @router.post("/", response_model=QueryResponse)
 async def query_documents_api(
     request: QueryRequest = Body(...) # Use Pydantic model for request body
@@ -26,18 +53,18 @@ async def query_documents_api(
         raise HTTPException(status_code=400, detail="Question cannot be empty.")
 
     try:
-        answer_text, source_docs_metadata = qa_service.get_answer(
+        result = await qa_service.aget_answer(
             question=question,
-            user_id=user_id
-            # top_k for retriever is handled within qa_service calling vectorstore_service,
-            # which defaults to k=15. If QueryRequest.top_k needs to be passed,
-            # qa_service.get_answer and vectorstore_service.get_retriever would need to accept it.
-            # For now, using the default k=15 from the original streamlit code's retriever.
+            user_id=user_id,
+            top_k=request.top_k,
+            bypass_cache=request.bypass_cache,
+            filters=_chunk_filter(request.filters)
         )
     except Exception as e:
         logger.error(f"Unhandled error in QA service for user '{user_id}', question '{question}': {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred while processing your query: {str(e)}")
 
+    answer_text, source_docs_metadata = result.answer, result.sources
     if answer_text is None:
         # This case might occur if LLM or other critical part of qa_service fails initialization or execution
         logger.error(f"QA service returned no answer for user '{user_id}', question '{question}'.")
@@ -47,20 +74,64 @@ async def query_documents_api(
     # The qa_service.get_answer now returns a list of dicts that should match SourceDocument fields
     sources_for_response: list[SourceDocument] = []
     for src_meta in source_docs_metadata:
-        try:
-            # Ensure all required fields for SourceDocument are present or provide defaults
-            # 'filename' is the only strictly required field in SourceDocument model as defined.
-            # Optional fields will be None if not present in src_meta.
-            sources_for_response.append(SourceDocument(**src_meta))
-        except Exception as e: # Catch Pydantic validation errors or others
-            logger.warning(f"Could not parse source document metadata for user '{user_id}': {src_meta}. Error: {e}", exc_info=True)
-            # Optionally, append a placeholder or skip this source
-            sources_for_response.append(SourceDocument(filename=src_meta.get("filename", "Error parsing source")))
+        sources_for_response.append(_parse_source(src_meta, user_id))
 
 
     return QueryResponse(
         question=question,
         answer=answer_text,
         sources=sources_for_response,
-        user_id=user_id
+        user_id=user_id,
+        from_cache=result.from_cache,
+        timings_ms=result.timings_ms,
+        prompt_tokens=result.prompt_tokens,
+        prompt_tokens_saved=result.prompt_tokens_saved
+    )
+
+
+@router.post("/stream")
+async def stream_query_documents_api(
+    http_request: Request,
+    request: QueryRequest = Body(...)
+):
+    """
+    Streaming variant of the query endpoint, as Server-Sent Events:
+        event: sources  -> list of SourceDocument, sent as soon as retrieval finishes
+        event: token    -> {"text": ...} for each piece of the answer
+        event: done     -> {"timings_ms": per-stage timings incl. time_to_first_token, "prompt_tokens": ..., "prompt_tokens_saved": ..., "from_cache": ...}
+        event: error    -> {"detail": ...} if the answer cannot be produced
+    If the client disconnects, generation is cancelled and the LLM request aborted.
+    """
+    user_id = request.user_id
+    question = request.question
+
+    logger.info(f"Received streaming query from user '{user_id}': '{question}'")
+
+    if not question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty.")
+
+    async def event_stream():
+        answer_events = qa_service.astream_answer(
+            question=question, user_id=user_id, top_k=request.top_k, bypass_cache=request.bypass_cache,
+            filters=_chunk_filter(request.filters)
+        )
+        try:
+            async for event, data in answer_events:
+                if await http_request.is_disconnected():
+                    logger.info(f"Client disconnected, cancelling streamed answer for user '{user_id}'.")
+                    break
+                if event == "sources":
+                    data = [_parse_source(src_meta, user_id).model_dump(exclude_none=True) for src_meta in data]
+                elif event == "token":
+                    data = {"text": data}
+                elif event == "error":
+                    data = {"detail": data}
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            await answer_events.aclose() # Stops the LLM request if we are leaving early
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"} # Disable proxy buffering
     )
@@ -16,6 +16,8 @@ load_dotenv(dotenv_path=env_path)
 class Settings:
     # OpenAI API Key
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY") # Fallback for safety
+    # Optional alternative endpoint for OpenAI-compatible APIs (e.g. a local fake server for tests/benchmarks)
+    OPENAI_BASE_URL: str | None = os.getenv("OPENAI_BASE_URL") or None
 
     # Model Names
     EMBEDDING_MODEL_NAME: str = "text-embedding-3-large"
@@ -36,8 +38,182 @@ class Settings:
     UPLOADED_FILES_DIR.mkdir(parents=True, exist_ok=True)
     CHROMA_STORE_DIR.mkdir(parents=True, exist_ok=True)
 
+    # Vector store handle cache
+    # Per-user Chroma instances are kept open between requests instead of being
+    # reloaded from disk every time. Least recently used handles are evicted once
+    # the cap is reached, and handles idle for longer than the timeout are dropped.
+    VECTORSTORE_CACHE_MAX_HANDLES: int = int(os.getenv("VECTORSTORE_CACHE_MAX_HANDLES", "64"))
+    VECTORSTORE_CACHE_IDLE_TIMEOUT_SECONDS: float = float(os.getenv("VECTORSTORE_CACHE_IDLE_TIMEOUT_SECONDS", "900"))
+
+    # Vector store layout
+    # "per_user": one persisted Chroma database per user under CHROMA_STORE_DIR/<user_id>.
+    # "shared": all users in VECTORSTORE_SHARDS collections of one Chroma database under
+    # SHARED_CHROMA_STORE_DIR. A user's records live in the shard picked by a hash of their ID,
+    # and every read, write and delete is scoped to their user_id. Changing the shard count
+    # moves users to other shards, so it requires migrating again (tools/migrate_vectorstore.py).
+    VECTORSTORE_MODE: str = os.getenv("VECTORSTORE_MODE", "per_user").lower() # per_user | shared
+    SHARED_CHROMA_STORE_DIR: Path = Path(os.getenv("SHARED_CHROMA_STORE_DIR", str(BASE_DIR / "chroma_shared")))
+    VECTORSTORE_SHARDS: int = int(os.getenv("VECTORSTORE_SHARDS", "1"))
+    # Users with at most this many records matching a query are searched by an exact scan of
+    # their own embeddings rather than by a filtered query on the shard's HNSW index, whose
+    # cost grows with the whole shard (0 always uses the index).
+    VECTORSTORE_EXACT_SEARCH_MAX_RECORDS: int = int(os.getenv("VECTORSTORE_EXACT_SEARCH_MAX_RECORDS", "500"))
+
+    # Embedding cache
+    # Chunk and query embeddings are cached on disk keyed by (model name, hash of the
+    # normalized text), so re-uploads and retries only send cache misses to the API.
+    EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_PATH: Path = Path(os.getenv("EMBEDDING_CACHE_PATH", str(BASE_DIR / "embedding_cache" / "embeddings.sqlite3")))
+
+    # Embedding pipeline
+    # Chunks are embedded in token-budgeted batches by a bounded pool of async workers.
+    # Rate-limited (429) and transient failures are retried with exponential backoff.
+    EMBEDDING_BATCH_MAX_TOKENS: int = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "50000"))
+    EMBEDDING_BATCH_MAX_ITEMS: int = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "256"))
+    EMBEDDING_MAX_CONCURRENCY: int = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+    EMBEDDING_MAX_RETRIES: int = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+    EMBEDDING_BACKOFF_BASE_SECONDS: float = float(os.getenv("EMBEDDING_BACKOFF_BASE_SECONDS", "1.0"))
+    EMBEDDING_BACKOFF_MAX_SECONDS: float = float(os.getenv("EMBEDDING_BACKOFF_MAX_SECONDS", "60"))
+
+    # Upload blob store
+    # Uploads are hashed while they stream to disk and stored once per distinct content;
+    # staged and processed files are hard links to the stored blob. Blobs no file links to
+    # any more are removed (after a grace period, so in-flight uploads are never collected).
+    BLOB_STORE_DIR: Path = Path(os.getenv("BLOB_STORE_DIR", str(BASE_DIR / "blob_store")))
+    UPLOAD_CHUNK_SIZE_BYTES: int = int(os.getenv("UPLOAD_CHUNK_SIZE_BYTES", str(1024 * 1024)))
+    BLOB_GC_GRACE_SECONDS: float = float(os.getenv("BLOB_GC_GRACE_SECONDS", "3600"))
+
+    # Resumable chunked uploads
+    # Large files can be sent as fixed-size chunks (in parallel, in any order, resumable) that
+    # are written in place into one file per session. It lives inside the blob store so the
+    # finalized file is moved into the store without a copy (must be on the same filesystem).
+    UPLOAD_SESSION_DB_PATH: Path = Path(os.getenv("UPLOAD_SESSION_DB_PATH", str(BASE_DIR / "upload_sessions" / "sessions.sqlite3")))
+    UPLOAD_SESSION_DIR: Path = Path(os.getenv("UPLOAD_SESSION_DIR", str(BLOB_STORE_DIR / "sessions")))
+    UPLOAD_SESSION_CHUNK_BYTES: int = int(os.getenv("UPLOAD_SESSION_CHUNK_BYTES", str(8 * 1024 * 1024)))
+    UPLOAD_SESSION_MAX_CHUNK_BYTES: int = int(os.getenv("UPLOAD_SESSION_MAX_CHUNK_BYTES", str(64 * 1024 * 1024)))
+    UPLOAD_SESSION_TTL_SECONDS: float = float(os.getenv("UPLOAD_SESSION_TTL_SECONDS", "86400"))
+    UPLOAD_SESSION_MAX_PER_USER: int = int(os.getenv("UPLOAD_SESSION_MAX_PER_USER", "32"))
+
+    # Chunk manifest
+    # Per user: filename -> content hash -> page hashes -> chunk IDs, written when a file is indexed.
+    # Deletes, re-indexing and file listings are direct ID lookups against it.
+    CHUNK_MANIFEST_PATH: Path = Path(os.getenv("CHUNK_MANIFEST_PATH", str(BASE_DIR / "chunk_manifest" / "manifest.sqlite3")))
+    # Re-processing an indexed file only parses and embeds the pages whose hash changed
+    INCREMENTAL_INDEXING_ENABLED: bool = os.getenv("INCREMENTAL_INDEXING_ENABLED", "true").lower() == "true"
+
+    # Background processing jobs
+    # /process/ enqueues one job per file in a SQLite-backed queue served by a pool of
+    # worker threads. Jobs survive restarts and failed attempts are retried with backoff.
+    JOB_QUEUE_PATH: Path = Path(os.getenv("JOB_QUEUE_PATH", str(BASE_DIR / "job_queue" / "jobs.sqlite3")))
+    PROCESSING_WORKERS: int = int(os.getenv("PROCESSING_WORKERS", "2"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_RETRY_BACKOFF_SECONDS: float = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "10"))
+    JOB_POLL_INTERVAL_SECONDS: float = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1.0"))
+
+    # PDF processing engine
+    # Pages of a file are split into ranges that are parsed (text, sections, tables) in a
+    # shared process pool, so files and page ranges spread across cores. Results are merged
+    # back in page order. Set PROCESSING_POOL_WORKERS=0 to process everything in-process.
+    PROCESSING_POOL_WORKERS: int = int(os.getenv("PROCESSING_POOL_WORKERS", str(os.cpu_count() or 1)))
+    PROCESSING_PAGES_PER_TASK: int = int(os.getenv("PROCESSING_PAGES_PER_TASK", "20"))
+    PROCESSING_WORKER_MEMORY_LIMIT_MB: int = int(os.getenv("PROCESSING_WORKER_MEMORY_LIMIT_MB", "2048")) # 0 disables the cap
+    PROCESSING_MAX_TASKS_PER_CHILD: int = int(os.getenv("PROCESSING_MAX_TASKS_PER_CHILD", "50")) # Recycle workers to release memory
+    # Camelot only runs on pages whose content stream draws enough ruling lines to hold a
+    # lattice table (found while the text is parsed), split into tasks of TABLE_PAGES_PER_TASK pages
+    TABLE_PREPASS_ENABLED: bool = os.getenv("TABLE_PREPASS_ENABLED", "true").lower() == "true"
+    TABLE_PREPASS_MIN_RULINGS: int = int(os.getenv("TABLE_PREPASS_MIN_RULINGS", "3"))
+    TABLE_PAGES_PER_TASK: int = int(os.getenv("TABLE_PAGES_PER_TASK", "4"))
+    # OCR fallback: pages are rasterized one at a time (grayscale, OCR_DPI) in the process pool;
+    # rendering or OCR of a page taking longer than OCR_PAGE_TIMEOUT_SECONDS is killed and skipped
+    OCR_DPI: int = int(os.getenv("OCR_DPI", "150"))
+    OCR_PAGE_TIMEOUT_SECONDS: float = float(os.getenv("OCR_PAGE_TIMEOUT_SECONDS", "60"))
+
+    # Extraction artifact cache
+    # Per-page page text, Camelot tables and OCR text keyed by file content hash and extractor
+    # version, reused by retries and re-indexing. Least recently used artifacts are evicted
+    # once the cache exceeds ARTIFACT_CACHE_MAX_BYTES. Inspect or purge it with tools/artifact_cache.py.
+    ARTIFACT_CACHE_ENABLED: bool = os.getenv("ARTIFACT_CACHE_ENABLED", "true").lower() == "true"
+    ARTIFACT_CACHE_PATH: Path = Path(os.getenv("ARTIFACT_CACHE_PATH", str(BASE_DIR / "artifact_cache" / "artifacts.sqlite3")))
+    ARTIFACT_CACHE_MAX_BYTES: int = int(os.getenv("ARTIFACT_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+    # Async OpenAI HTTP client
+    # The async query path (query embeddings and chat completions) shares one pooled
+    # HTTP client on the application's event loop, so concurrent questions reuse connections.
+    OPENAI_HTTP_MAX_CONNECTIONS: int = int(os.getenv("OPENAI_HTTP_MAX_CONNECTIONS", "100"))
+    OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    OPENAI_HTTP_TIMEOUT_SECONDS: float = float(os.getenv("OPENAI_HTTP_TIMEOUT_SECONDS", "60"))
+
+    # Answer cache
+    # Answers are reused for questions whose embedding is at least this similar (cosine) to a
+    # cached question, provided retrieval returns exactly the same chunks. A user's cached
+    # answers are dropped whenever their documents are added or deleted.
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+    ANSWER_CACHE_MAX_ENTRIES_PER_USER: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES_PER_USER", "256"))
+    ANSWER_CACHE_TTL_SECONDS: float = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+
+    # Context packing
+    # Retrieval fetches top_k * QA_RETRIEVAL_OVERFETCH candidates. The packer then drops
+    # near-duplicates and chunks below QA_MIN_RELEVANCE (cosine similarity), truncates long
+    # table chunks, and keeps up to top_k chunks that fit into QA_CONTEXT_MAX_TOKENS.
+    QA_CONTEXT_MAX_TOKENS: int = int(os.getenv("QA_CONTEXT_MAX_TOKENS", "6000"))
+    QA_RETRIEVAL_OVERFETCH: int = int(os.getenv("QA_RETRIEVAL_OVERFETCH", "2"))
+    QA_MIN_RELEVANCE: float = float(os.getenv("QA_MIN_RELEVANCE", "0.2"))
+    QA_DUPLICATE_SIMILARITY: float = float(os.getenv("QA_DUPLICATE_SIMILARITY", "0.9")) # Word-shingle Jaccard
+    QA_TABLE_CHUNK_MAX_TOKENS: int = int(os.getenv("QA_TABLE_CHUNK_MAX_TOKENS", "800"))
+
+    # Hybrid retrieval
+    # A per-user BM25 index of chunk texts (written and deleted together with the vector store)
+    # is searched next to Chroma, and both rankings are merged by reciprocal rank fusion:
+    # score = sum(weight / (HYBRID_RRF_K + rank)). Chunks found only by BM25 get their
+    # embedding distance from the store, so context packing treats them like vector hits.
+    HYBRID_SEARCH_ENABLED: bool = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+    LEXICAL_INDEX_PATH: Path = Path(os.getenv("LEXICAL_INDEX_PATH", str(BASE_DIR / "lexical_index" / "lexical.sqlite3")))
+    HYBRID_VECTOR_WEIGHT: float = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+    HYBRID_LEXICAL_WEIGHT: float = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0"))
+    HYBRID_RRF_K: int = int(os.getenv("HYBRID_RRF_K", "60"))
+    BM25_K1: float = float(os.getenv("BM25_K1", "1.2"))
+    BM25_B: float = float(os.getenv("BM25_B", "0.75"))
+
+    # Vector compression
+    # EMBEDDING_DIMENSIONS > 0 stores (and queries with) only that many leading components of
+    # each embedding, renormalized, as the model's own `dimensions` parameter would return them.
+    # It is applied after the embedding cache, which keeps full vectors. With VECTOR_QUANTIZATION
+    # set, vector search scans int8 or binary codes of the stored vectors (a SQLite index next
+    # to the store) and re-scores the best top_k * QUANTIZED_RESCORE_FACTOR with the float
+    # vectors from Chroma. Quantization does not shrink the store: the float vectors stay in
+    # Chroma (and its HNSW index) for re-scoring and the codes are stored on top of them, so it
+    # adds disk (1 byte per dimension for int8, 1 bit for binary) in exchange for faster scans.
+    # Only EMBEDDING_DIMENSIONS reduces the disk and RAM of the store.
+    # Existing stores are converted by tools/reencode_vectors.py.
+    EMBEDDING_DIMENSIONS: int = int(os.getenv("EMBEDDING_DIMENSIONS", "0")) # 0: full model width
+    VECTOR_QUANTIZATION: str = os.getenv("VECTOR_QUANTIZATION", "none").lower() # none | int8 | binary
+    QUANTIZED_RESCORE_FACTOR: int = int(os.getenv("QUANTIZED_RESCORE_FACTOR", "4"))
+    QUANTIZED_INDEX_PATH: Path = Path(os.getenv("QUANTIZED_INDEX_PATH", str(BASE_DIR / "quantized_index" / "codes.sqlite3")))
+
+    # Reranking
+    # With RERANKER set (lexical, or cross-encoder for a local sentence-transformers model on CPU),
+    # retrieval fetches top_k * RERANK_OVERFETCH candidates, they are rescored against the
+    # question off the event loop in batches of RERANK_BATCH_SIZE, and the best top_k are
+    # packed into the prompt (fewer if RERANK_TOP_N is set below top_k). Candidates not
+    # scored within RERANK_BUDGET_MS keep their retrieval order behind the scored ones.
+    RERANKER: str = os.getenv("RERANKER", "lexical").lower() # none | lexical | cross-encoder
+    RERANK_MODEL_NAME: str = os.getenv("RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    RERANK_OVERFETCH: int = int(os.getenv("RERANK_OVERFETCH", "4"))
+    RERANK_TOP_N: int = int(os.getenv("RERANK_TOP_N", "0")) # 0: top_k
+    RERANK_BATCH_SIZE: int = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+    RERANK_BUDGET_MS: float = float(os.getenv("RERANK_BUDGET_MS", "150"))
+    RERANK_MIN_SCORE: float = float(os.getenv("RERANK_MIN_SCORE", "0.0"))
+
     # Text processing
-    TABLE_EXTRACTION_ROWS_PER_CHUNK: int = 10 # For chunking large tables
+    # Table chunks repeat the table's header row and hold as many rows as fit this many tokens
+    # (at most QA_TABLE_CHUNK_MAX_TOKENS, or they are truncated when packed into a prompt)
+    TABLE_CHUNK_MAX_TOKENS: int = int(os.getenv("TABLE_CHUNK_MAX_TOKENS", "800"))
+    # Sections span pages; a section longer than SECTION_CHUNK_MAX_TOKENS is split into chunks
+    # of about that size at paragraph/sentence/line breaks, each repeating the last
+    # SECTION_CHUNK_OVERLAP_TOKENS of the previous one
+    SECTION_CHUNK_MAX_TOKENS: int = int(os.getenv("SECTION_CHUNK_MAX_TOKENS", "800"))
+    SECTION_CHUNK_OVERLAP_TOKENS: int = int(os.getenv("SECTION_CHUNK_OVERLAP_TOKENS", "100"))
 
     # Logging (basic example, can be expanded)
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
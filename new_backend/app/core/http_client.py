@@ -0,0 +1,20 @@
+import httpx
+
+from .config import settings
+
+# Shared async HTTP client for OpenAI calls made from the application's event loop
+# (query embeddings and chat completions). An httpx.AsyncClient binds its connection
+# pool to the first event loop that uses it, so it must not be handed to clients used
+# on other loops, such as the background indexing loop in vectorstore_service.
+openai_async_http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=settings.OPENAI_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS
+    ),
+    timeout=httpx.Timeout(settings.OPENAI_HTTP_TIMEOUT_SECONDS)
+)
+
+
+async def aclose_http_clients() -> None:
+    """Closes pooled connections (called on application shutdown)."""
+    await openai_async_http_client.aclose()
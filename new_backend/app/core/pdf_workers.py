@@ -0,0 +1,232 @@
+"""
+Functions executed in the PDF processing process pool.
+
+They are kept in this lightweight module (no vector store, queue or API clients)
+so that spawned worker processes only import what they need. Every function takes
+plain arguments and returns plain, picklable data.
+"""
+import hashlib
+import json
+import logging
+import re
+from datetime import datetime
+from typing import Optional
+
+import pypdf
+from pypdf import PdfReader
+from pypdf.generic import IndirectObject
+
+from .config import settings
+from . import utils
+from .utils import read_tables_with_camelot, ocr_page
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Extractor versions key cached artifacts (see services/artifact_cache.py): anything that
+# changes an extractor's output must change its version, or stale results are reused
+PAGE_TEXT_EXTRACTOR = f"pages:pypdf-{pypdf.__version__}:rulings-{settings.TABLE_PREPASS_MIN_RULINGS}:v1"
+CAMELOT_EXTRACTOR = f"camelot:{getattr(utils.camelot, '__version__', 'none')}:lattice-40:v1"
+OCR_EXTRACTOR = f"ocr:{settings.OCR_DPI}dpi:v1"
+
+
+def init_worker(memory_limit_mb: int) -> None:
+    """
+    Process pool initializer: caps the worker's address space so a runaway page
+    (typically OCR of a large scanned image) fails with MemoryError in that worker
+    instead of driving the whole machine out of memory.
+    """
+    logging.basicConfig(level=settings.LOG_LEVEL)
+    if resource is None or memory_limit_mb <= 0:
+        return
+    limit_bytes = memory_limit_mb * 1024 * 1024
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+    except (ValueError, OSError) as e:
+        logger.warning(f"Could not set worker memory limit of {memory_limit_mb} MB: {e}")
+
+
+def get_page_count(file_path: str) -> int:
+    return len(PdfReader(file_path).pages)
+
+
+def _document_metadata(reader: PdfReader, file_path: str) -> dict:
+    """Document-level metadata normalized the way PyPDFLoader does it, so chunk metadata is unchanged."""
+    raw = {"producer": "PyPDF", "creator": "PyPDF", "creationdate": "", **(reader.metadata or {})}
+    metadata = {}
+    for key, value in raw.items():
+        key = key.lstrip("/").lower()
+        value = value if type(value) in (str, int) else str(value)
+        if key in ("creationdate", "moddate"):
+            try:
+                value = datetime.strptime(value.replace("'", ""), "D:%Y%m%d%H%M%S%z").isoformat("T")
+            except ValueError:
+                pass
+        elif isinstance(value, str):
+            value = value.strip()
+        metadata[key] = value
+    metadata["source"] = file_path
+    metadata["total_pages"] = len(reader.pages)
+    return metadata
+
+
+def _hash_resources(resources, digest, seen: set) -> None:
+    """Feeds the streams a page draws (images, forms and their own resources) into the digest."""
+    if resources is None:
+        return
+    xobjects = resources.get_object().get("/XObject")
+    if xobjects is None:
+        return
+    for name, reference in sorted(xobjects.get_object().items()):
+        if isinstance(reference, IndirectObject):
+            if reference.idnum in seen: # Shared or self-referencing forms are hashed once
+                continue
+            seen.add(reference.idnum)
+        xobject = reference.get_object()
+        digest.update(name.encode("utf-8"))
+        digest.update(xobject.get_data() if hasattr(xobject, "get_data") else repr(xobject).encode("utf-8"))
+        _hash_resources(xobject.get("/Resources"), digest, seen)
+
+
+def fingerprint_pages(file_path: str) -> dict:
+    """
+    Hashes every page (its content stream, page box and the images/forms it draws) and the
+    document-level metadata, without extracting any text. Pages with an unchanged hash
+    produce the same chunks, so re-uploads only need to process pages whose hash changed.
+    Returns {"page_hashes": [...], "document_hash": ..., "document_metadata": {...}}.
+    """
+    reader = PdfReader(file_path)
+    page_hashes = []
+    for page in reader.pages:
+        digest = hashlib.sha256()
+        contents = page.get_contents()
+        digest.update(contents.get_data() if contents is not None else b"")
+        digest.update(repr([float(v) for v in page.mediabox]).encode("utf-8"))
+        digest.update(str(page.get("/Rotate", 0)).encode("utf-8"))
+        _hash_resources(page.get("/Resources"), digest, set())
+        page_hashes.append(digest.hexdigest())
+    document_metadata = _document_metadata(reader, file_path)
+    stable_metadata = {k: v for k, v in document_metadata.items() if k != "source"} # The path is not part of the content
+    return {
+        "page_hashes": page_hashes,
+        "document_hash": hashlib.sha256(json.dumps(stable_metadata, sort_keys=True, default=str).encode("utf-8")).hexdigest(),
+        "document_metadata": document_metadata,
+    }
+
+
+# Path construction operators with their numeric operands: "x y w h re", "x y m" and "x y l"
+_NUMBER = rb"[-+]?(?:\d+\.?\d*|\.\d+)"
+_PATH_OPERATOR_RE = re.compile(
+    rb"(?<![\w.])(%s)\s+(%s)\s+(?:(%s)\s+(%s)\s+(re)|([ml]))(?![\w*'\"])" % ((_NUMBER,) * 4)
+)
+_TEXT_OPERATOR_RE = re.compile(rb"(?<![\w*])(?:Tj|TJ)(?!\w)")
+_RULING_MAX_THICKNESS = 2.0 # A rectangle thinner than this (in points) is drawn as a line
+_RULING_MIN_LENGTH = 10.0
+
+
+def _ruling_stats(resources, contents: bytes, stats: dict, seen: set) -> None:
+    """Counts horizontal/vertical rulings, text and images drawn by a content stream and the forms it uses."""
+    x = y = 0.0
+    for match in _PATH_OPERATOR_RE.finditer(contents):
+        a, b = float(match.group(1)), float(match.group(2))
+        if match.group(5): # Rectangle: a thin one is a ruling, a box counts once each way (a frame alone is no table, cells are)
+            width, height = abs(float(match.group(3))), abs(float(match.group(4)))
+            if min(width, height) <= _RULING_MAX_THICKNESS:
+                if max(width, height) >= _RULING_MIN_LENGTH:
+                    stats["horizontal" if width > height else "vertical"] += 1
+            elif min(width, height) >= _RULING_MIN_LENGTH:
+                stats["horizontal"] += 1
+                stats["vertical"] += 1
+        elif match.group(6) == b"l": # Line segment from the current point
+            dx, dy = abs(a - x), abs(b - y)
+            if dy <= _RULING_MAX_THICKNESS and dx >= _RULING_MIN_LENGTH:
+                stats["horizontal"] += 1
+            elif dx <= _RULING_MAX_THICKNESS and dy >= _RULING_MIN_LENGTH:
+                stats["vertical"] += 1
+            x, y = a, b
+        else:
+            x, y = a, b
+    stats["text"] = stats["text"] or _TEXT_OPERATOR_RE.search(contents) is not None
+
+    xobjects = resources.get_object().get("/XObject") if resources is not None else None
+    if xobjects is None:
+        return
+    for reference in xobjects.get_object().values():
+        if isinstance(reference, IndirectObject):
+            if reference.idnum in seen:
+                continue
+            seen.add(reference.idnum)
+        xobject = reference.get_object()
+        if xobject.get("/Subtype") == "/Image":
+            stats["image"] = True
+        elif xobject.get("/Subtype") == "/Form":
+            _ruling_stats(xobject.get("/Resources"), xobject.get_data(), stats, seen)
+
+
+def is_table_candidate(page, min_rulings: int = settings.TABLE_PREPASS_MIN_RULINGS) -> bool:
+    """
+    Cheap pre-pass for Camelot: lattice mode only finds tables drawn with ruling lines, so a
+    page is a candidate if its content stream (or a form it draws) contains at least
+    `min_rulings` horizontal and vertical line segments or cell rectangles. Pages that only
+    draw images (scans) are candidates as well, since their lines are not in the stream.
+    """
+    stats = {"horizontal": 0, "vertical": 0, "text": False, "image": False}
+    contents = page.get_contents()
+    _ruling_stats(page.get("/Resources"), contents.get_data() if contents is not None else b"", stats, set())
+    return (stats["horizontal"] >= min_rulings and stats["vertical"] >= min_rulings) or (stats["image"] and not stats["text"])
+
+
+def extract_page_range(file_path: str, start: int, end: int) -> list[dict]:
+    """
+    Extracts the text of pages [start, end) (0-based). Returns one dict per page with the
+    same page metadata PyPDFLoader produces, and whether the page may hold a table (see
+    is_table_candidate). Sections are split later, over the text of consecutive pages.
+    """
+    reader = PdfReader(file_path)
+    document_metadata = _document_metadata(reader, file_path)
+    page_labels = reader.page_labels
+    pages = []
+    for page_number in range(start, min(end, len(reader.pages))):
+        page = reader.pages[page_number]
+        text = page.extract_text().strip()
+        pages.append({
+            "metadata": {
+                **document_metadata,
+                "page": page_number,
+                "page_label": page_labels[page_number],
+            },
+            "text": text,
+            "table_candidate": is_table_candidate(page),
+        })
+    return pages
+
+
+def extract_camelot_tables_pages(file_path: str, pages: list[int]) -> Optional[dict[int, list[dict]]]:
+    """
+    Raw Camelot tables for the given (0-based, sorted) pages, as {page: [table, ...]} with an
+    entry for every page (empty if it has no table). Returns None if Camelot failed.
+    """
+    try:
+        raw_tables = read_tables_with_camelot(file_path, pages=",".join(str(page + 1) for page in pages))
+    except Exception as e:
+        logger.warning(f"Camelot table extraction failed for {file_path} (pages {pages}): {e}.")
+        return None
+    tables_by_page: dict[int, list[dict]] = {page: [] for page in pages}
+    for raw_table in raw_tables:
+        tables_by_page.setdefault(int(raw_table["page"]) - 1, []).append(raw_table)
+    return tables_by_page
+
+
+def ocr_pages(file_path: str, pages: list[int]) -> dict[int, str]:
+    """OCR text of the given (0-based) pages, rendered one at a time. Pages that fail or time out are left out."""
+    texts = {}
+    for page in pages:
+        try:
+            texts[page] = ocr_page(file_path, page + 1)
+        except Exception as e:
+            logger.warning(f"OCR of page {page + 1} of {file_path} failed or timed out: {e}")
+    return texts
@@ -1,5 +1,8 @@
+import bisect
+import math
 import re
-import pandas as pd # For chunk_table_rows, assuming pandas is available via camelot or other deps
+from typing import NamedTuple, Optional
+import numpy as np
 import logging
 
 # Import for table extraction - these have system dependencies
@@ -10,10 +13,10 @@ except ImportError:
     camelot = None
 
 try:
-    from pdf2image import convert_from_path
+    from pdf2image import convert_from_path, pdfinfo_from_path
 except ImportError:
     logging.warning("pdf2image not installed or poppler not found. OCR fallback for table extraction will not work.")
-    convert_from_path = None
+    convert_from_path = pdfinfo_from_path = None
 
 try:
     import pytesseract
@@ -21,92 +24,459 @@ except ImportError:
     logging.warning("pytesseract not installed or tesseract OCR engine not found. OCR fallback for table extraction will not work.")
     pytesseract = None
 
-from .config import settings # To use TABLE_EXTRACTION_ROWS_PER_CHUNK
+try:
+    import tiktoken
+except ImportError:
+    logging.warning("tiktoken not installed. Token counts will be estimated from character length.")
+    tiktoken = None
+
+from .config import settings # To use TABLE_CHUNK_MAX_TOKENS
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=settings.LOG_LEVEL)
 
+_token_encodings: dict = {}
 
-def split_by_sections(text: str) -> list[tuple[str, str]]:
+
+def _get_token_encoding(model_name: str):
+    """Returns (and memoizes) the tiktoken encoding for a model, or None if unavailable."""
+    if tiktoken is None:
+        return None
+    if model_name not in _token_encodings:
+        try:
+            _token_encodings[model_name] = tiktoken.encoding_for_model(model_name)
+        except Exception:
+            # Unknown model names (or no network access to fetch the BPE files)
+            try:
+                _token_encodings[model_name] = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.warning(f"Could not load a tiktoken encoding for '{model_name}': {e}")
+                _token_encodings[model_name] = None
+    return _token_encodings[model_name]
+
+
+def estimate_token_count(text: str, model_name: str = settings.EMBEDDING_MODEL_NAME) -> int:
     """
-    Splits text into sections based on a predefined list of keywords.
+    Counts the tokens of a text with the model's tokenizer.
+    Falls back to a ~4 characters per token estimate if tiktoken is not available.
     """
-    section_keywords = [
-        "Title", "Subtitle", "Abstract", "Summary", "Executive Summary", "Keywords",
-        "Preface", "Foreword", "Introduction", "Background", "Context", "Problem Statement",
-        "Objectives", "Scope", "Related Work", "Literature Review", "Theoretical Framework",
-        "Hypothesis", "Assumptions", "Methodology", "Methods", "Data Collection",
-        "Data Sources", "Experimental Setup", "Materials and Methods", "Evaluation",
-        "Validation", "Analysis", "Results", "Findings", "Observations", "Discussion",
-        "Interpretation", "Implications", "Limitations", "Recommendations", "Future Work",
-        "Use Cases", "Conclusion", "Summary and Conclusion", "Closing Remarks",
-        "Acknowledgments", "Funding", "Author Contributions", "CRediT Taxonomy",
-        "Conflict of Interest", "Ethical Approval", "References", "Bibliography",
-        "Works Cited", "Appendices", "Appendix", "Supplementary Materials",
-        "Supporting Information", "Glossary", "Abbreviations", "Index"
-    ]
+    encoding = _get_token_encoding(model_name)
+    if encoding is None:
+        return max(1, len(text) // 4) if text else 0
+    return len(encoding.encode(text, disallowed_special=()))
 
-    # Regex to find section titles, potentially preceded by numbering like "1.", "1)", "I."
-    # It looks for keywords that are likely on their own line or with minimal surrounding text.
-    section_pattern = re.compile(
-        r"^\s*(\d{1,2}[\.\)]?\s*|\[\d{1,2}\]|Chapter \d{1,2}\s*[:\.\-]?\s*|Section \d{1,2}\s*[:\.\-]?\s*)?"
-        r"(" + "|".join(map(re.escape, section_keywords)) + r")"
-        r"\s*[:\.\-]?\s*$",
-        re.IGNORECASE | re.MULTILINE
-    )
 
-    # Find all matches for section headers to use as split points
-    matches = list(section_pattern.finditer(text))
+def estimate_token_counts(texts: list[str], model_name: str = settings.EMBEDDING_MODEL_NAME) -> np.ndarray:
+    """estimate_token_count for many texts at once (tiktoken encodes the batch on several threads)."""
+    encoding = _get_token_encoding(model_name)
+    if encoding is None:
+        lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+        return np.where(lengths > 0, np.maximum(1, lengths // 4), 0)
+    encoded = encoding.encode_batch(texts, disallowed_special=())
+    return np.fromiter((len(tokens) for tokens in encoded), dtype=np.int64, count=len(texts))
 
-    structured_sections = []
-    last_pos = 0
 
+def _additive_token_counts(texts: list[str], model_name: str) -> np.ndarray:
+    """
+    Token counts of text pieces that are summed up to size their concatenation: the
+    tokenizer's counts, or the ~4 characters per token estimate without rounding each piece.
+    """
+    if _get_token_encoding(model_name) is None:
+        return np.fromiter((len(text) for text in texts), dtype=np.float64, count=len(texts)) / 4
+    return estimate_token_counts(texts, model_name)
+
+
+def truncate_to_token_limit(text: str, max_tokens: int, model_name: str = settings.EMBEDDING_MODEL_NAME) -> str:
+    """Cuts a text down to at most `max_tokens` tokens (same fallback estimate as estimate_token_count)."""
+    encoding = _get_token_encoding(model_name)
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+SECTION_KEYWORDS = [
+    "Title", "Subtitle", "Abstract", "Summary", "Executive Summary", "Keywords",
+    "Preface", "Foreword", "Introduction", "Background", "Context", "Problem Statement",
+    "Objectives", "Scope", "Related Work", "Literature Review", "Theoretical Framework",
+    "Hypothesis", "Assumptions", "Methodology", "Methods", "Data Collection",
+    "Data Sources", "Experimental Setup", "Materials and Methods", "Evaluation",
+    "Validation", "Analysis", "Results", "Findings", "Observations", "Discussion",
+    "Interpretation", "Implications", "Limitations", "Recommendations", "Future Work",
+    "Use Cases", "Conclusion", "Summary and Conclusion", "Closing Remarks",
+    "Acknowledgments", "Funding", "Author Contributions", "CRediT Taxonomy",
+    "Conflict of Interest", "Ethical Approval", "References", "Bibliography",
+    "Works Cited", "Appendices", "Appendix", "Supplementary Materials",
+    "Supporting Information", "Glossary", "Abbreviations", "Index"
+]
+
+# Regex to find section titles, potentially preceded by numbering like "1.", "1)", "I."
+# It looks for keywords that are likely on their own line or with minimal surrounding text.
+# Compiled once; longer keywords come first so "Summary and Conclusion" wins over "Summary".
+_SECTION_HEADER_RE = re.compile(
+    r"^\s*(\d{1,2}[\.\)]?\s*|\[\d{1,2}\]|Chapter \d{1,2}\s*[:\.\-]?\s*|Section \d{1,2}\s*[:\.\-]?\s*)?"
+    r"(" + "|".join(map(re.escape, sorted(SECTION_KEYWORDS, key=len, reverse=True))) + r")"
+    r"\s*[:\.\-]?\s*$",
+    re.IGNORECASE | re.MULTILINE
+)
+
+
+class DocumentSection(NamedTuple):
+    title: str
+    text: str
+    page_start: int # Page of the header (or of the first text for untitled sections)
+    page_end: int # Page of the section's last text
+    page_offsets: list[tuple[int, int]] # (offset in text, page) where the text's first page and each following page start
+
+    def page_at(self, position: int) -> int:
+        """Page of the character at `position` in the section text."""
+        index = bisect.bisect_right([offset for offset, _ in self.page_offsets], position) - 1
+        return self.page_offsets[max(0, index)][1]
+
+
+def split_document_sections(pages: list[tuple[int, str]]) -> list[DocumentSection]:
+    """
+    Splits the text of consecutive pages, given as (page number, text), into sections in one
+    pass over the joined text, so a section that continues on the next page stays one
+    section. Text before the first header is a "Preamble"; text without any header is a
+    single "Content" section. Each section carries the page range it spans.
+    """
+    page_numbers = [page_number for page_number, _ in pages]
+    page_offsets = []
+    offset = 0
+    for _, text in pages:
+        page_offsets.append(offset)
+        offset += len(text) + 1 # Pages are joined with a newline
+    document = "\n".join(text for _, text in pages)
+
+    def page_at(position: int) -> int:
+        return page_numbers[bisect.bisect_right(page_offsets, position) - 1]
+
+    def make_section(title: str, header_pos: Optional[int], start: int, end: int) -> Optional[DocumentSection]:
+        raw = document[start:end]
+        text = raw.strip()
+        if not text: # Only add if there's content
+            return None
+        text_start = start + (len(raw) - len(raw.lstrip()))
+        text_end = start + len(raw.rstrip()) - 1
+        first = bisect.bisect_right(page_offsets, text_start)
+        last = bisect.bisect_right(page_offsets, text_end)
+        offsets = [(0, page_at(text_start))] + [(page_offsets[i] - text_start, page_numbers[i]) for i in range(first, last)]
+        return DocumentSection(title, text, page_at(text_start if header_pos is None else header_pos), page_at(text_end), offsets)
+
+    matches = list(_SECTION_HEADER_RE.finditer(document))
     if not matches: # If no sections found, treat the whole text as one section (e.g. "Content")
-        if text.strip():
-            return [("Content", text.strip())]
-        return []
-
-    # Add content before the first section, if any
-    first_match_start = matches[0].start()
-    if first_match_start > 0:
-        initial_content = text[:first_match_start].strip()
-        if initial_content:
-            structured_sections.append(("Preamble", initial_content)) # Or some generic title
+        section = make_section("Content", None, 0, len(document))
+        return [section] if section else []
 
+    sections = [make_section("Preamble", None, 0, matches[0].start())] # Content before the first section, if any
     for i, match in enumerate(matches):
-        section_title = match.group(2).strip() # The keyword itself
+        end_pos = matches[i + 1].start() if i + 1 < len(matches) else len(document)
+        sections.append(make_section(match.group(2).strip().title(), match.start(2), match.end(), end_pos))
+    return [section for section in sections if section is not None]
 
-        start_pos = match.end()
-        end_pos = matches[i+1].start() if i + 1 < len(matches) else len(text)
 
-        section_text = text[start_pos:end_pos].strip()
+def split_by_sections(text: str) -> list[tuple[str, str]]:
+    """
+    Splits text into sections based on a predefined list of keywords.
+    """
+    return [(section.title, section.text) for section in split_document_sections([(0, text)])]
+
+
+# Where a text may be cut into chunks: after sentence punctuation (optionally followed by a
+# closing quote or bracket) and whitespace, and at line breaks; blank lines end paragraphs
+_TEXT_UNIT_BREAK_RE = re.compile(r"[.!?][\"')\]]?\s+|\n\s*")
+_PARAGRAPH_BREAK, _SENTENCE_BREAK, _LINE_BREAK, _WORD_BREAK = 3, 2, 1, 0
+
+
+def _text_units(text: str) -> list[tuple[int, int, int]]:
+    """(start, end, rank of the break after it) for each sentence/line of a text; the last unit ends the text."""
+    units = []
+    start = len(text) - len(text.lstrip())
+    for match in _TEXT_UNIT_BREAK_RE.finditer(text, start):
+        separator = match.group()
+        if separator[0] == "\n":
+            end = match.start()
+            while end > start and text[end - 1] in " \t":
+                end -= 1
+        else:
+            end = match.start() + len(separator.rstrip())
+        if end > start:
+            if separator.count("\n") >= 2:
+                rank = _PARAGRAPH_BREAK
+            else:
+                rank = _LINE_BREAK if separator[0] == "\n" else _SENTENCE_BREAK
+            units.append((start, end, rank))
+        start = match.end()
+    end = len(text.rstrip())
+    if end > start:
+        units.append((start, end, _PARAGRAPH_BREAK))
+    return units
+
+
+def _split_long_unit(text: str, start: int, end: int, tokens: float, max_tokens: int) -> list[tuple[int, int, int]]:
+    """Cuts a unit longer than max_tokens (e.g. a sentence-less run of text) at spaces into pieces of about equal size."""
+    n_pieces = math.ceil(tokens / max_tokens)
+    target = -(-(end - start) // n_pieces)
+    pieces = []
+    while end - start > target:
+        cut = text.rfind(" ", start + target // 2, start + target)
+        cut = start + target if cut <= start else cut
+        pieces.append((start, cut, _WORD_BREAK))
+        start = cut + 1 if text[cut:cut + 1] == " " else cut
+    pieces.append((start, end, _WORD_BREAK))
+    return pieces
+
+
+def split_texts_by_tokens(
+    texts: list[str],
+    max_tokens: int,
+    overlap_tokens: int = 0,
+    model_name: str = settings.EMBEDDING_MODEL_NAME
+) -> list[list[tuple[int, int]]]:
+    """
+    Splits each text into chunks of at most about `max_tokens` tokens and returns the
+    (start, end) character spans of its chunks. Texts within the limit are one chunk.
+    Longer texts are cut between sentences and lines: a chunk ends at the strongest break
+    (paragraph, then sentence, then line) in the second half of its token window, and the
+    next chunk starts up to `overlap_tokens` earlier, on a unit boundary.
+
+    All texts are handled in one batch: their units are tokenized together, and the
+    packing works on token prefix sums, so the cost per chunk (not per unit) is a few
+    array lookups. Token counts are per unit, so a chunk may differ from its separately
+    counted size by a few tokens.
+    """
+    max_tokens = max(1, max_tokens)
+    overlap_tokens = min(max(0, overlap_tokens), max_tokens // 2)
+    spans: list[list[tuple[int, int]]] = [[] for _ in texts]
+    totals = estimate_token_counts(texts, model_name)
+    long_texts = [i for i, total in enumerate(totals) if total > max_tokens]
+    for i, total in enumerate(totals):
+        if 0 < total <= max_tokens:
+            spans[i] = [(0, len(texts[i]))]
+    if not long_texts:
+        return spans
+
+    units_per_text = [_text_units(texts[i]) for i in long_texts]
+    # A unit is counted with the separator that follows it, so the units of a chunk add up to its size
+    flat_units = [
+        texts[i][start:(units[k + 1][0] if k + 1 < len(units) else end)]
+        for i, units in zip(long_texts, units_per_text) for k, (start, end, _) in enumerate(units)
+    ]
+    flat_tokens = _additive_token_counts(flat_units, model_name)
+
+    position = 0
+    for i, units in zip(long_texts, units_per_text):
+        text = texts[i]
+        unit_tokens = flat_tokens[position:position + len(units)]
+        position += len(units)
+        if (unit_tokens > max_tokens).any():
+            split_units, split_tokens = [], []
+            for (start, end, rank), tokens in zip(units, unit_tokens):
+                if tokens <= max_tokens:
+                    split_units.append((start, end, rank))
+                    split_tokens.append(tokens)
+                    continue
+                pieces = _split_long_unit(text, start, end, tokens, max_tokens)
+                pieces[-1] = (pieces[-1][0], pieces[-1][1], rank)
+                split_units.extend(pieces)
+                split_tokens.extend(tokens * (piece_end - piece_start) / (end - start) for piece_start, piece_end, _ in pieces)
+            units, unit_tokens = split_units, np.asarray(split_tokens, dtype=np.float64)
+
+        starts = np.fromiter((start for start, _, _ in units), dtype=np.int64, count=len(units))
+        ends = np.fromiter((end for _, end, _ in units), dtype=np.int64, count=len(units))
+        ranks = np.fromiter((rank for _, _, rank in units), dtype=np.int64, count=len(units))
+        cumulative = np.concatenate(([0], np.cumsum(unit_tokens))) # cumulative[k]: tokens of units[:k]
+        n_units = len(units)
+        first = 0
+        while first < n_units:
+            # Units [first, last) fit the window; prefer the strongest break in its second half
+            last = max(first + 1, int(np.searchsorted(cumulative, cumulative[first] + max_tokens, side="right")) - 1)
+            if last < n_units:
+                half = max(first + 1, int(np.searchsorted(cumulative, cumulative[first] + max_tokens // 2, side="left")))
+                if half < last:
+                    window = ranks[half - 1:last][::-1] # Ending at unit k uses the break after unit k-1; latest first
+                    last = last - int(np.argmax(window))
+            spans[i].append((int(starts[first]), int(ends[last - 1])))
+            if last >= n_units:
+                break
+            following = int(np.searchsorted(cumulative, cumulative[last] - overlap_tokens, side="left"))
+            first = min(last, max(first + 1, following))
+    return spans
+
+
+def table_markdown_chunks(
+    rows: list[list],
+    max_tokens: int = settings.TABLE_CHUNK_MAX_TOKENS,
+    model_name: str = settings.EMBEDDING_MODEL_NAME
+) -> list[tuple[str, int, int]]:
+    """
+    Serializes a table, given as rows of cells with the header row first, into Markdown
+    chunks of at most about `max_tokens` tokens. Every chunk repeats the header row, so it
+    can be read on its own. Blank rows are dropped; a row longer than the limit is a chunk
+    by itself. Returns (markdown, first row, last row) per chunk, the non-blank rows
+    numbered from 1 after the header.
+
+    All rows are formatted in one pass and tokenized in one batch; chunks are cut on the
+    rows' token prefix sums instead of slicing a DataFrame per chunk.
+    """
+    rows = [row for row in rows if any(str(cell).strip() for cell in row)]
+    if not rows:
+        return []
+    n_columns = max(len(row) for row in rows)
+    lines = [
+        "| " + " | ".join([str(cell).replace("|", "\\|").replace("\n", " ").strip() for cell in row] + [""] * (n_columns - len(row))) + " |"
+        for row in rows
+    ]
+    header = lines[0] + "\n|" + "---|" * n_columns
+    body = lines[1:]
+    if not body:
+        return [(header, 0, 0)]
+
+    budget = max(1, max_tokens - estimate_token_count(header + "\n", model_name))
+    row_tokens = _additive_token_counts([line + "\n" for line in body], model_name)
+    cumulative = np.concatenate(([0], np.cumsum(row_tokens))) # cumulative[k]: tokens of body[:k]
+    chunks = []
+    first = 0
+    while first < len(body):
+        last = max(first + 1, int(np.searchsorted(cumulative, cumulative[first] + budget, side="right")) - 1)
+        chunks.append((header + "\n" + "\n".join(body[first:last]), first + 1, last))
+        first = last
+    return chunks
+
+
+def read_tables_with_camelot(file_path: str, pages: str = "all") -> list[dict]:
+    """
+    Raw Camelot (lattice mode) tables for the given pages, in Camelot's syntax (e.g. "all",
+    "1,3" or "4-8"). Returns one {"page", "order", "rows"} dict per table (page as reported
+    by Camelot, order on that page, cell rows as lists of strings). Raises on failure.
+    """
+    tables = camelot.read_pdf(file_path, pages=pages, strip_text='\n', line_scale=40)
+    raw_tables = []
+    tables_seen_on_page: dict = {}
+    for table in tables:
+        order_on_page = tables_seen_on_page.get(table.page, 0)
+        tables_seen_on_page[table.page] = order_on_page + 1
+        raw_tables.append({"page": table.page, "order": order_on_page, "rows": table.df.values.tolist()})
+    return raw_tables
+
+
+def camelot_table_chunks(raw_tables: list[dict], original_filename: str) -> list[dict]:
+    """Chunks raw Camelot tables (see read_tables_with_camelot) into table segments with their metadata."""
+    table_data_for_docs = []
+    for raw_table in raw_tables:
+        chunks = table_markdown_chunks(raw_table["rows"]) # Uses the chunk size from settings
+        if not chunks:
+            logger.info(f"Table {raw_table['order']} on page {raw_table['page']} in {original_filename} from Camelot is empty, skipping.")
+            continue
+
+        for j, (chunk_content, row_start, row_end) in enumerate(chunks):
+            table_data_for_docs.append({
+                "content": chunk_content,
+                "metadata": {
+                    "source_type": "table_camelot",
+                    "original_source": original_filename, # Keep original filename
+                    "table_page": int(raw_table["page"]), # Camelot reports pages as strings
+                    "table_order_on_page": raw_table["order"],
+                    "table_chunk_id": j,
+                    "table_row_start": row_start,
+                    "table_row_end": row_end
+                }
+            })
+    return table_data_for_docs
 
-        if section_text: # Only add if there's content
-            structured_sections.append((section_title.title(), section_text))
 
-        last_pos = end_pos
+def extract_tables_with_camelot(file_path: str, original_filename: str, pages: str = "all") -> list[dict]:
+    """
+    Extract tables from the given pages of a PDF using Camelot (lattice mode).
+    `pages` uses Camelot's syntax, e.g. "all", "1,3" or "4-8".
+    Chunks long tables into smaller pieces.
+    Returns a list of dictionaries, each containing table content and metadata.
+    """
+    if not camelot:
+        logger.info("Camelot not available. Skipping Camelot-based table extraction.")
+        return []
 
-    return structured_sections
+    try:
+        logger.info(f"Attempting table extraction with Camelot for {original_filename} (pages {pages})...")
+        raw_tables = read_tables_with_camelot(file_path, pages)
+        logger.info(f"Camelot found {len(raw_tables)} table(s) in {original_filename} (pages {pages}).")
+        return camelot_table_chunks(raw_tables, original_filename)
+    except Exception as e:
+        logger.warning(f"Camelot table extraction failed for {original_filename} (pages {pages}): {e}.")
+        return []
 
 
-def chunk_table_rows(df: pd.DataFrame, rows_per_chunk: int = settings.TABLE_EXTRACTION_ROWS_PER_CHUNK) -> list[str]:
+def ocr_page(file_path: str, page_number: int, dpi: int = settings.OCR_DPI, timeout_seconds: float = settings.OCR_PAGE_TIMEOUT_SECONDS) -> str:
     """
-    Split a DataFrame into chunks of N rows and convert each to Markdown.
+    Rasterizes one page (1-based) at `dpi` in grayscale and OCRs it. Only this page's image
+    is ever in memory. Rendering and OCR each run as a subprocess that is killed after
+    `timeout_seconds` (raising RuntimeError).
     """
-    chunks = []
-    if df.empty:
-        return chunks
-    num_chunks = (len(df) + rows_per_chunk - 1) // rows_per_chunk
-    for i in range(num_chunks):
-        chunk_df = df.iloc[i*rows_per_chunk:(i+1)*rows_per_chunk]
+    images = convert_from_path(file_path, dpi=dpi, first_page=page_number, last_page=page_number, grayscale=True, timeout=timeout_seconds)
+    try:
+        return pytesseract.image_to_string(images[0], timeout=timeout_seconds) if images else ""
+    finally:
+        for image in images:
+            image.close()
+
+
+def ocr_table_segment(text: str, original_filename: str, page_number: int) -> Optional[dict]:
+    """Returns the OCR text of a (1-based) page as a table segment if it looks table-like, else None."""
+    # TODO: Improve OCR table detection. This is very basic.
+    # Consider using image processing to identify table regions before OCR.
+    # For now, it OCRs the whole page and hopes for structured text.
+    # Basic check for table-like structures (pipe, plus, multiple hyphens)
+    if not re.search(r"(\|.*\|)|(\+.*\+)|(-{3,})", text):
+        return None
+    # This is a very naive way to treat OCR'd text as a table.
+    # Ideally, this text would be further processed to be structured or chunked.
+    # For now, adding the whole OCR'd page if it looks like it might contain a table.
+    return {
+        "content": text.strip(),
+        "metadata": {
+            "source_type": "table_ocr",
+            "original_source": original_filename,
+            "table_page": page_number,
+        }
+    }
+
+
+def extract_tables_with_ocr(file_path: str, original_filename: str, pages: Optional[list[int]] = None) -> list[dict]:
+    """
+    OCR-based table extraction for the given 1-based pages of a PDF (all pages if None).
+    Pages are rendered and OCR'd one at a time; a page that fails or times out is skipped.
+    Pages whose OCR text looks table-like are returned whole as table segments.
+    """
+    table_data_for_docs = []
+
+    if not (convert_from_path and pytesseract):
+        logger.info("OCR tools (pdf2image/pytesseract) not available. Skipping OCR-based table extraction.")
+        return table_data_for_docs
+
+    try:
+        if pages is None:
+            pages = list(range(1, pdfinfo_from_path(file_path)["Pages"] + 1))
+    except Exception as ocr_e:
+        logger.error(f"OCR-based table extraction failed for {original_filename}: {ocr_e}")
+        return table_data_for_docs
+
+    logger.info(f"Attempting OCR-based table extraction for {original_filename} ({len(pages)} page(s)).")
+    for page_number in pages:
         try:
-            md_chunk = chunk_df.to_markdown(index=False)
-            chunks.append(md_chunk)
-        except Exception as e:
-            logger.error(f"Error converting DataFrame chunk to Markdown: {e}")
-            # Fallback: convert to string or skip
-            chunks.append(str(chunk_df))
-    return chunks
+            text = ocr_page(file_path, page_number)
+        except Exception as ocr_e:
+            logger.warning(f"OCR of page {page_number} of {original_filename} failed or timed out: {ocr_e}")
+            continue
+        segment = ocr_table_segment(text, original_filename, page_number)
+        if segment is not None:
+            table_data_for_docs.append(segment)
+    if table_data_for_docs:
+        logger.info(f"Extracted {len(table_data_for_docs)} potential table segments using OCR for {original_filename}.")
+
+    return table_data_for_docs
 
 
 def extract_tables_from_pdf(file_path: str, original_filename: str) -> list[dict]:
@@ -115,79 +485,16 @@ def extract_tables_from_pdf(file_path: str, original_filename: str) -> list[dict
     Chunks long tables into smaller pieces.
     Returns a list of dictionaries, each containing table content and metadata.
     """
-    table_data_for_docs = []
-
     # Attempt 1: Camelot
-    if camelot:
-        try:
-            logger.info(f"Attempting table extraction with Camelot for {original_filename}...")
-            tables = camelot.read_pdf(file_path, pages='all', strip_text='\n', line_scale=40)
-            logger.info(f"Camelot found {len(tables)} table(s) in {original_filename}.")
-
-            if len(tables) > 0:
-                for i, table in enumerate(tables):
-                    df = table.df
-                    if df.empty:
-                        logger.info(f"Table {i} in {original_filename} from Camelot is empty, skipping.")
-                        continue
-
-                    chunks = chunk_table_rows(df) # Uses chunk size from settings
-                    for j, chunk_content in enumerate(chunks):
-                        table_data_for_docs.append({
-                            "content": chunk_content,
-                            "metadata": {
-                                "source_type": "table_camelot",
-                                "original_source": original_filename, # Keep original filename
-                                "table_page": table.page,
-                                "table_order_on_page": i,
-                                "table_chunk_id": j
-                            }
-                        })
-                # If Camelot found tables, we might not need OCR unless specifically desired
-                # For now, if Camelot works, we return its results.
-                if table_data_for_docs:
-                    logger.info(f"Successfully extracted and chunked {len(table_data_for_docs)} table segments using Camelot for {original_filename}.")
-                    return table_data_for_docs
-            else: # Camelot ran but found no tables
-                 logger.info(f"Camelot ran but found no tables in {original_filename}. Considering OCR fallback.")
-
-        except Exception as e:
-            logger.warning(f"Camelot table extraction failed for {original_filename}: {e}. Attempting OCR fallback if configured.")
-    else:
-        logger.info("Camelot not available. Skipping Camelot-based table extraction.")
+    table_data_for_docs = extract_tables_with_camelot(file_path, original_filename)
+    if table_data_for_docs:
+        # If Camelot found tables, we might not need OCR unless specifically desired
+        logger.info(f"Successfully extracted and chunked {len(table_data_for_docs)} table segments using Camelot for {original_filename}.")
+        return table_data_for_docs
 
     # Attempt 2: OCR Fallback (if pdf2image and pytesseract are available)
-    if convert_from_path and pytesseract:
-        logger.info(f"Attempting OCR-based table extraction for {original_filename} as Camelot found nothing or failed.")
-        try:
-            images = convert_from_path(file_path)
-            for i, image in enumerate(images):
-                # TODO: Improve OCR table detection. This is very basic.
-                # Consider using image processing to identify table regions before OCR.
-                # For now, it OCRs the whole page and hopes for structured text.
-                text = pytesseract.image_to_string(image)
-                # Basic check for table-like structures (pipe, plus, multiple hyphens)
-                if re.search(r"(\|.*\|)|(\+.*\+)|(-{3,})", text):
-                    # This is a very naive way to treat OCR'd text as a table.
-                    # Ideally, this text would be further processed to be structured or chunked.
-                    # For now, adding the whole OCR'd page if it looks like it might contain a table.
-                    table_data_for_docs.append({
-                        "content": text.strip(),
-                        "metadata": {
-                            "source_type": "table_ocr",
-                            "original_source": original_filename,
-                            "table_page": i + 1,
-                        }
-                    })
-            if table_data_for_docs:
-                 logger.info(f"Extracted {len(table_data_for_docs)} potential table segments using OCR for {original_filename}.")
-
-        except Exception as ocr_e:
-            logger.error(f"OCR-based table extraction failed for {original_filename}: {ocr_e}")
-    else:
-        logger.info("OCR tools (pdf2image/pytesseract) not available. Skipping OCR-based table extraction.")
-
-    return table_data_for_docs
+    logger.info(f"Camelot found no tables in {original_filename} or failed. Considering OCR fallback.")
+    return extract_tables_with_ocr(file_path, original_filename)
 
 
 if __name__ == '__main__':
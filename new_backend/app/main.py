@@ -4,8 +4,10 @@ from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 from .core.config import settings # For log level and CORS origins
+from .core.http_client import aclose_http_clients
 from .api.endpoints import documents_endpoint, query_endpoint
-from .models.schemas import HealthCheck # For health check response model
+from .models.schemas import HealthCheck, VectorStoreCacheStats, EmbeddingStats, AnswerCacheStats # For health check response models
+from .services import vectorstore_service, embedding_pipeline, job_queue, processing_service, answer_cache
 
 # Configure logging   log 2
 logging.basicConfig(level=settings.LOG_LEVEL.upper())
@@ -42,6 +44,17 @@ app.add_middleware(
 
 logger.info("Mounted query endpoint")
 
+@app.on_event("startup")
+async def start_processing_workers():
+    # Background workers serving the /process/ job queue (re-queues jobs interrupted by a restart)
+    job_queue.start_workers(processing_service.run_processing_job)
+
+@app.on_event("shutdown")
+async def stop_processing_workers():
+    job_queue.stop_workers()
+    processing_service.shutdown_process_pool()
+    await aclose_http_clients()
+
 # Include API routers
 app.include_router(documents_endpoint.router, prefix="/api/v2/documents", tags=["Documents"])
 app.include_router(query_endpoint.router, prefix="/api/v2/query", tags=["Query"])
@@ -55,6 +68,24 @@ async def health_check():
     # This can be expanded to check database connections, etc.
     return HealthCheck(status="OK", message="API is healthy and running.")
 
+@app.get("/health/vectorstore-cache", response_model=VectorStoreCacheStats, tags=["Health Check"])
+async def vectorstore_cache_stats():
+    # Hit rate and open-handle count of the per-user Chroma handle registry.
+    return VectorStoreCacheStats(**vectorstore_service.get_vectorstore_cache_stats())
+
+@app.get("/health/embeddings", response_model=EmbeddingStats, tags=["Health Check"])
+async def embedding_stats():
+    # Cumulative embedding cache hit ratio and embedding pipeline throughput (batches/s, tokens/s).
+    return EmbeddingStats(
+        cache=vectorstore_service.get_embedding_cache_stats(),
+        pipeline=embedding_pipeline.get_pipeline_metrics()
+    )
+
+@app.get("/health/answer-cache", response_model=AnswerCacheStats, tags=["Health Check"])
+async def answer_cache_stats():
+    # Hit/miss/bypass counters of the semantic answer cache.
+    return AnswerCacheStats(**answer_cache.get_answer_cache_stats())
+
 for route in app.routes:
     print(route.path, route.methods)
 
@@ -64,5 +95,8 @@ if __name__ == "__main__":
     # Example: gunicorn new_backend.app.main:app -w 4 -k uvicorn.workers.UvicornWorker -b 0.0.0.0:8000
     logger.info(f"Starting Uvicorn development server on http://0.0.0.0:8000")
     logger.info(f"Uploaded files will be stored in: {settings.UPLOADED_FILES_DIR}")
-    logger.info(f"ChromaDB vector stores will be persisted in: {settings.CHROMA_STORE_DIR}")
+    if settings.VECTORSTORE_MODE == "shared":
+        logger.info(f"ChromaDB vector stores will be persisted in: {settings.SHARED_CHROMA_STORE_DIR} ({settings.VECTORSTORE_SHARDS} shared collection(s))")
+    else:
+        logger.info(f"ChromaDB vector stores will be persisted in: {settings.CHROMA_STORE_DIR}")
     uvicorn.run(app, host="0.0.0.0", port=8000, log_level=settings.LOG_LEVEL.lower())
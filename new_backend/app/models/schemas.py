@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Literal, Optional, Dict, Any
 
 # --- Upload Endpoint (now for Staging) ---
 class StagedUploadResponse(BaseModel):
@@ -7,6 +7,31 @@ class StagedUploadResponse(BaseModel):
     message: str
     user_id: str
     staged_path: str # Path where the file is staged on the server
+    content_hash: Optional[str] = None # sha256 of the uploaded content
+    size_bytes: Optional[int] = None
+    deduplicated: bool = False # True if the same content was already stored (no extra space used)
+    already_indexed_as: Optional[str] = None # Set if the user already indexed this content (under this or another filename)
+
+# --- Resumable Upload Sessions ---
+class UploadSessionCreateRequest(BaseModel):
+    user_id: str = Field(..., description="The ID of the user uploading the file.")
+    filename: str = Field(..., description="Name the file is staged under once finalized.")
+    size_bytes: int = Field(..., gt=0, description="Total size of the file.")
+    chunk_size: Optional[int] = Field(None, gt=0, description="Requested chunk size; the server may clamp it.")
+
+class UploadSessionResponse(BaseModel):
+    session_id: str
+    user_id: str
+    filename: str
+    size_bytes: int
+    chunk_size: int # Every chunk but the last is exactly this long and starts at index * chunk_size
+    chunk_count: int
+    received_chunks: List[int]
+    missing_chunks: List[int] # What is left to send when resuming
+    expires_at: float # Unix time; extended by every received chunk
+
+class UploadFinalizeRequest(BaseModel):
+    sha256: str = Field(..., description="sha256 (hex) of the whole file, checked against the assembled upload.")
 
 # --- Process Endpoint ---
 class ProcessRequest(BaseModel):
@@ -15,17 +40,61 @@ class ProcessRequest(BaseModel):
 
 class FileProcessStatus(BaseModel):
     filename: str
-    status: str # e.g., "processed_successfully", "file_not_found", "processing_error"
+    status: str # e.g., "queued", "already_indexed", "processed_successfully", "file_not_found", "processing_error"
     message: Optional[str] = None
+    job_id: Optional[str] = None # Background job processing this file, see /process/jobs/{job_id}
     total_chunks_processed: Optional[int] = None
     table_chunks_extracted: Optional[int] = None
     text_sections_extracted: Optional[int] = None
+    embedding_cache_hits: Optional[int] = None
+    embedding_cache_misses: Optional[int] = None
+    embedding_cache_hit_ratio: Optional[float] = None
+    embedding_tokens_saved: Optional[int] = None # Tokens served from the embedding cache instead of the API
+    embedding_batches: Optional[int] = None
+    embedding_batches_per_second: Optional[float] = None
+    embedding_tokens_per_second: Optional[float] = None
+    pages_total: Optional[int] = None
+    pages_reprocessed: Optional[int] = None # Pages parsed and embedded by this run (only changed pages on a re-upload)
+    chunks_reused: Optional[int] = None # Chunks of unchanged pages kept from the previous version
+    stale_chunks_deleted: Optional[int] = None # Chunks of a previous version of the file that were removed
 
 class ProcessResponse(BaseModel):
     user_id: str
     overall_message: str
     files_status: List[FileProcessStatus]
 
+class JobStageProgress(BaseModel):
+    status: str # "pending", "running" or "done"
+    detail: Optional[str] = None # e.g. "120/400 chunk(s)"
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    user_id: str
+    filename: str
+    status: str # "queued", "running", "completed" or "failed"
+    current_stage: Optional[str] = None
+    stages: Dict[str, JobStageProgress] # parse, sections, tables, embed, persist
+    attempts: int
+    max_attempts: int
+    error: Optional[str] = None # Error of the last failed attempt
+    result: Optional[FileProcessStatus] = None # Set once the job has completed
+    created_at: float
+    updated_at: float
+
+
+# --- Indexed Files Endpoint ---
+class IndexedFile(BaseModel):
+    filename: str
+    content_hash: Optional[str] = None # sha256 of the file (None for files adopted from an older index without one)
+    chunk_count: int
+    text_sections: int
+    table_chunks: int
+    indexed_at: float
+
+class IndexedFilesResponse(BaseModel):
+    user_id: str
+    files: List[IndexedFile]
+
 
 # --- Delete Endpoint ---
 class DeleteRequest(BaseModel):
@@ -43,14 +112,34 @@ class DeleteResponse(BaseModel):
     files_status: List[FileDeleteStatus]
 
 # --- Query Endpoint ---
+class PageRange(BaseModel):
+    start: int = Field(..., ge=1, description="First page, 1-based (as numbered in a PDF viewer).")
+    end: Optional[int] = Field(None, ge=1, description="Last page, inclusive (defaults to start).")
+
+    @model_validator(mode="after")
+    def check_order(self) -> "PageRange":
+        if self.end is not None and self.end < self.start:
+            raise ValueError("end must not be before start")
+        return self
+
+class QueryFilters(BaseModel):
+    """Narrows the search; a chunk must match every given field (and any of its values)."""
+    filenames: Optional[List[str]] = Field(None, description="Only search these indexed files.")
+    content_types: Optional[List[Literal["text_section", "table_chunk"]]] = Field(None, description="Only search text sections or table chunks.")
+    page_ranges: Optional[List[PageRange]] = Field(None, description="Only search chunks overlapping one of these page ranges.")
+    section_titles: Optional[List[str]] = Field(None, description="Only search sections with one of these titles (exact match).")
+
 class QueryRequest(BaseModel):
     user_id: str = Field(..., description="The ID of the user making the query.")
     question: str = Field(..., description="The question to ask the documents.")
-    top_k: int = Field(default=5, gt=0, le=20, description="Number of relevant document chunks to retrieve for context.") # Default k from user code was 15, but making it configurable here.
+    top_k: int = Field(default=5, gt=0, le=20, description="Maximum number of document chunks used as context (near-duplicates and low-relevance chunks are skipped, and the context is capped at QA_CONTEXT_MAX_TOKENS).")
+    bypass_cache: bool = Field(default=False, description="Skip the answer cache and generate a fresh answer (which then replaces the cached one).")
+    filters: Optional[QueryFilters] = Field(default=None, description="Metadata filters applied inside the vector and lexical search.")
 
 class SourceDocument(BaseModel):
     filename: str
     page: Optional[int] = None
+    page_end: Optional[int] = None # Set when the chunk spans pages (from page to page_end)
     content_type: Optional[str] = None # e.g., "text_section", "table_chunk"
     section_title: Optional[str] = None
     table_page: Optional[int] = None # Page number if it's a table from Camelot/OCR
@@ -63,8 +152,36 @@ class QueryResponse(BaseModel):
     answer: str
     sources: List[SourceDocument]
     user_id: str
+    from_cache: bool = False # True if the answer was served from the answer cache
+    timings_ms: Dict[str, float] = Field(default_factory=dict, description="Duration of each answering stage: retrieve, rerank, format, generate, total.")
+    prompt_tokens: int = Field(default=0, description="Estimated tokens sent to the LLM (0 when the answer came from the cache).")
+    prompt_tokens_saved: int = Field(default=0, description="Estimated context tokens kept out of the prompt by reranking, compared with packing as many chunks in retrieval order.")
 
 # --- General ---
 class HealthCheck(BaseModel):
     status: str = "OK"
     message: str = "API is healthy"
+
+class EmbeddingStats(BaseModel):
+    cache: Optional[Dict[str, Any]] = None # None if the embedding cache is disabled
+    pipeline: Dict[str, Any]
+
+class AnswerCacheStats(BaseModel):
+    enabled: bool
+    entries: Optional[int] = None
+    users: Optional[int] = None
+    hits: Optional[int] = None
+    misses: Optional[int] = None
+    hit_rate: Optional[float] = None
+    bypassed: Optional[int] = None
+    invalidations: Optional[int] = None
+    similarity_threshold: Optional[float] = None
+
+class VectorStoreCacheStats(BaseModel):
+    open_handles: int
+    max_handles: int
+    hits: int
+    misses: int
+    hit_rate: float
+    evictions: int
+    invalidations: int
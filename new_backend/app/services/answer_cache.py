@@ -0,0 +1,187 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..core.config import settings # Relative import from core
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=settings.LOG_LEVEL)
+
+
+def context_fingerprint(chunk_ids: List[str]) -> str:
+    """Identifies the exact context an answer was generated from (the retrieved chunks, in order)."""
+    return hashlib.sha256("\x00".join(chunk_ids).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    question_vector: np.ndarray # Unit length
+    fingerprint: str
+    answer: str
+    sources: List[Dict]
+    created_at: float
+
+
+class AnswerCache:
+    """
+    Per-user, in-memory cache of generated answers.
+
+    An entry is reused when a new question's embedding is at least `similarity_threshold`
+    (cosine) from a cached question AND retrieval returned exactly the same chunks, so
+    the LLM would have seen the same context. A user's entries are dropped whenever their
+    corpus changes (see vectorstore_service); entries also expire after `ttl_seconds`,
+    and each user keeps at most `max_entries_per_user` (least recently used evicted).
+    """
+
+    def __init__(self, similarity_threshold: float, max_entries_per_user: int, ttl_seconds: float):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries_per_user = max(1, max_entries_per_user)
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, "OrderedDict[int, CachedAnswer]"] = {}
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def lookup(self, user_id: str, question_vector: List[float], chunk_ids: List[str]) -> Optional[CachedAnswer]:
+        fingerprint = context_fingerprint(chunk_ids)
+        query = self._normalize(question_vector)
+        now = time.time()
+        with self._lock:
+            entries = self._entries.get(user_id)
+            if entries:
+                for key in [k for k, e in entries.items() if now - e.created_at > self.ttl_seconds]:
+                    del entries[key]
+                candidates = [(k, e) for k, e in entries.items() if e.fingerprint == fingerprint]
+                if candidates:
+                    similarities = np.stack([e.question_vector for _, e in candidates]) @ query
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.similarity_threshold:
+                        key, entry = candidates[best]
+                        entries.move_to_end(key)
+                        self.hits += 1
+                        logger.debug(f"Answer cache hit for user {user_id} (similarity {similarities[best]:.4f}).")
+                        return entry
+            self.misses += 1
+            return None
+
+    def store(self, user_id: str, question: str, question_vector: List[float], chunk_ids: List[str], answer: str, sources: List[Dict]) -> None:
+        entry = CachedAnswer(
+            question=question,
+            question_vector=self._normalize(question_vector),
+            fingerprint=context_fingerprint(chunk_ids),
+            answer=answer,
+            sources=sources,
+            created_at=time.time()
+        )
+        with self._lock:
+            entries = self._entries.setdefault(user_id, OrderedDict())
+            # Entries the new one supersedes (e.g. the stale answer a bypass_cache request
+            # regenerated) would otherwise keep being served in its place
+            for key in [
+                k for k, e in entries.items()
+                if e.fingerprint == entry.fingerprint and float(e.question_vector @ entry.question_vector) >= self.similarity_threshold
+            ]:
+                del entries[key]
+            entries[self._next_key] = entry
+            self._next_key += 1
+            while len(entries) > self.max_entries_per_user:
+                entries.popitem(last=False)
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.bypassed += 1
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drops every cached answer of a user (called when their corpus changes)."""
+        with self._lock:
+            if self._entries.pop(user_id, None):
+                self.invalidations += 1
+                logger.info(f"Invalidated cached answers for user {user_id}.")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": True,
+                "entries": sum(len(entries) for entries in self._entries.values()),
+                "users": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "bypassed": self.bypassed,
+                "invalidations": self.invalidations,
+                "similarity_threshold": self.similarity_threshold,
+            }
+
+
+_answer_cache: Optional[AnswerCache] = None
+if settings.ANSWER_CACHE_ENABLED:
+    _answer_cache = AnswerCache(
+        similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+        max_entries_per_user=settings.ANSWER_CACHE_MAX_ENTRIES_PER_USER,
+        ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS
+    )
+
+
+def lookup_answer(user_id: str, question_vector: List[float], chunk_ids: List[str], bypass_cache: bool = False) -> Optional[CachedAnswer]:
+    """Returns a reusable cached answer, or None (always None when bypassed or disabled)."""
+    if _answer_cache is None:
+        return None
+    if bypass_cache:
+        _answer_cache.record_bypass()
+        return None
+    return _answer_cache.lookup(user_id, question_vector, chunk_ids)
+
+
+def store_answer(user_id: str, question: str, question_vector: List[float], chunk_ids: List[str], answer: str, sources: List[Dict]) -> None:
+    if _answer_cache is not None:
+        _answer_cache.store(user_id, question, question_vector, chunk_ids, answer, sources)
+
+
+def invalidate_user(user_id: str) -> None:
+    """Must be called whenever a user's corpus changes."""
+    if _answer_cache is not None:
+        _answer_cache.invalidate_user(user_id)
+
+
+def get_answer_cache_stats() -> dict:
+    if _answer_cache is None:
+        return {"enabled": False}
+    return _answer_cache.stats()
+
+
+if __name__ == '__main__':
+    # Self-contained check with hand-made vectors (no API calls).
+    cache = AnswerCache(similarity_threshold=0.95, max_entries_per_user=2, ttl_seconds=60)
+    ids = ["a-0", "b-0"]
+    cache.store("u1", "What was revenue?", [1.0, 0.0, 0.0], ids, "Revenue was 10.", [{"filename": "r.pdf"}])
+
+    assert cache.lookup("u1", [0.99, 0.05, 0.0], ids).answer == "Revenue was 10.", "Similar question should hit."
+    assert cache.lookup("u1", [0.0, 1.0, 0.0], ids) is None, "Different question should miss."
+    assert cache.lookup("u1", [1.0, 0.0, 0.0], ["a-0", "c-0"]) is None, "Different context should miss."
+    assert cache.lookup("u2", [1.0, 0.0, 0.0], ids) is None, "Caches are per user."
+
+    cache.store("u1", "What was revenue?", [1.0, 0.0, 0.0], ids, "Revenue was 12.", [{"filename": "r.pdf"}])
+    assert cache.lookup("u1", [1.0, 0.0, 0.0], ids).answer == "Revenue was 12.", "A regenerated answer replaces the old one."
+    assert cache.stats()["entries"] == 1
+
+    cache.invalidate_user("u1")
+    assert cache.lookup("u1", [1.0, 0.0, 0.0], ids) is None, "Invalidated entries must not be served."
+    print(f"Stats: {cache.stats()}")
+    print("answer_cache tests completed.")
@@ -0,0 +1,185 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from ..core.config import settings # Relative import from core
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=settings.LOG_LEVEL)
+
+# SQLite limits the number of bound parameters per statement, so lookups are chunked.
+_LOOKUP_BATCH_SIZE = 500
+
+
+class ArtifactCache:
+    """
+    On-disk cache of per-page extraction results (page text, Camelot tables, OCR text),
+    keyed by (file content hash, extractor version, page). A retried job or a re-index
+    with different chunking settings reuses them instead of parsing the PDF again; an
+    extractor whose output changes gets a new version string, so stale artifacts are
+    never served.
+
+    Payloads are JSON, zlib-compressed. When the cache grows past `max_bytes`, the least
+    recently used artifacts are evicted down to 90% of it.
+    """
+
+    def __init__(self, db_path: Path, max_bytes: int):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS artifacts (
+                content_hash TEXT NOT NULL,
+                extractor TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                payload BLOB NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                PRIMARY KEY (content_hash, extractor, page)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_last_used ON artifacts (last_used_at)")
+        self._conn.commit()
+
+    def get_pages(self, content_hash: str, extractor: str, pages: Iterable[int]) -> dict[int, Any]:
+        """Returns {page: artifact} for the pages that are cached (and marks them as used)."""
+        pages = list(dict.fromkeys(pages))
+        found: dict[int, Any] = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(pages), _LOOKUP_BATCH_SIZE):
+                batch = pages[i:i + _LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                params = [content_hash, extractor, *batch]
+                rows = self._conn.execute(
+                    f"SELECT page, payload FROM artifacts WHERE content_hash = ? AND extractor = ? AND page IN ({placeholders})",
+                    params,
+                ).fetchall()
+                for row in rows:
+                    found[row["page"]] = json.loads(zlib.decompress(row["payload"]))
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE artifacts SET last_used_at = ? WHERE content_hash = ? AND extractor = ? AND page IN ({placeholders})",
+                        [now, *params],
+                    )
+            self._conn.commit()
+        return found
+
+    def put_pages(self, content_hash: str, extractor: str, artifacts: dict[int, Any]) -> None:
+        """Stores one artifact per page, then evicts if the cache is over its size limit."""
+        if not artifacts:
+            return
+        now = time.time()
+        rows = []
+        for page, artifact in artifacts.items():
+            payload = zlib.compress(json.dumps(artifact, separators=(",", ":")).encode("utf-8"))
+            rows.append((content_hash, extractor, page, payload, len(payload), now, now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO artifacts (content_hash, extractor, page, payload, size_bytes, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+        self.evict()
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM artifacts").fetchone()[0]
+
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        """Removes least recently used artifacts until the cache fits in 90% of max_bytes. Returns how many were removed."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with self._lock:
+            total = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM artifacts").fetchone()[0]
+            if total <= max_bytes:
+                return 0
+            target = int(max_bytes * 0.9)
+            victims = []
+            for row in self._conn.execute("SELECT rowid, size_bytes FROM artifacts ORDER BY last_used_at"):
+                if total <= target:
+                    break
+                victims.append((row["rowid"],))
+                total -= row["size_bytes"]
+            self._conn.executemany("DELETE FROM artifacts WHERE rowid = ?", victims)
+            self._conn.commit()
+        logger.info(f"Evicted {len(victims)} artifact(s) from the artifact cache ({total} bytes left).")
+        return len(victims)
+
+    def purge(self, content_hash: Optional[str] = None, extractor_prefix: Optional[str] = None, unused_for_seconds: Optional[float] = None) -> int:
+        """Deletes the artifacts matching all given filters (everything if none). Returns how many were removed."""
+        clauses, params = [], []
+        if content_hash:
+            clauses.append("content_hash LIKE ?") # Accepts an abbreviated hash prefix
+            params.append(f"{content_hash}%")
+        if extractor_prefix:
+            clauses.append("extractor LIKE ?")
+            params.append(f"{extractor_prefix}%")
+        if unused_for_seconds is not None:
+            clauses.append("last_used_at < ?")
+            params.append(time.time() - unused_for_seconds)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            removed = self._conn.execute(f"DELETE FROM artifacts{where}", params).rowcount
+            self._conn.commit()
+            if not clauses:
+                self._conn.execute("VACUUM")
+        return removed
+
+    def list_entries(self) -> list[dict]:
+        """One summary row per (content hash, extractor): pages cached, bytes and last use."""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT content_hash, extractor, COUNT(*) AS pages, SUM(size_bytes) AS size_bytes, MAX(last_used_at) AS last_used_at
+                FROM artifacts GROUP BY content_hash, extractor ORDER BY last_used_at DESC
+                """
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT content_hash), COALESCE(SUM(size_bytes), 0) FROM artifacts"
+            ).fetchone()
+        return {"artifacts": row[0], "files": row[1], "size_bytes": row[2], "max_bytes": self.max_bytes}
+
+
+artifact_cache: Optional[ArtifactCache] = None
+if settings.ARTIFACT_CACHE_ENABLED:
+    artifact_cache = ArtifactCache(settings.ARTIFACT_CACHE_PATH, max_bytes=settings.ARTIFACT_CACHE_MAX_BYTES)
+
+
+if __name__ == '__main__':
+    # Self-contained check on a temporary database.
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = ArtifactCache(Path(tmp_dir) / "artifacts.sqlite3", max_bytes=10_000_000)
+        cache.put_pages("abc", "pages-v1", {0: {"text": "page one"}, 1: {"text": "page two"}})
+        assert cache.get_pages("abc", "pages-v1", [0, 1, 2]) == {0: {"text": "page one"}, 1: {"text": "page two"}}
+        assert cache.get_pages("abc", "pages-v2", [0]) == {}, "Another extractor version must miss."
+
+        cache.put_pages("def", "pages-v1", {page: {"text": str(page) * 5000} for page in range(50)})
+        time.sleep(0.01)
+        cache.get_pages("abc", "pages-v1", [0, 1]) # Recently used: survives eviction
+        cache.evict(max_bytes=cache.total_bytes() // 2)
+        assert cache.get_pages("abc", "pages-v1", [0]), "Recently used artifacts must be kept."
+        assert len(cache.get_pages("def", "pages-v1", range(50))) < 50
+
+        assert cache.purge(content_hash="ab") == 2 and cache.stats()["files"] == 1
+        print(f"Stats: {cache.stats()}")
+    print("artifact_cache tests completed.")
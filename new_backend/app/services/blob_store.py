@@ -0,0 +1,193 @@
+import asyncio
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+from fastapi import UploadFile
+
+from ..core.config import settings # Relative import from core
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=settings.LOG_LEVEL)
+
+
+@dataclass
+class StoredBlob:
+    content_hash: str # sha256 of the content, also the blob's name
+    size_bytes: int
+    path: Path
+    deduplicated: bool # True if the same content was already stored
+
+
+class BlobStore:
+    """
+    Content-addressed store for uploaded files: every distinct content is kept once, as
+    `<root>/<hash[:2]>/<hash>`, and users' staged/processed files are hard links to it.
+    Duplicate uploads therefore cost no extra disk space, and a blob whose only remaining
+    link is its own entry in the store is unreferenced and can be removed.
+    """
+
+    def __init__(self, root: Path, chunk_size: int, gc_grace_seconds: float):
+        self.root = Path(root)
+        self.chunk_size = max(64 * 1024, chunk_size)
+        self.gc_grace_seconds = gc_grace_seconds
+        self._tmp_dir = self.root / "tmp"
+        self._tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    def blob_path(self, content_hash: str) -> Path:
+        return self.root / content_hash[:2] / content_hash
+
+    @staticmethod
+    def _write_chunk(out, digest, chunk: bytes) -> None:
+        digest.update(chunk) # hashlib releases the GIL for large buffers
+        out.write(chunk)
+
+    def _publish(self, temp_path: Path, content_hash: str) -> bool:
+        """Moves a fully written temp file into the store. Returns True if the content was already there."""
+        blob_path = self.blob_path(content_hash)
+        blob_path.parent.mkdir(exist_ok=True)
+        try:
+            os.link(temp_path, blob_path) # Atomic create-if-absent
+            deduplicated = False
+        except FileExistsError:
+            os.utime(blob_path) # Keeps a concurrent garbage collection from removing it before it is linked
+            deduplicated = True
+        temp_path.unlink()
+        return deduplicated
+
+    async def store_upload(self, upload: UploadFile) -> StoredBlob:
+        """
+        Streams an upload into the store in `chunk_size` pieces, hashing it on the way.
+        Writes and hashing run in a worker thread, so the event loop is never blocked.
+        """
+        temp_path = self._tmp_dir / uuid.uuid4().hex
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            out = await asyncio.to_thread(open, temp_path, "wb")
+            try:
+                while chunk := await upload.read(self.chunk_size):
+                    await asyncio.to_thread(self._write_chunk, out, digest, chunk)
+                    size += len(chunk)
+            finally:
+                await asyncio.to_thread(out.close)
+            content_hash = digest.hexdigest()
+            deduplicated = await asyncio.to_thread(self._publish, temp_path, content_hash)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        return StoredBlob(content_hash, size, self.blob_path(content_hash), deduplicated)
+
+    def store_file(self, file_path: Path, content_hash: str) -> StoredBlob:
+        """
+        Moves a completely written file (e.g. an assembled chunked upload, on the same
+        filesystem) into the store without copying it. `content_hash` must be its sha256.
+        """
+        size = file_path.stat().st_size
+        try:
+            deduplicated = self._publish(file_path, content_hash)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            logger.warning(f"{file_path} is not on the blob store's filesystem; copying it into the store.")
+            temp_path = self._tmp_dir / uuid.uuid4().hex
+            shutil.copyfile(file_path, temp_path)
+            deduplicated = self._publish(temp_path, content_hash)
+            file_path.unlink()
+        return StoredBlob(content_hash, size, self.blob_path(content_hash), deduplicated)
+
+    def link(self, blob: StoredBlob, dest_path: Path) -> None:
+        """
+        Makes `dest_path` a reference to the blob (replacing what was there). Falls back to a
+        copy on filesystems without hard links.
+        """
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        if dest_path.exists() and os.path.samefile(blob.path, dest_path):
+            return # Already a link to this blob (rename onto the same file would be a no-op)
+        temp_dest = dest_path.with_name(f".{dest_path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            os.link(blob.path, temp_dest)
+        except OSError as e:
+            if isinstance(e, FileNotFoundError):
+                raise
+            logger.warning(f"Could not hard link {blob.path} to {dest_path} ({e}); copying instead.")
+            shutil.copyfile(blob.path, temp_dest)
+        os.replace(temp_dest, dest_path)
+
+    @staticmethod
+    def move(src_path: Path, dest_path: Path) -> None:
+        """
+        Moves a staged file to its processed location. Both may be links to the same blob,
+        in which case a rename would silently do nothing, so the source is unlinked instead.
+        """
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        if dest_path.exists() and os.path.samefile(src_path, dest_path):
+            src_path.unlink()
+        else:
+            shutil.move(str(src_path), str(dest_path))
+
+    def remove_unreferenced(self) -> int:
+        """Deletes blobs no file links to any more (and older than the grace period). Returns how many were removed."""
+        removed = 0
+        cutoff = time.time() - self.gc_grace_seconds
+        for bucket in self.root.iterdir():
+            if len(bucket.name) != 2 or not bucket.is_dir(): # Only <hash[:2]> buckets hold blobs
+                continue
+            for blob_path in bucket.iterdir():
+                try:
+                    stat = blob_path.stat()
+                    if stat.st_nlink <= 1 and stat.st_mtime < cutoff:
+                        blob_path.unlink()
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+        if removed:
+            logger.info(f"Removed {removed} unreferenced blob(s) from {self.root}.")
+        return removed
+
+
+blob_store = BlobStore(
+    settings.BLOB_STORE_DIR,
+    chunk_size=settings.UPLOAD_CHUNK_SIZE_BYTES,
+    gc_grace_seconds=settings.BLOB_GC_GRACE_SECONDS
+)
+
+
+if __name__ == '__main__':
+    # Self-contained check on a temporary directory with in-memory uploads.
+    import io
+    import tempfile
+
+    async def main() -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = BlobStore(Path(tmp_dir) / "blobs", chunk_size=64 * 1024, gc_grace_seconds=0)
+            content = os.urandom(300 * 1024)
+
+            first = await store.store_upload(UploadFile(io.BytesIO(content), filename="a.pdf"))
+            assert first.content_hash == hashlib.sha256(content).hexdigest() and first.size_bytes == len(content)
+            assert not first.deduplicated
+            second = await store.store_upload(UploadFile(io.BytesIO(content), filename="copy.pdf"))
+            assert second.deduplicated and second.path == first.path, "Same content must map to the same blob."
+
+            staged = Path(tmp_dir) / "staged" / "a.pdf"
+            store.link(first, staged)
+            store.link(first, staged) # Re-staging the same name replaces the link
+            assert staged.read_bytes() == content and first.path.stat().st_nlink == 2
+
+            processed = Path(tmp_dir) / "processed" / "a.pdf"
+            store.link(first, processed)
+            store.move(staged, processed)
+            assert not staged.exists() and processed.read_bytes() == content, "Moving onto a link of the same blob must drop the source."
+
+            assert store.remove_unreferenced() == 0, "Linked blobs must be kept."
+            processed.unlink()
+            assert store.remove_unreferenced() == 1 and not first.path.exists()
+        print("blob_store tests completed.")
+
+    asyncio.run(main())
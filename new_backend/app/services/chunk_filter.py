@@ -0,0 +1,112 @@
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+# Metadata fields retrieval can filter on. They are written by process_uploaded_pdf through
+# normalize_chunk_metadata, so every chunk carries them with the same type: Chroma and the
+# lexical index compare typed values (an int page never matches a "3" string).
+FILENAME_FIELD = "original_source" # str
+CONTENT_TYPE_FIELD = "content_type" # str: "text_section" or "table_chunk"
+PAGE_FIELD = "page" # int, 0-based first page of the chunk
+PAGE_END_FIELD = "page_end" # int, 0-based last page of the chunk
+SECTION_TITLE_FIELD = "section_title" # str, text sections only
+
+
+def normalize_chunk_metadata(metadata: dict) -> dict:
+    """
+    Returns chunk metadata with the filter fields typed and present on every chunk:
+    tables get the 0-based page/page_end of their (1-based) table_page, page numbers are
+    ints, titles are stripped strings, and None values are left out (Chroma rejects them).
+    """
+    normalized = {key: value for key, value in metadata.items() if value is not None}
+    if normalized.get("table_page") is not None:
+        normalized["table_page"] = int(normalized["table_page"])
+        normalized.setdefault(PAGE_FIELD, normalized["table_page"] - 1)
+    if PAGE_FIELD in normalized:
+        normalized[PAGE_FIELD] = int(normalized[PAGE_FIELD])
+        normalized[PAGE_END_FIELD] = int(normalized.get(PAGE_END_FIELD, normalized[PAGE_FIELD]))
+    for field in (FILENAME_FIELD, CONTENT_TYPE_FIELD, SECTION_TITLE_FIELD):
+        if field in normalized:
+            normalized[field] = str(normalized[field]).strip()
+    return normalized
+
+
+def _all_of(clauses: list) -> Optional[dict]:
+    """Chroma needs at least two operands for $and/$or."""
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+@dataclass(frozen=True)
+class ChunkFilter:
+    """
+    Restricts retrieval to chunks that match every given field, and any of the values
+    given for it. Page ranges are 0-based and inclusive, like chunk metadata; a chunk
+    matches a range it overlaps. Empty fields do not restrict anything.
+    """
+    filenames: Tuple[str, ...] = ()
+    content_types: Tuple[str, ...] = ()
+    page_ranges: Tuple[Tuple[int, int], ...] = ()
+    section_titles: Tuple[str, ...] = ()
+
+    def is_empty(self) -> bool:
+        return not (self.filenames or self.content_types or self.page_ranges or self.section_titles)
+
+    def chroma_where(self) -> Optional[dict]:
+        """The filter as a Chroma `where` clause (None if it does not restrict anything)."""
+        clauses = []
+        for field, values in ((FILENAME_FIELD, self.filenames), (CONTENT_TYPE_FIELD, self.content_types), (SECTION_TITLE_FIELD, self.section_titles)):
+            if values:
+                clauses.append({field: {"$in": list(values)}})
+        if self.page_ranges:
+            ranges = [_all_of([{PAGE_FIELD: {"$lte": end}}, {PAGE_END_FIELD: {"$gte": start}}]) for start, end in self.page_ranges]
+            clauses.append(ranges[0] if len(ranges) == 1 else {"$or": ranges})
+        return _all_of(clauses)
+
+    def sql(self, alias: str) -> Tuple[str, list]:
+        """The filter as an SQL condition on a table `alias` with filename, content_type, page, page_end and section_title columns."""
+        conditions, params = [], []
+        for column, values in (("filename", self.filenames), ("content_type", self.content_types), ("section_title", self.section_titles)):
+            if values:
+                conditions.append(f"{alias}.{column} IN ({','.join('?' * len(values))})")
+                params.extend(values)
+        if self.page_ranges:
+            conditions.append("(" + " OR ".join(f"({alias}.page <= ? AND {alias}.page_end >= ?)" for _ in self.page_ranges) + ")")
+            params.extend(bound for start, end in self.page_ranges for bound in (end, start))
+        return " AND ".join(conditions) or "1", params
+
+    def matches(self, metadata: dict) -> bool:
+        """Whether chunk metadata passes the filter (the same test as chroma_where and sql)."""
+        if self.filenames and metadata.get(FILENAME_FIELD) not in self.filenames:
+            return False
+        if self.content_types and metadata.get(CONTENT_TYPE_FIELD) not in self.content_types:
+            return False
+        if self.section_titles and metadata.get(SECTION_TITLE_FIELD) not in self.section_titles:
+            return False
+        if self.page_ranges:
+            page, page_end = metadata.get(PAGE_FIELD), metadata.get(PAGE_END_FIELD)
+            if not isinstance(page, int) or not isinstance(page_end, int):
+                return False
+            return any(page <= end and page_end >= start for start, end in self.page_ranges)
+        return True
+
+
+if __name__ == '__main__':
+    # Self-contained check (no Chroma needed).
+    table = normalize_chunk_metadata({"original_source": "a.pdf", "content_type": "table_chunk", "table_page": "4", "section_title": None})
+    assert table["table_page"] == 4 and table["page"] == 3 and table["page_end"] == 3 and "section_title" not in table
+    text = normalize_chunk_metadata({"original_source": "a.pdf", "content_type": "text_section", "page": 1, "page_end": 2, "section_title": " Results "})
+    assert text["section_title"] == "Results" and text["page_end"] == 2
+
+    assert ChunkFilter().chroma_where() is None and ChunkFilter().is_empty()
+    assert ChunkFilter(content_types=("table_chunk",)).chroma_where() == {"content_type": {"$in": ["table_chunk"]}}
+    where = ChunkFilter(filenames=("a.pdf",), page_ranges=((0, 1), (5, 9))).chroma_where()
+    assert where["$and"][0] == {"original_source": {"$in": ["a.pdf"]}} and len(where["$and"][1]["$or"]) == 2
+
+    page_filter = ChunkFilter(page_ranges=((2, 3),))
+    assert page_filter.matches(text) and page_filter.matches(table) and not ChunkFilter(page_ranges=((4, 9),)).matches(text)
+    assert ChunkFilter(filenames=("a.pdf",), content_types=("text_section",)).matches(text)
+    assert not ChunkFilter(content_types=("text_section",)).matches(table)
+    clause, params = ChunkFilter(filenames=("a.pdf", "b.pdf"), page_ranges=((2, 3),)).sql("c")
+    assert clause == "c.filename IN (?,?) AND ((c.page <= ? AND c.page_end >= ?))" and params == ["a.pdf", "b.pdf", 3, 2]
+    print("chunk_filter tests completed.")
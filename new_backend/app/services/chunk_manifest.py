@@ -0,0 +1,303 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from ..core.config import settings # Relative import from core
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=settings.LOG_LEVEL)
+
+# SQLite limits the number of bound parameters per statement, so IN (...) lookups are chunked.
+_QUERY_BATCH_SIZE = 500
+
+
+def file_content_hash(file_path: Path) -> str:
+    """sha256 of a file's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ManifestChunk(NamedTuple):
+    chunk_id: str
+    page: Optional[int] # First 0-based page the chunk depends on, None if unknown
+    content_type: Optional[str] # "text_section" or "table_chunk"
+    page_end: Optional[int] = None # Last page it depends on (a section spanning pages); None means `page`
+
+
+@dataclass
+class PageIndex:
+    """What is indexed for a file, page by page (see ChunkManifest.get_page_index)."""
+    content_hash: Optional[str]
+    document_hash: Optional[str]
+    page_hashes: List[str]
+    chunks_by_page: Dict[int, List[ManifestChunk]] = field(default_factory=dict)
+
+
+class ChunkManifest:
+    """
+    Persistent, SQLite-backed record of what is indexed for every user:
+    filename -> content hash -> page hashes -> chunk IDs, plus per-file chunk counts.
+
+    It is written when a file is indexed and is the source of truth for deleting,
+    re-indexing and listing a user's files, which are then direct ID lookups
+    instead of metadata scans of the vector store. Page hashes let a re-upload of a
+    file only re-process the pages that changed.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                user_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                content_hash TEXT,
+                document_hash TEXT,
+                chunk_count INTEGER NOT NULL,
+                text_sections INTEGER NOT NULL,
+                table_chunks INTEGER NOT NULL,
+                indexed_at REAL NOT NULL,
+                PRIMARY KEY (user_id, filename)
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                user_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                page INTEGER,
+                content_type TEXT,
+                page_end INTEGER,
+                PRIMARY KEY (user_id, chunk_id),
+                FOREIGN KEY (user_id, filename) REFERENCES files (user_id, filename) ON DELETE CASCADE
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                user_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                page_hash TEXT NOT NULL,
+                PRIMARY KEY (user_id, filename, page),
+                FOREIGN KEY (user_id, filename) REFERENCES files (user_id, filename) ON DELETE CASCADE
+            )
+            """
+        )
+        self._add_missing_columns("files", {"document_hash": "TEXT"})
+        self._add_missing_columns("chunks", {"page": "INTEGER", "content_type": "TEXT", "page_end": "INTEGER"})
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_file ON chunks (user_id, filename)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_content ON files (user_id, content_hash)")
+        self._conn.commit()
+
+    def _add_missing_columns(self, table: str, columns: Dict[str, str]) -> None:
+        """Upgrades manifests created before a column existed."""
+        existing = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+        for name, column_type in columns.items():
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+    def _refresh_counts(self, user_id: str) -> None:
+        self._conn.execute(
+            """
+            UPDATE files SET
+                chunk_count = (SELECT COUNT(*) FROM chunks c WHERE c.user_id = files.user_id AND c.filename = files.filename),
+                text_sections = (SELECT COUNT(*) FROM chunks c WHERE c.user_id = files.user_id AND c.filename = files.filename AND c.content_type = 'text_section'),
+                table_chunks = (SELECT COUNT(*) FROM chunks c WHERE c.user_id = files.user_id AND c.filename = files.filename AND c.content_type = 'table_chunk')
+            WHERE user_id = ?
+            """,
+            (user_id,),
+        )
+
+    def record_file(
+        self,
+        user_id: str,
+        filename: str,
+        content_hash: Optional[str],
+        chunks: List[ManifestChunk],
+        page_hashes: Optional[List[str]] = None,
+        document_hash: Optional[str] = None
+    ) -> List[str]:
+        """
+        Replaces the manifest entry of a file with its freshly indexed chunks (and page
+        hashes, if known). Returns the chunk IDs of the previous version that are not part
+        of the new one (the caller deletes them from the vector store).
+        """
+        chunk_ids = {chunk.chunk_id for chunk in chunks}
+        with self._lock:
+            previous = {
+                row["chunk_id"] for row in self._conn.execute(
+                    "SELECT chunk_id FROM chunks WHERE user_id = ? AND filename = ?", (user_id, filename)
+                )
+            }
+            with self._conn:
+                self._conn.execute("DELETE FROM files WHERE user_id = ? AND filename = ?", (user_id, filename))
+                self._conn.execute(
+                    "INSERT INTO files (user_id, filename, content_hash, document_hash, chunk_count, text_sections, table_chunks, indexed_at) "
+                    "VALUES (?, ?, ?, ?, 0, 0, 0, ?)",
+                    (user_id, filename, content_hash, document_hash, time.time()),
+                )
+                # A chunk ID is owned by one file; OR REPLACE moves it if another file claimed it before.
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (user_id, filename, chunk_id, page, content_type, page_end) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(user_id, filename, chunk.chunk_id, chunk.page, chunk.content_type, chunk.page_end) for chunk in chunks],
+                )
+                self._conn.executemany(
+                    "INSERT INTO pages (user_id, filename, page, page_hash) VALUES (?, ?, ?, ?)",
+                    [(user_id, filename, page, page_hash) for page, page_hash in enumerate(page_hashes or [])],
+                )
+                self._refresh_counts(user_id)
+        return sorted(previous - chunk_ids)
+
+    def get_page_index(self, user_id: str, filename: str) -> Optional[PageIndex]:
+        """
+        The file's page hashes and chunks grouped by page, or None if the file is not in
+        the manifest or was recorded without page information (then it cannot be
+        re-indexed incrementally).
+        """
+        with self._lock:
+            file_row = self._conn.execute(
+                "SELECT content_hash, document_hash FROM files WHERE user_id = ? AND filename = ?", (user_id, filename)
+            ).fetchone()
+            if file_row is None:
+                return None
+            page_rows = self._conn.execute(
+                "SELECT page, page_hash FROM pages WHERE user_id = ? AND filename = ? ORDER BY page", (user_id, filename)
+            ).fetchall()
+            chunk_rows = self._conn.execute(
+                "SELECT chunk_id, page, content_type, page_end FROM chunks WHERE user_id = ? AND filename = ?", (user_id, filename)
+            ).fetchall()
+        if not page_rows or any(row["page"] is None for row in chunk_rows):
+            return None
+        index = PageIndex(file_row["content_hash"], file_row["document_hash"], [row["page_hash"] for row in page_rows])
+        for row in chunk_rows:
+            index.chunks_by_page.setdefault(row["page"], []).append(
+                ManifestChunk(row["chunk_id"], row["page"], row["content_type"], row["page_end"])
+            )
+        return index
+
+    def get_file(self, user_id: str, filename: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM files WHERE user_id = ? AND filename = ?", (user_id, filename)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def list_files(self, user_id: str) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM files WHERE user_id = ? ORDER BY filename", (user_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_users(self) -> List[str]:
+        """Users with at least one indexed file."""
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT user_id FROM files ORDER BY user_id").fetchall()
+        return [row["user_id"] for row in rows]
+
+    def find_files_by_content_hash(self, user_id: str, content_hash: str) -> List[str]:
+        """Filenames under which the user already indexed exactly this content."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT filename FROM files WHERE user_id = ? AND content_hash = ? ORDER BY filename", (user_id, content_hash)
+            ).fetchall()
+        return [row["filename"] for row in rows]
+
+    def get_chunk_ids(self, user_id: str, filenames: List[str]) -> Dict[str, List[str]]:
+        """Chunk IDs per filename, for the given files that are in the manifest."""
+        chunk_ids: Dict[str, List[str]] = {}
+        with self._lock:
+            for start in range(0, len(filenames), _QUERY_BATCH_SIZE):
+                batch = filenames[start:start + _QUERY_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                for row in self._conn.execute(
+                    f"SELECT filename FROM files WHERE user_id = ? AND filename IN ({placeholders})", (user_id, *batch)
+                ):
+                    chunk_ids.setdefault(row["filename"], [])
+                for row in self._conn.execute(
+                    f"SELECT filename, chunk_id FROM chunks WHERE user_id = ? AND filename IN ({placeholders})", (user_id, *batch)
+                ):
+                    chunk_ids[row["filename"]].append(row["chunk_id"])
+        return chunk_ids
+
+    def all_chunk_ids(self, user_id: str) -> Dict[str, str]:
+        """Every chunk ID of a user, mapped to the file that owns it."""
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_id, filename FROM chunks WHERE user_id = ?", (user_id,)).fetchall()
+        return {row["chunk_id"]: row["filename"] for row in rows}
+
+    def remove_files(self, user_id: str, filenames: List[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM files WHERE user_id = ? AND filename = ?", [(user_id, filename) for filename in filenames]
+            )
+
+    def remove_chunks(self, user_id: str, chunk_ids: List[str]) -> None:
+        """Forgets individual chunks (and keeps the owning files' chunk counts in step)."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM chunks WHERE user_id = ? AND chunk_id = ?", [(user_id, chunk_id) for chunk_id in chunk_ids]
+            )
+            self._refresh_counts(user_id)
+
+    def remove_user(self, user_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files WHERE user_id = ?", (user_id,))
+
+
+chunk_manifest = ChunkManifest(settings.CHUNK_MANIFEST_PATH)
+
+
+if __name__ == '__main__':
+    # Self-contained check on a temporary database.
+    import tempfile
+
+    def chunks(*specs) -> List[ManifestChunk]:
+        return [ManifestChunk(chunk_id, page, "table_chunk" if chunk_id.startswith("t") else "text_section") for chunk_id, page in specs]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manifest = ChunkManifest(Path(tmp_dir) / "manifest.sqlite3")
+        assert manifest.record_file("u1", "a.pdf", "hash-1", chunks(("c1", 0), ("c2", 1), ("t3", 1)), page_hashes=["p0", "p1"]) == []
+        manifest.record_file("u1", "b.pdf", "hash-2", chunks(("c4", None)))
+        manifest.record_file("u2", "a.pdf", "hash-1", chunks(("c1", 0)))
+
+        assert manifest.get_chunk_ids("u1", ["a.pdf", "missing.pdf"]) == {"a.pdf": ["c1", "c2", "t3"]}
+        assert [f["filename"] for f in manifest.list_files("u1")] == ["a.pdf", "b.pdf"]
+        assert manifest.get_file("u1", "a.pdf")["table_chunks"] == 1
+        assert manifest.find_files_by_content_hash("u1", "hash-1") == ["a.pdf"]
+
+        index = manifest.get_page_index("u1", "a.pdf")
+        assert index.page_hashes == ["p0", "p1"] and [c.chunk_id for c in index.chunks_by_page[1]] == ["c2", "t3"]
+        assert manifest.get_page_index("u1", "b.pdf") is None, "Files without page hashes are not incremental."
+
+        stale = manifest.record_file("u1", "a.pdf", "hash-3", chunks(("c1", 0), ("c5", 1)), page_hashes=["p0", "p1b"])
+        assert stale == ["c2", "t3"], "Re-indexing should report the chunks of the previous version."
+        assert manifest.get_file("u1", "a.pdf")["chunk_count"] == 2
+        assert manifest.get_page_index("u1", "a.pdf").page_hashes == ["p0", "p1b"]
+
+        manifest.remove_chunks("u1", ["c5"])
+        assert manifest.get_file("u1", "a.pdf")["chunk_count"] == 1
+
+        manifest.remove_files("u1", ["a.pdf"])
+        assert manifest.all_chunk_ids("u1") == {"c4": "b.pdf"}, "Removing a file must drop its chunks."
+        assert manifest.all_chunk_ids("u2") == {"c1": "a.pdf"}, "Manifests are per user."
+
+        manifest.remove_user("u1")
+        assert manifest.list_files("u1") == []
+    print("chunk_manifest tests completed.")
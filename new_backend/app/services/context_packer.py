@@ -0,0 +1,132 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from langchain.docstore.document import Document as LangchainDocument
+
+from ..core.config import settings # Relative import from core
+from ..core.utils import estimate_token_count, truncate_to_token_limit
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=settings.LOG_LEVEL)
+
+# Separator between chunks in the prompt context (as in RetrievalQA's "stuff" chain)
+CHUNK_SEPARATOR = "\n\n"
+
+
+@dataclass
+class PackedContext:
+    """Chunks selected for the prompt, in relevance order, and why the others were left out."""
+    documents: List[LangchainDocument] = field(default_factory=list)
+    context_tokens: int = 0
+    dropped_low_relevance: int = 0
+    dropped_duplicates: int = 0
+    dropped_over_budget: int = 0
+    truncated_tables: int = 0
+
+    @property
+    def text(self) -> str:
+        return CHUNK_SEPARATOR.join(doc.page_content for doc in self.documents)
+
+
+def relevance_from_distance(distance: float) -> float:
+    """
+    Cosine similarity from a Chroma (squared) L2 distance. OpenAI embeddings are unit
+    length, so ||a - b||^2 = 2 - 2 cos(a, b).
+    """
+    return 1.0 - distance / 2.0
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def pack_context(
+    results: List[Tuple[LangchainDocument, float]],
+    top_k: int,
+    max_tokens: int = settings.QA_CONTEXT_MAX_TOKENS,
+    min_relevance: float = settings.QA_MIN_RELEVANCE,
+    duplicate_similarity: float = settings.QA_DUPLICATE_SIMILARITY,
+    table_max_tokens: int = settings.QA_TABLE_CHUNK_MAX_TOKENS,
+    model_name: str = settings.QA_MODEL_NAME
+) -> PackedContext:
+    """
+    Selects the chunks that go into the prompt from (document, distance) search results,
+    in retrieval order (closest first, or fused with BM25 hits under hybrid search):
+    - chunks below `min_relevance` are dropped (the best chunk is always kept),
+    - near-duplicates of an already selected chunk are dropped,
+    - table chunks longer than `table_max_tokens` are truncated,
+    - chunks that no longer fit into `max_tokens` are skipped,
+    until `top_k` chunks are selected.
+    """
+    packed = PackedContext()
+    selected_shingles: List[set] = []
+    separator_tokens = estimate_token_count(CHUNK_SEPARATOR, model_name)
+
+    for rank, (doc, distance) in enumerate(results):
+        if len(packed.documents) >= top_k:
+            break
+        if rank > 0 and relevance_from_distance(distance) < min_relevance:
+            packed.dropped_low_relevance += 1
+            continue
+
+        shingles = _shingles(doc.page_content)
+        if any(_jaccard(shingles, other) >= duplicate_similarity for other in selected_shingles):
+            packed.dropped_duplicates += 1
+            continue
+
+        content = doc.page_content
+        if doc.metadata.get("content_type") == "table_chunk":
+            truncated = truncate_to_token_limit(content, table_max_tokens, model_name)
+            if truncated != content:
+                content = truncated
+                packed.truncated_tables += 1
+
+        n_tokens = estimate_token_count(content, model_name) + (separator_tokens if packed.documents else 0)
+        if packed.context_tokens + n_tokens > max_tokens:
+            packed.dropped_over_budget += 1
+            continue
+
+        packed.documents.append(doc if content is doc.page_content else LangchainDocument(page_content=content, metadata=doc.metadata))
+        packed.context_tokens += n_tokens
+        selected_shingles.append(shingles)
+
+    logger.debug(
+        f"Packed {len(packed.documents)} of {len(results)} chunk(s) into {packed.context_tokens} tokens "
+        f"(low relevance: {packed.dropped_low_relevance}, duplicates: {packed.dropped_duplicates}, "
+        f"over budget: {packed.dropped_over_budget}, truncated tables: {packed.truncated_tables})."
+    )
+    return packed
+
+
+if __name__ == '__main__':
+    # Self-contained check with hand-made search results (no API calls).
+    def make(text: str, content_type: str = "text_section") -> LangchainDocument:
+        return LangchainDocument(page_content=text, metadata={"content_type": content_type})
+
+    sample = [
+        (make("Revenue grew 12 percent in the third quarter of the year."), 0.4),
+        (make("Revenue grew 12 percent in the third quarter of the year!"), 0.45), # Near-duplicate
+        (make("cell " * 5000, "table_chunk"), 0.5), # Long table, truncated
+        (make("Unrelated text about the office kitchen."), 1.9), # Low relevance
+        (make("Costs fell 3 percent over the same period."), 0.6),
+    ]
+    result = pack_context(sample, top_k=5, max_tokens=2000, table_max_tokens=100)
+    print(
+        f"Selected {len(result.documents)} chunk(s), {result.context_tokens} tokens "
+        f"(low relevance: {result.dropped_low_relevance}, duplicates: {result.dropped_duplicates}, truncated tables: {result.truncated_tables})"
+    )
+    assert result.dropped_duplicates == 1 and result.dropped_low_relevance == 1 and result.truncated_tables == 1
+    assert len(result.documents) == 3 and result.context_tokens <= 2000
+
+    limited = pack_context(sample, top_k=1)
+    assert len(limited.documents) == 1
+    print("context_packer tests completed.")
@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from ..core.config import settings # Relative import from core
+from ..core.utils import estimate_token_count
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=settings.LOG_LEVEL)
+
+# SQLite limits the number of bound parameters per statement, so lookups are chunked.
+_LOOKUP_BATCH_SIZE = 500
+
+
+@dataclass
+class EmbeddingCacheStats:
+    """Hit/miss counters for one or more embedding calls."""
+    hits: int = 0
+    misses: int = 0
+    tokens_saved: int = 0 # Tokens that did not have to be sent to the embedding API
+    tokens_embedded: int = 0 # Tokens that were sent to the embedding API
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def merge(self, other: "EmbeddingCacheStats") -> None:
+        self.hits += other.hits
+        self.misses += other.misses
+        self.tokens_saved += other.tokens_saved
+        self.tokens_embedded += other.tokens_embedded
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes chunk text before hashing so trivial whitespace/Unicode differences share a cache entry."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed, SQLite-backed cache in front of an embeddings model.
+
+    Vectors are stored as float32 blobs keyed by (model name, sha256 of the
+    normalized text). Only texts missing from the cache are sent to the
+    underlying model; their vectors are written back for the next caller.
+
+    The async methods use `async_underlying` when given, so async callers can
+    go through a model whose HTTP client is bound to their own event loop.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, db_path: Path, async_underlying: Optional[Embeddings] = None):
+        self.underlying = underlying
+        self.async_underlying = async_underlying or underlying
+        self.model_name = model_name
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dims INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.commit()
+        self.stats = EmbeddingCacheStats() # Cumulative, process-wide counters
+
+    # --- Raw cache access ---
+
+    def lookup(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Returns the cached vector for each text, or None for cache misses."""
+        hashes = [text_hash(t) for t in texts]
+        found: dict[str, List[float]] = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        with self._lock:
+            for i in range(0, len(unique_hashes), _LOOKUP_BATCH_SIZE):
+                batch = unique_hashes[i:i + _LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_name, *batch],
+                ).fetchall()
+                for h, blob in rows:
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    found[h] = vec.tolist()
+        return [found.get(h) for h in hashes]
+
+    def store(self, texts: List[str], vectors: List[List[float]]) -> None:
+        now = time.time()
+        rows = [
+            (self.model_name, text_hash(t), len(v), array("f", v).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dims, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def record(self, stats: EmbeddingCacheStats) -> None:
+        """Adds counters of a lookup done outside `embed_documents_with_stats` to the cumulative stats."""
+        with self._lock:
+            self.stats.merge(stats)
+
+    # --- Embeddings interface ---
+
+    def embed_documents_with_stats(self, texts: List[str]) -> tuple[List[List[float]], EmbeddingCacheStats]:
+        """Embeds texts through the cache and returns the vectors with this call's hit/miss stats."""
+        vectors = self.lookup(texts)
+        stats = EmbeddingCacheStats()
+        miss_indices = [i for i, v in enumerate(vectors) if v is None]
+        for i, v in enumerate(vectors):
+            if v is not None:
+                stats.hits += 1
+                stats.tokens_saved += estimate_token_count(texts[i], self.model_name)
+
+        if miss_indices:
+            miss_texts = [texts[i] for i in miss_indices]
+            new_vectors = self.underlying.embed_documents(miss_texts)
+            self.store(miss_texts, new_vectors)
+            for i, v in zip(miss_indices, new_vectors):
+                vectors[i] = v
+            stats.misses += len(miss_indices)
+            stats.tokens_embedded += sum(estimate_token_count(t, self.model_name) for t in miss_texts)
+
+        self.record(stats)
+        logger.debug(f"Embedding cache: {stats.hits} hit(s), {stats.misses} miss(es) for {len(texts)} text(s).")
+        return vectors, stats
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors, _ = self.embed_documents_with_stats(texts)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents_with_stats(self, texts: List[str]) -> tuple[List[List[float]], EmbeddingCacheStats]:
+        """Async variant of embed_documents_with_stats; SQLite access runs in a worker thread."""
+        vectors = await asyncio.to_thread(self.lookup, texts)
+        stats = EmbeddingCacheStats()
+        miss_indices = [i for i, v in enumerate(vectors) if v is None]
+        for i, v in enumerate(vectors):
+            if v is not None:
+                stats.hits += 1
+                stats.tokens_saved += estimate_token_count(texts[i], self.model_name)
+
+        if miss_indices:
+            miss_texts = [texts[i] for i in miss_indices]
+            new_vectors = await self.async_underlying.aembed_documents(miss_texts)
+            await asyncio.to_thread(self.store, miss_texts, new_vectors)
+            for i, v in zip(miss_indices, new_vectors):
+                vectors[i] = v
+            stats.misses += len(miss_indices)
+            stats.tokens_embedded += sum(estimate_token_count(t, self.model_name) for t in miss_texts)
+
+        self.record(stats)
+        return vectors, stats
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors, _ = await self.aembed_documents_with_stats(texts)
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "model": self.model_name,
+                "hits": self.stats.hits,
+                "misses": self.stats.misses,
+                "hit_ratio": self.stats.hit_ratio,
+                "tokens_saved": self.stats.tokens_saved,
+                "tokens_embedded": self.stats.tokens_embedded,
+            }
+
+
+if __name__ == '__main__':
+    # Self-contained check of the cache with a deterministic fake embeddings model (no API calls).
+    import tempfile
+    from langchain_community.embeddings import FakeEmbeddings
+
+    class CountingEmbeddings(FakeEmbeddings):
+        calls: int = 0
+
+        def embed_documents(self, texts):
+            self.calls += len(texts)
+            return super().embed_documents(texts)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fake = CountingEmbeddings(size=8)
+        cache = CachedEmbeddings(fake, "fake-model", Path(tmp_dir) / "embeddings.sqlite3")
+
+        first, stats1 = cache.embed_documents_with_stats(["apples are red", "bananas are yellow"])
+        print(f"First call: {stats1}")
+        assert stats1.misses == 2 and fake.calls == 2
+
+        second, stats2 = cache.embed_documents_with_stats(["apples   are red", "cherries are dark"])
+        print(f"Second call: {stats2}")
+        assert stats2.hits == 1 and stats2.misses == 1 and fake.calls == 3
+        assert all(abs(a - b) < 1e-6 for a, b in zip(first[0], second[0])), "Cached vector differs from original."
+
+        print(f"Cumulative stats: {cache.get_stats()}")
+    print("embedding_cache tests completed.")
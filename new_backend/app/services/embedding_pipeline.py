@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+
+from ..core.config import settings # Relative import from core
+
+try:
+    import openai
+except ImportError:
+    openai = None
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=settings.LOG_LEVEL)
+
+EmbedBatchFn = Callable[[List[str]], Awaitable[List[List[float]]]]
+BatchDoneFn = Callable[[List[int], List[List[float]]], Awaitable[None]]
+
+
+@dataclass
+class EmbeddingPipelineMetrics:
+    """Throughput counters for one or more runs of the embedding pipeline."""
+    batches: int = 0
+    texts: int = 0
+    tokens: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def batches_per_second(self) -> float:
+        return self.batches / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def merge(self, other: "EmbeddingPipelineMetrics") -> None:
+        self.batches += other.batches
+        self.texts += other.texts
+        self.tokens += other.tokens
+        self.retries += other.retries
+        self.rate_limited += other.rate_limited
+        self.elapsed_seconds += other.elapsed_seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "tokens": self.tokens,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "elapsed_seconds": round(self.elapsed_seconds, 4),
+            "batches_per_second": round(self.batches_per_second, 4),
+            "tokens_per_second": round(self.tokens_per_second, 2),
+        }
+
+
+# Cumulative, process-wide metrics across all pipeline runs
+_global_metrics = EmbeddingPipelineMetrics()
+_global_metrics_lock = threading.Lock()
+
+
+def get_pipeline_metrics() -> dict:
+    with _global_metrics_lock:
+        return _global_metrics.as_dict()
+
+
+def build_token_batches(
+    token_counts: List[int],
+    max_tokens_per_batch: int = settings.EMBEDDING_BATCH_MAX_TOKENS,
+    max_items_per_batch: int = settings.EMBEDDING_BATCH_MAX_ITEMS
+) -> List[List[int]]:
+    """
+    Groups text indices into batches whose total token count stays under the budget.
+    Order is preserved; a single text larger than the budget gets a batch of its own.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, n_tokens in enumerate(token_counts):
+        if current and (current_tokens + n_tokens > max_tokens_per_batch or len(current) >= max_items_per_batch):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += n_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or (openai is not None and isinstance(error, openai.RateLimitError))
+
+
+def _retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """
+    Returns how long to wait before retrying after `error`, or None if it is not retryable.
+    Rate limits honor the server's Retry-After header when there is one.
+    """
+    status_code = getattr(error, "status_code", None)
+    is_rate_limit = _is_rate_limit(error)
+    is_transient = is_rate_limit or (status_code is not None and status_code >= 500) or (
+        openai is not None and isinstance(error, (openai.APIConnectionError, openai.APITimeoutError))
+    )
+    if not is_transient:
+        return None
+
+    if is_rate_limit:
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), settings.EMBEDDING_BACKOFF_MAX_SECONDS)
+            except ValueError:
+                pass
+
+    # Exponential backoff with full jitter
+    backoff = min(settings.EMBEDDING_BACKOFF_BASE_SECONDS * (2 ** attempt), settings.EMBEDDING_BACKOFF_MAX_SECONDS)
+    return random.uniform(0, backoff)
+
+
+async def run_embedding_pipeline(
+    texts: List[str],
+    token_counts: List[int],
+    embed_batch: EmbedBatchFn,
+    on_batch_done: BatchDoneFn,
+    max_concurrency: int = settings.EMBEDDING_MAX_CONCURRENCY,
+    max_retries: int = settings.EMBEDDING_MAX_RETRIES,
+    max_tokens_per_batch: int = settings.EMBEDDING_BATCH_MAX_TOKENS,
+    max_items_per_batch: int = settings.EMBEDDING_BATCH_MAX_ITEMS
+) -> EmbeddingPipelineMetrics:
+    """
+    Embeds `texts` in token-budgeted batches through a bounded pool of async workers.
+
+    `on_batch_done(indices, vectors)` is awaited as soon as each batch is embedded,
+    so callers can stream results into the vector store instead of waiting for the
+    whole document. Rate-limited and transient failures are retried with backoff;
+    any batch that still fails aborts the run and the error is raised.
+    """
+    metrics = EmbeddingPipelineMetrics()
+    if not texts:
+        return metrics
+
+    batches = build_token_batches(token_counts, max_tokens_per_batch, max_items_per_batch)
+    queue: asyncio.Queue = asyncio.Queue()
+    for batch in batches:
+        queue.put_nowait(batch)
+
+    async def worker() -> None:
+        while True:
+            try:
+                indices = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            batch_texts = [texts[i] for i in indices]
+            attempt = 0
+            while True:
+                try:
+                    vectors = await embed_batch(batch_texts)
+                    break
+                except Exception as e:
+                    delay = _retry_delay(e, attempt)
+                    if delay is None or attempt >= max_retries:
+                        raise
+                    attempt += 1
+                    metrics.retries += 1
+                    if _is_rate_limit(e):
+                        metrics.rate_limited += 1
+                    logger.warning(f"Embedding batch of {len(indices)} text(s) failed ({e}); retry {attempt}/{max_retries} in {delay:.2f}s.")
+                    await asyncio.sleep(delay)
+            await on_batch_done(indices, vectors)
+            metrics.batches += 1
+            metrics.texts += len(indices)
+            metrics.tokens += sum(token_counts[i] for i in indices)
+
+    started = time.perf_counter()
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(max_concurrency, len(batches))))]
+    try:
+        await asyncio.gather(*workers)
+    except Exception:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        raise
+    finally:
+        metrics.elapsed_seconds = time.perf_counter() - started
+        with _global_metrics_lock:
+            _global_metrics.merge(metrics)
+
+    logger.info(
+        f"Embedded {metrics.texts} text(s) in {metrics.batches} batch(es): "
+        f"{metrics.batches_per_second:.2f} batches/s, {metrics.tokens_per_second:.0f} tokens/s."
+    )
+    return metrics
+
+
+if __name__ == '__main__':
+    # Exercise batching, retries and streaming callbacks against an in-process fake (no API calls).
+    # For an end-to-end run against a local fake OpenAI server, see benchmarks/bench_embedding_pipeline.py.
+    class FakeRateLimit(Exception):
+        status_code = 429
+        response = None
+
+    calls = {"n": 0}
+
+    async def fake_embed(batch: List[str]) -> List[List[float]]:
+        calls["n"] += 1
+        call_number = calls["n"]
+        await asyncio.sleep(0.01)
+        if call_number == 2:
+            raise FakeRateLimit("simulated 429")
+        return [[float(len(t))] for t in batch]
+
+    received: dict = {}
+
+    async def collect(indices: List[int], vectors: List[List[float]]) -> None:
+        for i, v in zip(indices, vectors):
+            received[i] = v
+
+    sample_texts = [f"chunk number {i} " * (i % 7 + 1) for i in range(40)]
+    sample_tokens = [len(t.split()) for t in sample_texts]
+    print(f"Batches: {build_token_batches(sample_tokens, max_tokens_per_batch=30, max_items_per_batch=8)}")
+    result = asyncio.run(run_embedding_pipeline(
+        sample_texts, sample_tokens, fake_embed, collect,
+        max_concurrency=3, max_tokens_per_batch=30, max_items_per_batch=8
+    ))
+    assert len(received) == len(sample_texts), "Some texts were not embedded."
+    assert all(received[i] == [float(len(t))] for i, t in enumerate(sample_texts)), "Vectors were misaligned."
+    assert result.retries == 1 and result.rate_limited == 1
+    print(f"Metrics: {result.as_dict()}")
+    print("embedding_pipeline tests completed.")
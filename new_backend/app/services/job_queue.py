@@ -0,0 +1,254 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Optional
+
+from ..core.config import settings # Relative import from core
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=settings.LOG_LEVEL)
+
+# Processing stages reported for every job, in execution order
+JOB_STAGES = ["parse", "sections", "tables", "embed", "persist"]
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+# Called by job handlers to report progress: (stage, state, detail)
+ProgressCallback = Callable[[str, str, Optional[str]], None]
+JobHandler = Callable[[dict, ProgressCallback], dict]
+
+
+class JobQueue:
+    """
+    Persistent, SQLite-backed queue of document processing jobs.
+
+    Jobs survive restarts: anything still marked running when the worker pool
+    starts is put back in the queue (the queue is meant to be served by a single
+    application process). Failed attempts are retried with a delay until
+    `max_attempts` is reached. Enqueueing a file that already has a pending job
+    returns that job instead of creating a duplicate.
+    """
+
+    def __init__(self, db_path: Path, max_attempts: int = settings.JOB_MAX_ATTEMPTS):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                status TEXT NOT NULL,
+                current_stage TEXT,
+                stages TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                error TEXT,
+                result TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                next_attempt_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, next_attempt_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user_file ON jobs (user_id, filename)")
+        self._conn.commit()
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["stages"] = json.loads(job["stages"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def recover_interrupted(self) -> int:
+        """Re-queues jobs that were running when the process stopped. Returns how many were recovered."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, next_attempt_at = ? WHERE status = ?",
+                (JOB_QUEUED, now, now, JOB_RUNNING),
+            )
+            self._conn.commit()
+        if cursor.rowcount:
+            logger.info(f"Re-queued {cursor.rowcount} interrupted processing job(s).")
+        return cursor.rowcount
+
+    def enqueue(self, user_id: str, filename: str) -> dict:
+        """Queues a processing job for a staged file, or returns the pending one for the same file."""
+        now = time.time()
+        with self._lock:
+            existing = self._conn.execute(
+                "SELECT * FROM jobs WHERE user_id = ? AND filename = ? AND status IN (?, ?) ORDER BY created_at DESC LIMIT 1",
+                (user_id, filename, JOB_QUEUED, JOB_RUNNING),
+            ).fetchone()
+            if existing is not None:
+                return self._row_to_job(existing)
+            job_id = uuid.uuid4().hex
+            stages = {stage: {"status": "pending", "detail": None} for stage in JOB_STAGES}
+            self._conn.execute(
+                "INSERT INTO jobs (id, user_id, filename, status, stages, max_attempts, created_at, updated_at, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, user_id, filename, JOB_QUEUED, json.dumps(stages), self.max_attempts, now, now, now),
+            )
+            self._conn.commit()
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def claim_next(self) -> Optional[dict]:
+        """Atomically marks the oldest due job as running and returns it."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND next_attempt_at <= ? ORDER BY created_at LIMIT 1",
+                (JOB_QUEUED, now),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, error = NULL, updated_at = ? WHERE id = ?",
+                (JOB_RUNNING, now, row["id"]),
+            )
+            self._conn.commit()
+            claimed = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+        return self._row_to_job(claimed)
+
+    def update_stage(self, job_id: str, stage: str, state: str, detail: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT stages FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            stages = json.loads(row["stages"])
+            stages[stage] = {"status": state, "detail": detail}
+            self._conn.execute(
+                "UPDATE jobs SET stages = ?, current_stage = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(stages), stage, now, job_id),
+            )
+            self._conn.commit()
+
+    def complete(self, job_id: str, result: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, updated_at = ? WHERE id = ?",
+                (JOB_COMPLETED, json.dumps(result), time.time(), job_id),
+            )
+            self._conn.commit()
+
+    def fail(self, job_id: str, error: str) -> str:
+        """Records a failed attempt. The job is re-queued with a delay unless it is out of attempts."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return JOB_FAILED
+            if row["attempts"] < row["max_attempts"]:
+                status = JOB_QUEUED
+                next_attempt_at = now + settings.JOB_RETRY_BACKOFF_SECONDS * (2 ** (row["attempts"] - 1))
+            else:
+                status = JOB_FAILED
+                next_attempt_at = now
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ?, next_attempt_at = ? WHERE id = ?",
+                (status, error, now, next_attempt_at, job_id),
+            )
+            self._conn.commit()
+        return status
+
+
+class JobWorkerPool:
+    """Pool of worker threads that claim jobs from a JobQueue and run them through a handler."""
+
+    def __init__(self, queue: JobQueue, handler: JobHandler, num_workers: int = settings.PROCESSING_WORKERS):
+        self.queue = queue
+        self.handler = handler
+        self.num_workers = max(1, num_workers)
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self.queue.recover_interrupted()
+        self._stop.clear()
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"processing-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.num_workers} document processing worker(s).")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def notify(self) -> None:
+        """Wakes idle workers up after a job was enqueued."""
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            job = self.queue.claim_next()
+            if job is None:
+                self._wakeup.wait(timeout=settings.JOB_POLL_INTERVAL_SECONDS)
+                self._wakeup.clear()
+                continue
+
+            job_id = job["id"]
+
+            def report(stage: str, state: str, detail: Optional[str] = None) -> None:
+                self.queue.update_stage(job_id, stage, state, detail)
+
+            logger.info(f"Running job {job_id} ('{job['filename']}' for user '{job['user_id']}'), attempt {job['attempts']}.")
+            try:
+                result = self.handler(job, report)
+                self.queue.complete(job_id, result)
+                logger.info(f"Job {job_id} completed with status '{result.get('status')}'.")
+            except Exception as e:
+                status = self.queue.fail(job_id, str(e))
+                logger.error(f"Job {job_id} failed on attempt {job['attempts']} ({status}): {e}", exc_info=True)
+
+
+job_queue = JobQueue(settings.JOB_QUEUE_PATH)
+worker_pool: Optional[JobWorkerPool] = None
+
+
+def start_workers(handler: JobHandler) -> JobWorkerPool:
+    """Starts the process-wide worker pool (called on application startup)."""
+    global worker_pool
+    if worker_pool is None:
+        worker_pool = JobWorkerPool(job_queue, handler)
+    worker_pool.start()
+    return worker_pool
+
+
+def stop_workers() -> None:
+    if worker_pool is not None:
+        worker_pool.stop()
+
+
+def notify_workers() -> None:
+    if worker_pool is not None:
+        worker_pool.notify()
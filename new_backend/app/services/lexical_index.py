@@ -0,0 +1,325 @@
+import json
+import logging
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from ..core.config import settings # Relative import from core
+from .chunk_filter import (
+    CONTENT_TYPE_FIELD, FILENAME_FIELD, PAGE_END_FIELD, PAGE_FIELD, SECTION_TITLE_FIELD, ChunkFilter, normalize_chunk_metadata
+)
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=settings.LOG_LEVEL)
+
+# Words joined by - _ . / : # (invoice numbers, SKUs, table codes) are indexed whole and by part
+_TOKEN_RE = re.compile(r"[^\W_]+(?:[-_./:#][^\W_]+)*")
+_TOKEN_PART_RE = re.compile(r"[-_./:#]")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how in is it its of on or that the this to was were what when "
+    "where which who why will with".split()
+)
+_WRITE_BATCH_SIZE = 500
+# Chunk metadata kept next to each chunk so searches can be filtered (see ChunkFilter.sql)
+_FILTER_COLUMNS = {
+    "filename": (FILENAME_FIELD, "TEXT"),
+    "content_type": (CONTENT_TYPE_FIELD, "TEXT"),
+    "page": (PAGE_FIELD, "INTEGER"),
+    "page_end": (PAGE_END_FIELD, "INTEGER"),
+    "section_title": (SECTION_TITLE_FIELD, "TEXT"),
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased index terms of a text: words and numbers, compound codes whole and by part, without stopwords."""
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        terms.append(token)
+        if _TOKEN_PART_RE.search(token):
+            terms.extend(part for part in _TOKEN_PART_RE.split(token) if part and part not in _STOPWORDS)
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], weights: Optional[list[float]] = None, k: int = 60) -> list[str]:
+    """
+    Fuses ranked ID lists: each ID scores sum(weight / (k + rank)) over the lists it is in
+    (rank from 1). Returns all IDs, best first; ties keep the order they were first seen in.
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores: dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank)
+    return sorted(scores, key=lambda item: -scores[item])
+
+
+class LexicalIndex:
+    """
+    Per-user BM25 inverted index of chunk texts, stored in SQLite next to the vector store.
+    It is written together with the Chroma records (`add` upserts by chunk ID) and `remove`
+    drops chunks when Chroma does, so exact terms like invoice numbers and SKUs can be
+    found even when they do not move the embedding.
+
+    Postings carry the chunk's length, so a query reads only the postings of its terms;
+    collection statistics (chunk count, total length) are kept per user. Chunks keep their
+    filter metadata (file, content type, pages, section title), so a filtered search only
+    scores the postings of matching chunks.
+    """
+
+    def __init__(self, db_path: Path, k1: float = 1.2, b: float = 0.75):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS postings (
+                user_id TEXT NOT NULL,
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (user_id, term, chunk_id)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                user_id TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                terms TEXT NOT NULL,
+                filename TEXT,
+                content_type TEXT,
+                page INTEGER,
+                page_end INTEGER,
+                section_title TEXT,
+                PRIMARY KEY (user_id, chunk_id)
+            ) WITHOUT ROWID
+            """
+        )
+        self._add_missing_columns("chunks", {column: column_type for column, (_, column_type) in _FILTER_COLUMNS.items()})
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_stats (
+                user_id TEXT PRIMARY KEY,
+                chunk_count INTEGER NOT NULL,
+                total_length INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def _add_missing_columns(self, table: str, columns: dict[str, str]) -> None:
+        """Upgrades indexes created before a column existed."""
+        existing = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+        for name, column_type in columns.items():
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+    def _remove_locked(self, user_id: str, chunk_ids: list[str]) -> None:
+        """Deletes chunks and their postings; the caller holds the lock and commits."""
+        removed_chunks, removed_length = 0, 0
+        for start in range(0, len(chunk_ids), _WRITE_BATCH_SIZE):
+            batch = chunk_ids[start:start + _WRITE_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT chunk_id, length, terms FROM chunks WHERE user_id = ? AND chunk_id IN ({placeholders})",
+                [user_id, *batch],
+            ).fetchall()
+            self._conn.executemany(
+                "DELETE FROM postings WHERE user_id = ? AND term = ? AND chunk_id = ?",
+                [(user_id, term, chunk_id) for chunk_id, _, terms in rows for term in json.loads(terms)],
+            )
+            self._conn.executemany("DELETE FROM chunks WHERE user_id = ? AND chunk_id = ?", [(user_id, row[0]) for row in rows])
+            removed_chunks += len(rows)
+            removed_length += sum(row[1] for row in rows)
+        if removed_chunks:
+            self._conn.execute(
+                "UPDATE user_stats SET chunk_count = chunk_count - ?, total_length = total_length - ? WHERE user_id = ?",
+                (removed_chunks, removed_length, user_id),
+            )
+
+    def add(self, user_id: str, chunk_ids: list[str], texts: list[str], metadatas: Optional[list[Optional[dict]]] = None) -> None:
+        """Indexes chunk texts (and the filter fields of their metadata), replacing what was indexed under the same IDs."""
+        if not chunk_ids:
+            return
+        documents = {chunk_id: Counter(tokenize(text)) for chunk_id, text in zip(chunk_ids, texts)}
+        filter_values = {}
+        for chunk_id, metadata in zip(chunk_ids, metadatas or [None] * len(chunk_ids)):
+            metadata = normalize_chunk_metadata(metadata or {})
+            filter_values[chunk_id] = tuple(metadata.get(field) for field, _ in _FILTER_COLUMNS.values())
+        with self._lock:
+            self._remove_locked(user_id, list(documents))
+            self._conn.executemany(
+                f"INSERT INTO chunks (user_id, chunk_id, length, terms, {', '.join(_FILTER_COLUMNS)}) "
+                f"VALUES (?, ?, ?, ?{', ?' * len(_FILTER_COLUMNS)})",
+                [
+                    (user_id, chunk_id, sum(tfs.values()), json.dumps(list(tfs)), *filter_values[chunk_id])
+                    for chunk_id, tfs in documents.items()
+                ],
+            )
+            self._conn.executemany(
+                "INSERT INTO postings (user_id, term, chunk_id, tf, length) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (user_id, term, chunk_id, tf, length)
+                    for chunk_id, tfs in documents.items() for length in (sum(tfs.values()),) for term, tf in tfs.items()
+                ],
+            )
+            self._conn.execute(
+                """
+                INSERT INTO user_stats (user_id, chunk_count, total_length) VALUES (?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    chunk_count = chunk_count + excluded.chunk_count, total_length = total_length + excluded.total_length
+                """,
+                (user_id, len(documents), sum(sum(tfs.values()) for tfs in documents.values())),
+            )
+            self._conn.commit()
+
+    def remove(self, user_id: str, chunk_ids: list[str]) -> None:
+        if not chunk_ids:
+            return
+        with self._lock:
+            self._remove_locked(user_id, list(chunk_ids))
+            self._conn.commit()
+
+    def remove_user(self, user_id: str) -> None:
+        with self._lock:
+            for table in ("postings", "chunks", "user_stats"):
+                self._conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+            self._conn.commit()
+
+    def rebuild(self, user_id: str, records: Iterable[tuple[str, str, Optional[dict]]]) -> int:
+        """Replaces a user's index with (chunk ID, text, metadata) records (e.g. read back from the vector store). Returns the count."""
+        self.remove_user(user_id)
+        count = 0
+        batch: list[tuple[str, str, Optional[dict]]] = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= _WRITE_BATCH_SIZE:
+                self.add(user_id, *(list(column) for column in zip(*batch)))
+                count += len(batch)
+                batch = []
+        if batch:
+            self.add(user_id, *(list(column) for column in zip(*batch)))
+            count += len(batch)
+        return count
+
+    def chunk_count(self, user_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT chunk_count FROM user_stats WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def chunk_ids(self, user_id: str) -> set[str]:
+        """IDs of the user's indexed chunks (to compare the index with the vector store)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_id FROM chunks WHERE user_id = ?", (user_id,)).fetchall()
+        return {row[0] for row in rows}
+
+    def search(self, user_id: str, query: str, k: int, where: Optional[ChunkFilter] = None) -> list[tuple[str, float]]:
+        """
+        The user's `k` best chunks for a query by BM25, as (chunk ID, score), best first.
+        With `where`, only chunks matching the filter are scored (term statistics stay
+        those of the whole collection).
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or k <= 0:
+            return []
+        if where is None or where.is_empty():
+            postings_sql, filter_params = "SELECT chunk_id, tf, length FROM postings WHERE user_id = ? AND term = ?", []
+        else:
+            condition, filter_params = where.sql("c")
+            postings_sql = (
+                "SELECT p.chunk_id, p.tf, p.length FROM postings p JOIN chunks c ON c.user_id = p.user_id AND c.chunk_id = p.chunk_id "
+                f"WHERE p.user_id = ? AND p.term = ? AND {condition}"
+            )
+        with self._lock:
+            stats = self._conn.execute("SELECT chunk_count, total_length FROM user_stats WHERE user_id = ?", (user_id,)).fetchone()
+            if not stats or not stats[0]:
+                return []
+            postings = [self._conn.execute(postings_sql, (user_id, term, *filter_params)).fetchall() for term in terms]
+        n_chunks, average_length = stats[0], stats[1] / stats[0]
+        if where is not None and not where.is_empty():
+            # Document frequencies of the whole collection, not only of the matching chunks
+            with self._lock:
+                frequencies = [
+                    self._conn.execute("SELECT COUNT(*) FROM postings WHERE user_id = ? AND term = ?", (user_id, term)).fetchone()[0]
+                    for term in terms
+                ]
+        else:
+            frequencies = [len(rows) for rows in postings]
+
+        chunk_ids, tfs, lengths, idfs = [], [], [], []
+        for rows, frequency in zip(postings, frequencies):
+            if not rows:
+                continue
+            idf = math.log(1 + (n_chunks - frequency + 0.5) / (frequency + 0.5))
+            for chunk_id, tf, length in rows:
+                chunk_ids.append(chunk_id)
+                tfs.append(tf)
+                lengths.append(length)
+                idfs.append(idf)
+        if not chunk_ids:
+            return []
+        tf = np.asarray(tfs, dtype=np.float64)
+        norm = self.k1 * (1 - self.b + self.b * np.asarray(lengths, dtype=np.float64) / average_length)
+        term_scores = np.asarray(idfs) * tf * (self.k1 + 1) / (tf + norm)
+        unique_ids, inverse = np.unique(np.asarray(chunk_ids, dtype=object), return_inverse=True)
+        scores = np.bincount(inverse, weights=term_scores)
+        best = np.argsort(-scores, kind="stable")[:k]
+        return [(str(unique_ids[i]), float(scores[i])) for i in best]
+
+
+lexical_index: Optional[LexicalIndex] = None
+if settings.HYBRID_SEARCH_ENABLED:
+    lexical_index = LexicalIndex(settings.LEXICAL_INDEX_PATH, k1=settings.BM25_K1, b=settings.BM25_B)
+
+
+if __name__ == '__main__':
+    # Self-contained check on a temporary database.
+    import tempfile
+
+    assert tokenize("Invoice INV-2023-0042 of the SKU ab_12") == ["invoice", "inv-2023-0042", "inv", "2023", "0042", "sku", "ab_12", "ab", "12"]
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], weights=[1.0, 1.0]) == ["a", "c", "b"]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = LexicalIndex(Path(tmp_dir) / "lexical.sqlite3")
+        index.add("u1", ["c1", "c2", "c3"], [
+            "Revenue grew 12 percent in the third quarter.",
+            "| Invoice | Amount |\n|---|---|\n| INV-2023-0042 | 1,200.00 |\n| INV-2023-0043 | 80.00 |",
+            "Costs fell in the third quarter, revenue was flat.",
+        ])
+        index.add("u2", ["x1"], ["INV-2023-0042 belongs to another user."])
+        assert index.search("u1", "What is the amount of invoice INV-2023-0042?", 3)[0][0] == "c2"
+        assert [chunk_id for chunk_id, _ in index.search("u1", "third quarter revenue", 3)][:2] in (["c1", "c3"], ["c3", "c1"])
+        assert all(chunk_id != "x1" for chunk_id, _ in index.search("u1", "INV-2023-0042", 5)), "Users must not see each other's chunks."
+
+        index.add("u1", ["c2"], ["Nothing about invoices any more."]) # Upsert replaces the old postings
+        assert not index.search("u1", "INV-2023-0042", 3) and index.chunk_count("u1") == 3
+        index.remove("u1", ["c1", "c3"])
+        assert index.chunk_count("u1") == 1 and not index.search("u1", "revenue", 3)
+        assert index.rebuild("u1", [("r1", "Rebuilt chunk about revenue.", None)]) == 1 and index.search("u1", "revenue", 1)[0][0] == "r1"
+
+        index.add("u3", ["t1", "t2", "t3"], ["Revenue table", "Revenue section", "Revenue appendix"], [
+            {"original_source": "a.pdf", "content_type": "table_chunk", "table_page": "3"},
+            {"original_source": "a.pdf", "content_type": "text_section", "page": 0, "page_end": 1},
+            {"original_source": "b.pdf", "content_type": "text_section", "page": 7, "page_end": 7},
+        ])
+        assert [chunk_id for chunk_id, _ in index.search("u3", "revenue", 5, ChunkFilter(content_types=("table_chunk",)))] == ["t1"]
+        assert {chunk_id for chunk_id, _ in index.search("u3", "revenue", 5, ChunkFilter(filenames=("a.pdf",)))} == {"t1", "t2"}
+        assert {chunk_id for chunk_id, _ in index.search("u3", "revenue", 5, ChunkFilter(page_ranges=((1, 2),)))} == {"t1", "t2"}
+        assert not index.search("u3", "revenue", 5, ChunkFilter(filenames=("c.pdf",)))
+    print("lexical_index tests completed.")
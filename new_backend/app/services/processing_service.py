@@ -1,31 +1,176 @@
 import os
 import tempfile
 import logging
-from langchain_community.document_loaders import PyPDFLoader
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
 from langchain.docstore.document import Document as LangchainDocument
 
 from ..core.config import settings # Relative import from core
-from ..core.utils import split_by_sections, extract_tables_from_pdf # Relative import from utils
+from ..core import utils, pdf_workers
+from . import vectorstore_service
+from .artifact_cache import artifact_cache
+from .blob_store import blob_store
+from .chunk_filter import normalize_chunk_metadata
+from .chunk_manifest import chunk_manifest, file_content_hash
+from .embedding_cache import EmbeddingCacheStats
+from .embedding_pipeline import EmbeddingPipelineMetrics
+from .job_queue import ProgressCallback
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=settings.LOG_LEVEL)
 
+
+def _report(progress_callback: Optional[ProgressCallback], stage: str, state: str, detail: Optional[str] = None) -> None:
+    if progress_callback is not None:
+        progress_callback(stage, state, detail)
+
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def _get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Returns the shared PDF processing pool, creating it on first use.
+    Workers are spawned (not forked, since the API process runs threads and event loops),
+    run with a memory cap and are recycled after PROCESSING_MAX_TASKS_PER_CHILD tasks.
+    Returns None when PROCESSING_POOL_WORKERS is 0 (in-process mode).
+    """
+    global _process_pool
+    if settings.PROCESSING_POOL_WORKERS <= 0:
+        return None
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=settings.PROCESSING_POOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=pdf_workers.init_worker,
+                initargs=(settings.PROCESSING_WORKER_MEMORY_LIMIT_MB,),
+                max_tasks_per_child=settings.PROCESSING_MAX_TASKS_PER_CHILD or None
+            )
+            logger.info(f"Started PDF processing pool with {settings.PROCESSING_POOL_WORKERS} worker process(es).")
+        return _process_pool
+
+
+def _discard_process_pool(broken_pool: ProcessPoolExecutor) -> None:
+    """Drops a pool whose worker died (e.g. killed for exceeding memory), so the next call starts a fresh one."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is broken_pool:
+            _process_pool = None
+    broken_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_process_pool() -> None:
+    global _process_pool
+    with _process_pool_lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _map_in_pool(fn: Callable, tasks: list[tuple]) -> list:
+    """
+    Runs fn(*task) for every task in the process pool (or inline if the pool is disabled)
+    and returns the results in task order, so merged output is deterministic.
+    """
+    pool = _get_process_pool()
+    if pool is None or not tasks:
+        return [fn(*task) for task in tasks]
+    futures = [pool.submit(fn, *task) for task in tasks]
+    try:
+        return [future.result() for future in futures]
+    except BrokenProcessPool as e:
+        _discard_process_pool(pool)
+        raise RuntimeError("A PDF processing worker died, most likely after exceeding its memory cap.") from e
+
+
+def _page_ranges(pages: list[int], pages_per_task: int) -> list[tuple[int, int]]:
+    """Groups sorted 0-based page numbers into consecutive (start, end) ranges of at most pages_per_task pages."""
+    step = max(1, pages_per_task)
+    ranges: list[tuple[int, int]] = []
+    for page in pages:
+        if ranges and ranges[-1][1] == page and page - ranges[-1][0] < step:
+            ranges[-1] = (ranges[-1][0], page + 1)
+        else:
+            ranges.append((page, page + 1))
+    return ranges
+
+
+def _cached_page_artifacts(
+    content_hash: str,
+    extractor: str,
+    pages: list[int],
+    compute: Callable[[list[int]], dict[int, Any]]
+) -> tuple[dict[int, Any], int]:
+    """
+    Returns {page: artifact} for `pages`, taking what the artifact cache has and calling
+    compute(missing_pages) for the rest (whose results are cached). Also returns the number
+    of cache hits. Pages compute() leaves out (failures) are missing from the result.
+    """
+    cached = artifact_cache.get_pages(content_hash, extractor, pages) if artifact_cache is not None else {}
+    missing = [page for page in pages if page not in cached]
+    computed = compute(missing) if missing else {}
+    if artifact_cache is not None:
+        artifact_cache.put_pages(content_hash, extractor, computed)
+    return {**cached, **computed}, len(cached)
+
+
+def _section_chunks(sections: list[utils.DocumentSection]) -> list[list[tuple[str, int, int]]]:
+    """
+    (text, first page, last page) chunks of each section: the whole section if it fits
+    SECTION_CHUNK_MAX_TOKENS, else token-sized pieces cut at paragraph/sentence breaks with
+    SECTION_CHUNK_OVERLAP_TOKENS of overlap. All sections are split in one batch.
+    """
+    spans_per_section = utils.split_texts_by_tokens(
+        [section.text for section in sections],
+        max_tokens=settings.SECTION_CHUNK_MAX_TOKENS,
+        overlap_tokens=settings.SECTION_CHUNK_OVERLAP_TOKENS
+    )
+    chunks_per_section = []
+    for section, spans in zip(sections, spans_per_section):
+        chunks = [(section.text[start:end], section.page_at(start), section.page_at(end - 1)) for start, end in spans]
+        if chunks: # The header may sit at the end of the previous page
+            chunks[0] = (chunks[0][0], section.page_start, chunks[0][2])
+        chunks_per_section.append(chunks)
+    return chunks_per_section
+
+
 def process_uploaded_pdf(
     uploaded_file_path: str, # Path to the already saved uploaded file
     original_filename: str,
-    user_id: str # For logging or future user-specific processing rules
+    user_id: str, # For logging or future user-specific processing rules
+    progress_callback: Optional[ProgressCallback] = None, # Receives (stage, state, detail) updates
+    pages: Optional[list[int]] = None, # 0-based pages to process (all pages if None)
+    content_hash: Optional[str] = None, # sha256 of the file, computed if not given
+    raise_on_error: bool = False # Re-raise processing failures instead of returning partial results
 ) -> list[LangchainDocument]:
     """
     Processes a single uploaded PDF file:
-    1. Loads PDF content using PyPDFLoader.
-    2. Splits text content by sections using custom logic.
-    3. Extracts tables using Camelot with OCR fallback.
+    1. Extracts the text of each page with pypdf.
+    2. Splits text content by sections using custom logic (sections may span pages), and
+       sections longer than SECTION_CHUNK_MAX_TOKENS into overlapping token-sized chunks.
+    3. Extracts tables using Camelot (on the pages that may hold a table) with OCR fallback.
     4. Combines all processed parts into a list of Langchain Document objects.
 
+    Steps 1-3 run on page ranges of PROCESSING_PAGES_PER_TASK pages in the shared process
+    pool, and the results are merged back in page order. Passing `pages` restricts all
+    steps to those pages (incremental re-indexing). Per-page page text, Camelot tables and
+    OCR text are kept in the artifact cache under the file's content hash, so a retry or
+    re-index of the same content skips the extraction and only re-chunks.
+
     Args:
         uploaded_file_path: The path to the PDF file saved on the server.
         original_filename: The original name of the uploaded file (for metadata).
         user_id: Identifier for the user who uploaded the file.
+        progress_callback: Optional callable notified as the parse, sections and tables stages run.
+        pages: Optional sorted list of 0-based page numbers to process instead of the whole file.
+        content_hash: Optional sha256 of the file (the artifact cache key).
+        raise_on_error: If True, a failure in any step is re-raised (the job queue retries
+            it) instead of returning the chunks produced before it.
 
     Returns:
         A list of Langchain Document objects, ready for embedding and storage.
@@ -36,67 +181,117 @@ def process_uploaded_pdf(
     logger.info(f"Starting processing for PDF: '{original_filename}' for user '{user_id}' from path: {uploaded_file_path}")
 
     try:
-        # 1. Load PDF text content
+        # 1. Extract PDF text content (and split each page into sections) per page range
         logger.debug(f"Loading PDF content from: {uploaded_file_path}")
-        loader = PyPDFLoader(uploaded_file_path)
-        raw_docs_from_pdf = loader.load()
-        logger.info(f"Loaded {len(raw_docs_from_pdf)} raw pages/documents from '{original_filename}'.")
-
-        # 2. Process text content (split by sections)
-        for raw_doc in raw_docs_from_pdf:
-            page_content = raw_doc.page_content
-            source_metadata = { # Base metadata from PyPDFLoader
-                **raw_doc.metadata, # Includes 'source' (path) and 'page'
-                "original_source": original_filename, # Add original filename
-                "user_id": user_id,
-                "content_type": "text_section"
-            }
-
-            sections = split_by_sections(page_content)
-            if sections:
-                for section_title, section_text in sections:
-                    # Create a new document for each section
-                    section_doc = LangchainDocument(
-                        page_content=f"# {section_title}\n\n{section_text}", # Add title to content
-                        metadata={
-                            **source_metadata,
-                            "section_title": section_title,
-                        }
-                    )
-                    processed_documents.append(section_doc)
-                logger.debug(f"Split page {source_metadata.get('page', 'N/A')} into {len(sections)} sections.")
-            else:
-                # If no sections detected, add the whole page content as one document
-                logger.debug(f"No sections found on page {source_metadata.get('page', 'N/A')}, adding as whole.")
-                plain_text_doc = LangchainDocument(
-                    page_content=page_content,
-                    metadata=source_metadata
+        _report(progress_callback, "parse", "running")
+        if pages is None:
+            pages = list(range(pdf_workers.get_page_count(uploaded_file_path)))
+        if content_hash is None:
+            content_hash = file_content_hash(uploaded_file_path)
+
+        def extract_pages(missing: list[int]) -> dict[int, dict]:
+            page_ranges = _page_ranges(missing, settings.PROCESSING_PAGES_PER_TASK)
+            range_results = _map_in_pool(
+                pdf_workers.extract_page_range,
+                [(uploaded_file_path, start, end) for start, end in page_ranges]
+            )
+            logger.info(f"Parsed {len(missing)} page(s) of '{original_filename}' in {len(page_ranges)} range(s).")
+            return {page["metadata"]["page"]: page for range_pages in range_results for page in range_pages}
+
+        pages_by_number, cached_pages = _cached_page_artifacts(content_hash, pdf_workers.PAGE_TEXT_EXTRACTOR, pages, extract_pages)
+        extracted_pages = []
+        for page_number in sorted(pages_by_number):
+            page = pages_by_number[page_number]
+            page["metadata"] = {**page["metadata"], "source": uploaded_file_path} # Cached pages may come from another path
+            extracted_pages.append(page)
+        logger.info(f"Loaded {len(extracted_pages)} raw pages/documents from '{original_filename}' ({cached_pages} from the artifact cache).")
+        _report(progress_callback, "parse", "done", f"{len(extracted_pages)} page(s)")
+
+        # 2. Process text content (split by sections). Each run of consecutive pages is split in
+        # one pass, so a section continues across page breaks and carries the pages it spans
+        _report(progress_callback, "sections", "running")
+        pages_by_number = {page["metadata"]["page"]: page for page in extracted_pages}
+        sections = []
+        for run_start, run_end in _page_ranges(sorted(pages_by_number), len(pages_by_number)):
+            run_sections = utils.split_document_sections([(n, pages_by_number[n]["text"]) for n in range(run_start, run_end)])
+            logger.debug(f"Split pages {run_start}-{run_end - 1} into {len(run_sections)} sections.")
+            sections.extend(run_sections)
+        # Oversized sections are cut into token-sized chunks (all sections in one batch)
+        for section, chunks in zip(sections, _section_chunks(sections)):
+            for chunk_index, (chunk_text, chunk_start, chunk_end) in enumerate(chunks):
+                # Create a new document for each section chunk
+                section_doc = LangchainDocument(
+                    page_content=f"# {section.title}\n\n{chunk_text}", # Add title to content
+                    metadata=normalize_chunk_metadata({
+                        **pages_by_number[chunk_start]["metadata"], # As PyPDFLoader would produce it, incl. 'source' and 'page'
+                        "original_source": original_filename, # Add original filename
+                        "user_id": user_id,
+                        "content_type": "text_section",
+                        "section_title": section.title,
+                        "page_end": chunk_end,
+                        "section_page_start": section.page_start,
+                        "section_page_end": section.page_end,
+                        "section_chunk_index": chunk_index,
+                        "section_chunk_count": len(chunks),
+                    }) # Typed filter fields (file, content type, pages, section title)
                 )
-                processed_documents.append(plain_text_doc)
+                processed_documents.append(section_doc)
 
         logger.info(f"Processed text content from '{original_filename}', generated {len(processed_documents)} text documents.")
+        _report(progress_callback, "sections", "done", f"{len(processed_documents)} text section(s)")
 
-        # 3. Extract and process tables
-        # extract_tables_from_pdf expects a file path.
+        # 3. Extract and process tables: Camelot per page range, OCR fallback only if Camelot found nothing
         logger.info(f"Starting table extraction for '{original_filename}'.")
-        table_chunks_data = extract_tables_from_pdf(uploaded_file_path, original_filename)
+        _report(progress_callback, "tables", "running")
+        table_chunks_data = []
+        if utils.camelot is not None:
+            # Only pages the pre-pass flagged are rendered by Camelot, in small tasks spread over the pool
+            if settings.TABLE_PREPASS_ENABLED:
+                table_pages = [page["metadata"]["page"] for page in extracted_pages if page["table_candidate"]]
+            else:
+                table_pages = [page["metadata"]["page"] for page in extracted_pages]
+            logger.info(f"{len(table_pages)} of {len(extracted_pages)} page(s) of '{original_filename}' are table candidates.")
+
+            def extract_tables(missing: list[int]) -> dict[int, list[dict]]:
+                step = max(1, settings.TABLE_PAGES_PER_TASK)
+                tasks = [(uploaded_file_path, missing[i:i + step]) for i in range(0, len(missing), step)]
+                return {page: tables for result in _map_in_pool(pdf_workers.extract_camelot_tables_pages, tasks) if result for page, tables in result.items()}
+
+            tables_by_page, _ = _cached_page_artifacts(content_hash, pdf_workers.CAMELOT_EXTRACTOR, table_pages, extract_tables)
+            raw_tables = [table for page in sorted(tables_by_page) for table in tables_by_page[page]]
+            table_chunks_data = utils.camelot_table_chunks(raw_tables, original_filename)
+        if not table_chunks_data and utils.convert_from_path is not None and utils.pytesseract is not None:
+            # Only pages without a text layer (scans) or flagged as table candidates are OCR'd, one page per task
+            ocr_pages = [page["metadata"]["page"] for page in extracted_pages if not page["text"] or page["table_candidate"]]
+            logger.info(f"Camelot found no tables in '{original_filename}' or is unavailable. Running OCR fallback on {len(ocr_pages)} page(s).")
+
+            def ocr_missing_pages(missing: list[int]) -> dict[int, str]:
+                results = _map_in_pool(pdf_workers.ocr_pages, [(uploaded_file_path, [page]) for page in missing])
+                return {page: text for result in results for page, text in result.items()}
+
+            texts_by_page, _ = _cached_page_artifacts(content_hash, pdf_workers.OCR_EXTRACTOR, ocr_pages, ocr_missing_pages)
+            segments = [utils.ocr_table_segment(texts_by_page[page], original_filename, page + 1) for page in sorted(texts_by_page)]
+            table_chunks_data = [segment for segment in segments if segment is not None]
 
         for table_data in table_chunks_data:
             # table_data is a dict with "content" and "metadata"
-            # "metadata" from extract_tables_from_pdf already includes "original_source"
+            # "metadata" from the table extractors already includes "original_source"
             table_doc = LangchainDocument(
                 page_content=table_data["content"],
-                metadata={
+                metadata=normalize_chunk_metadata({
                     **table_data["metadata"], # Contains original_source, table_page, etc.
                     "user_id": user_id,
                     "content_type": "table_chunk"
-                }
+                }) # Adds the 0-based page/page_end of table_page, so page filters cover tables
             )
             processed_documents.append(table_doc)
         logger.info(f"Extracted {len(table_chunks_data)} table chunks from '{original_filename}'.")
+        _report(progress_callback, "tables", "done", f"{len(table_chunks_data)} table chunk(s)")
 
     except Exception as e:
         logger.error(f"Error during processing of '{original_filename}' for user '{user_id}': {e}", exc_info=True)
+        if raise_on_error:
+            raise
         # Depending on desired behavior, could raise exception or return partially processed docs.
         # For now, return what has been processed so far, or an empty list if major failure.
         return processed_documents # Or [] if preferred to signify complete failure
@@ -105,6 +300,144 @@ def process_uploaded_pdf(
     return processed_documents
 
 
+def run_processing_job(job: dict, progress_callback: ProgressCallback) -> dict:
+    """
+    Job handler for the background processing queue: processes one staged file end to end
+    (parse, sections, tables, embed, persist) and returns its FileProcessStatus fields.
+
+    Retries are idempotent: chunk IDs are derived from the file name and chunk content, so
+    re-running a job upserts the same records instead of duplicating them, and a job that
+    already moved its file out of staging before being interrupted is reported as done.
+    Re-processing a file that is already indexed is incremental (INCREMENTAL_INDEXING_ENABLED):
+    only pages whose hash changed are parsed and embedded again, the chunks of the other
+    pages are kept, and the chunks of changed or removed pages that are no longer produced
+    are deleted.
+    Raises on failures that should be retried by the queue.
+    """
+    user_id = job["user_id"]
+    filename = job["filename"]
+    staged_file_path = settings.STAGED_FILES_DIR / user_id / filename
+    user_processed_dir = settings.UPLOADED_FILES_DIR / user_id # For successfully processed files
+    user_processed_dir.mkdir(parents=True, exist_ok=True)
+    processed_file_path = user_processed_dir / filename
+    file_status = {"filename": filename, "status": "pending"}
+
+    if not staged_file_path.exists():
+        if job["attempts"] > 1 and processed_file_path.exists():
+            # An earlier attempt got as far as moving the file; everything before that is already stored.
+            logger.info(f"Job for '{filename}' (user '{user_id}') already persisted by a previous attempt.")
+            return {**file_status, "status": "processed_successfully", "message": "File was processed by a previous attempt."}
+        logger.warning(f"File '{filename}' not found in staging for user '{user_id}'.")
+        return {**file_status, "status": "file_not_found_in_staging", "message": "File was not found in the staging area."}
+
+    logger.info(f"Processing '{filename}' for user '{user_id}' from '{staged_file_path}'.")
+    content_hash = file_content_hash(staged_file_path)
+    fingerprints = _map_in_pool(pdf_workers.fingerprint_pages, [(str(staged_file_path),)])[0]
+    page_hashes = fingerprints["page_hashes"]
+
+    # Incremental re-index: only pages whose hash changed are processed again, the chunks of
+    # the other pages stay in the store as they are
+    previous = chunk_manifest.get_page_index(user_id, filename) if settings.INCREMENTAL_INDEXING_ENABLED else None
+    pages_to_process = None
+    kept_chunks = []
+    if previous is not None:
+        changed_pages = {
+            page for page, page_hash in enumerate(page_hashes)
+            if page >= len(previous.page_hashes) or previous.page_hashes[page] != page_hash
+        }
+        # Sections span pages, so a section is re-split as a whole when any of its pages changed:
+        # grow the changed pages to cover every chunk span they touch. The page before a change
+        # is included too, since the changed page may have lost the header that ended that section.
+        changed = changed_pages | {page - 1 for page in changed_pages if page > 0}
+        spans = [
+            set(range(chunk.page, (chunk.page if chunk.page_end is None else chunk.page_end) + 1))
+            for chunks in previous.chunks_by_page.values() for chunk in chunks
+        ]
+        grown = True
+        while grown:
+            grown = False
+            for span in spans:
+                if span & changed and not span <= changed:
+                    changed |= span
+                    grown = True
+        pages_to_process = sorted(page for page in changed if page < len(page_hashes))
+        kept_chunks = [
+            chunk for page in range(len(page_hashes)) if page not in changed
+            for chunk in previous.chunks_by_page.get(page, [])
+        ]
+        logger.info(
+            f"Re-indexing '{filename}' for user '{user_id}' incrementally: {len(pages_to_process)} of "
+            f"{len(page_hashes)} page(s) changed, keeping {len(kept_chunks)} chunk(s)."
+        )
+    file_status["pages_total"] = len(page_hashes)
+    file_status["pages_reprocessed"] = len(page_hashes) if pages_to_process is None else len(pages_to_process)
+    file_status["chunks_reused"] = len(kept_chunks)
+
+    processed_docs = process_uploaded_pdf(
+        uploaded_file_path=str(staged_file_path),
+        original_filename=filename,
+        user_id=user_id,
+        progress_callback=progress_callback,
+        pages=pages_to_process,
+        content_hash=content_hash,
+        raise_on_error=True # Partial output would be indexed as the whole file, replacing its previous version
+    )
+
+    if not processed_docs and not kept_chunks:
+        logger.warning(f"No processable content in '{filename}' for user '{user_id}'.")
+        return {**file_status, "status": "processing_no_content", "message": "No processable text or table content was extracted."}
+
+    file_status["table_chunks_extracted"] = sum(1 for doc in processed_docs if doc.metadata.get("content_type") == "table_chunk")
+    file_status["text_sections_extracted"] = sum(1 for doc in processed_docs if doc.metadata.get("content_type") == "text_section")
+    file_status["total_chunks_processed"] = len(processed_docs)
+
+    logger.info(f"Adding {len(processed_docs)} chunks of '{filename}' to vector store for user '{user_id}'.")
+    _report(progress_callback, "embed", "running", f"0/{len(processed_docs)} chunk(s)")
+    cache_stats = EmbeddingCacheStats()
+    pipeline_metrics = EmbeddingPipelineMetrics()
+    chunk_ids = vectorstore_service.compute_chunk_ids(filename, processed_docs)
+    if processed_docs:
+        success_add = vectorstore_service.add_documents_to_store(
+            user_id=user_id,
+            documents=processed_docs,
+            ids=chunk_ids,
+            cache_stats=cache_stats,
+            pipeline_metrics=pipeline_metrics,
+            progress_callback=lambda done, total: _report(progress_callback, "embed", "running", f"{done}/{total} chunk(s)")
+        )
+        if not success_add:
+            raise RuntimeError("Failed to add processed document chunks to the vector store.")
+    if kept_chunks and previous.document_hash != fingerprints["document_hash"]:
+        # e.g. a new modification date or page count: refresh it on the chunks that were kept
+        vectorstore_service.update_chunk_metadata(user_id, [chunk.chunk_id for chunk in kept_chunks], fingerprints["document_metadata"])
+    _report(progress_callback, "embed", "done", f"{len(processed_docs)} chunk(s)")
+
+    file_status["embedding_cache_hits"] = cache_stats.hits
+    file_status["embedding_cache_misses"] = cache_stats.misses
+    file_status["embedding_cache_hit_ratio"] = round(cache_stats.hit_ratio, 4)
+    file_status["embedding_tokens_saved"] = cache_stats.tokens_saved
+    file_status["embedding_batches"] = pipeline_metrics.batches
+    file_status["embedding_batches_per_second"] = round(pipeline_metrics.batches_per_second, 4)
+    file_status["embedding_tokens_per_second"] = round(pipeline_metrics.tokens_per_second, 2)
+
+    # Record the file's chunks in the manifest (dropping chunks of a previous version), then
+    # move it from staging to processed
+    _report(progress_callback, "persist", "running")
+    stale_chunks = vectorstore_service.record_indexed_file(
+        user_id, filename, content_hash, chunk_ids, processed_docs,
+        page_hashes=page_hashes,
+        document_hash=fingerprints["document_hash"],
+        kept_chunks=kept_chunks
+    )
+    if stale_chunks:
+        file_status["stale_chunks_deleted"] = stale_chunks
+    blob_store.move(staged_file_path, processed_file_path)
+    logger.info(f"Moved '{filename}' from staging to processed directory for user '{user_id}'.")
+    _report(progress_callback, "persist", "done")
+
+    return {**file_status, "status": "processed_successfully", "message": "File processed and indexed successfully."}
+
+
 from pathlib import Path # Added for __main__ block
 
 if __name__ == '__main__':
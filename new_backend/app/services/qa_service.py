@@ -1,14 +1,22 @@
+import asyncio
 import logging
+import time
+from dataclasses import dataclass, field
 from langchain_openai import ChatOpenAI
-from langchain.chains import RetrievalQA
+from langchain_core.prompt_values import ChatPromptValue
 from langchain_core.prompts import ChatPromptTemplate
 
-from . import vectorstore_service # Relative import for sibling service
+from . import answer_cache, reranker, vectorstore_service # Relative imports for sibling services
+from .chunk_filter import ChunkFilter
+from .context_packer import PackedContext, pack_context
+from .reranker import RerankResult
 from ..core.config import settings # Relative import for config
+from ..core.http_client import openai_async_http_client
+from ..core.utils import estimate_token_count
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=settings.LOG_LEVEL)
-from typing import Optional, Tuple, List, Dict
+from typing import AsyncIterator, Optional, Tuple, List, Dict
 
 # Initialize ChatOpenAI LLM
 # This will use OPENAI_API_KEY from environment (via settings)
@@ -16,6 +24,8 @@ try:
     llm = ChatOpenAI(
         openai_api_key=settings.OPENAI_API_KEY,
         model_name=settings.QA_MODEL_NAME, # e.g., "gpt-4o-mini-2024-07-18"
+        openai_api_base=settings.OPENAI_BASE_URL,
+        http_async_client=openai_async_http_client, # Pooled connections shared by concurrent async requests
         temperature=0.1 # Lower temperature for more factual, less creative answers from RAG
     )
     logger.info(f"Successfully initialized ChatOpenAI model: {settings.QA_MODEL_NAME}")
@@ -46,13 +56,77 @@ if the language is spanish and the answer is not in the context, say this: "Lo s
 
 prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE_STR)
 
-def get_answer(question: str, user_id: str) -> Tuple[Optional[str], List[Dict]]:
+# Number of chunks used as context when the caller does not say (QueryRequest.top_k default)
+DEFAULT_TOP_K = 5
+
+
+def _source_info(doc) -> Dict:
+    """Source metadata returned to the client for a retrieved chunk."""
+    source_info = {
+        "filename": doc.metadata.get("original_source", doc.metadata.get("source", "Unknown")),
+        "page": doc.metadata.get("page", None), # PyPDFLoader adds 'page'
+        "page_end": doc.metadata.get("page_end", None), # Last page of a section chunk that spans pages
+        "content_type": doc.metadata.get("content_type", "text"),
+        "section_title": doc.metadata.get("section_title", None), # If from section splitting
+        "table_page": doc.metadata.get("table_page", None), # If from table extraction
+        "preview": doc.page_content[:200] + "..." # Short preview
+    }
+    # Filter out None values from metadata for cleaner output
+    return {k: v for k, v in source_info.items() if v is not None}
+
+
+def _retrieval_depth(top_k: int) -> int:
+    """Candidates fetched for top_k chunks, leaving room for the ones the packer drops (and for the reranker to choose from)."""
+    overfetch = settings.QA_RETRIEVAL_OVERFETCH
+    if reranker.active_reranker is not None:
+        overfetch = max(overfetch, settings.RERANK_OVERFETCH)
+    return top_k * max(1, overfetch)
+
+
+def _rerank_top_n(top_k: int) -> int:
+    """Chunks packed from reranked candidates: top_k, capped by RERANK_TOP_N when it is set."""
+    return min(top_k, settings.RERANK_TOP_N) if settings.RERANK_TOP_N > 0 else top_k
+
+
+def _build_prompt(question: str, results: list, top_k: int, reranked: Optional[RerankResult] = None) -> Tuple[PackedContext, ChatPromptValue, int, int]:
+    """
+    The "format" stage: packs the best chunks into the context token budget and stuffs
+    them into the prompt built once at import. With reranked candidates the best
+    _rerank_top_n(top_k) are packed, and the tokens saved are measured against packing as
+    many chunks in retrieval order, so they count what reranking changed, not the cap.
+    Returns (packed context, prompt, prompt tokens, prompt tokens saved).
+    """
+    if reranked is None:
+        packed = pack_context(results, top_k)
+        tokens_saved = 0
+    else:
+        top_n = _rerank_top_n(top_k)
+        packed = pack_context(reranked.results, top_n)
+        baseline = pack_context(results[:top_k * max(1, settings.QA_RETRIEVAL_OVERFETCH)], top_n)
+        tokens_saved = baseline.context_tokens - packed.context_tokens
+    prompt = prompt_template.format_prompt(context=packed.text, question=question)
+    prompt_tokens = estimate_token_count(prompt.to_string(), settings.QA_MODEL_NAME)
+    return packed, prompt, prompt_tokens, tokens_saved
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+# Answering is a lean retrieve -> rerank -> format -> generate pipeline instead of a RetrievalQA
+# chain: the prompt template and the LLM client are built once at import, and only retrieval is
+# bound to the user per request. Every answer reports how long each stage took.
+
+def get_answer(question: str, user_id: str, top_k: int = DEFAULT_TOP_K, filters: Optional[ChunkFilter] = None) -> Tuple[Optional[str], List[Dict]]:
     """
     Answers a question based on documents in the user's vector store using RAG.
+    Synchronous counterpart of aget_answer for scripts and worker threads (no answer cache).
 
     Args:
         question: The user's question.
         user_id: The ID of the user.
+        top_k: Maximum number of chunks used as context.
+        filters: Only chunks matching this metadata filter are searched.
 
     Returns:
         A tuple containing:
@@ -64,60 +138,242 @@ def get_answer(question: str, user_id: str) -> Tuple[Optional[str], List[Dict]]:
         return "LLM is not configured or available.", []
 
     logger.info(f"Received question from user '{user_id}': '{question}'")
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
 
-    # 1. Get the retriever for the user
-    # Using search_kwargs as defined in user's original get_qa_chain: {'k': 15}
-    retriever = vectorstore_service.get_retriever(user_id, search_kwargs={'k': 15})
-    if not retriever:
-        logger.warning(f"Could not get retriever for user {user_id}. Answering without document context might be unreliable or not possible.")
-        # Fallback: answer without context, or inform user context is unavailable.
-        # For now, let the RetrievalQA chain handle it (it might get no docs).
-        # If retriever is None, it means no vector store, so no context.
-        # The prompt asks LLM to state if answer not in context.
-        # To be absolutely sure no error, we can return a specific message:
+    # 1. Retrieve
+    try:
+        results = vectorstore_service.similarity_search_with_score(user_id, question, k=_retrieval_depth(top_k), where=filters)
+    except Exception as e:
+        logger.error(f"Error retrieving documents for user {user_id} with question '{question}': {e}", exc_info=True)
+        return "An error occurred while trying to find an answer.", []
+    if results is None:
+        logger.warning(f"Could not search the vector store for user {user_id}.")
         return "Could not access your documents to answer the question. Please ensure documents are processed.", []
+    timings["retrieve"] = _elapsed_ms(started)
+
+    # 2. Rerank
+    reranked = None
+    if reranker.active_reranker is not None:
+        stage_started = time.perf_counter()
+        reranked = reranker.rerank(question, results)
+        timings["rerank"] = _elapsed_ms(stage_started)
+
+    # 3. Format the prompt
+    stage_started = time.perf_counter()
+    packed, prompt, prompt_tokens, tokens_saved = _build_prompt(question, results, top_k, reranked)
+    source_documents = packed.documents
+    timings["format"] = _elapsed_ms(stage_started)
+
+    # 4. Generate
+    stage_started = time.perf_counter()
+    try:
+        answer = llm.invoke(prompt).content
+    except Exception as e:
+        logger.error(f"Error generating answer for user {user_id} with question '{question}': {e}", exc_info=True)
+        return "An error occurred while trying to find an answer.", []
+    timings["generate"] = _elapsed_ms(stage_started)
+    timings["total"] = _elapsed_ms(started)
 
+    source_documents_data = [_source_info(doc) for doc in source_documents]
+    logger.info(f"Successfully generated answer for user '{user_id}'. Answer length: {len(answer) if answer else 0}, Sources found: {len(source_documents_data)}, prompt tokens: {prompt_tokens} ({tokens_saved} saved by reranking), timings (ms): {timings}")
+    return answer, source_documents_data
 
-    # 2. Create RetrievalQA chain
+
+@dataclass
+class AnswerResult:
+    answer: str
+    sources: List[Dict]
+    from_cache: bool = False # True if the answer came from the semantic answer cache
+    timings_ms: Dict[str, float] = field(default_factory=dict) # Per stage: retrieve, rerank, format, generate, total
+    prompt_tokens: int = 0 # Tokens sent to the LLM (0 for cached answers)
+    prompt_tokens_saved: int = 0 # Context tokens the reranker kept out of the prompt
+
+
+async def _aretrieve(question: str, user_id: str, top_k: int, filters: Optional[ChunkFilter] = None) -> Tuple[List[float], Optional[list]]:
+    """Embeds the question and returns (question vector, [(document, distance)]), or None results if the user has no store."""
+    question_vector = await vectorstore_service.aembed_query(question)
+    results = await vectorstore_service.asimilarity_search_by_vector_with_score(
+        user_id, question_vector, k=_retrieval_depth(top_k), query=question, where=filters
+    )
+    return question_vector, results
+
+
+async def _arerank(question: str, results: list, timings: Dict[str, float]) -> Optional[RerankResult]:
+    """The "rerank" stage (None when no reranker is configured), scored in a worker thread."""
+    if reranker.active_reranker is None:
+        return None
+    stage_started = time.perf_counter()
+    reranked = await reranker.arerank(question, results)
+    timings["rerank"] = _elapsed_ms(stage_started)
+    return reranked
+
+
+async def aget_answer(
+    question: str,
+    user_id: str,
+    top_k: int = DEFAULT_TOP_K,
+    bypass_cache: bool = False,
+    filters: Optional[ChunkFilter] = None
+) -> AnswerResult:
+    """
+    Async variant of get_answer for the API: retrieval and generation use async clients
+    (or worker threads for local Chroma I/O), so a slow answer never blocks the event loop
+    and one worker can serve many questions concurrently.
+
+    At most `top_k` chunks are used as context, packed into the context token budget.
+    `filters` restricts the search to chunks matching a metadata filter (files, content
+    types, page ranges, section titles). Answers are served from the semantic answer cache when a similar question was already
+    answered from the same context chunks. `bypass_cache` forces a fresh answer (which
+    then replaces the cached one).
+    """
+    if not llm:
+        logger.error(f"LLM not available for user {user_id}. Cannot generate answer.")
+        return AnswerResult("LLM is not configured or available.", [])
+
+    logger.info(f"Received question from user '{user_id}': '{question}'")
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    # 1. Retrieve
     try:
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff", # "stuff" is good for smaller contexts that fit in one prompt
-            retriever=retriever,
-            chain_type_kwargs={"prompt": prompt_template},
-            return_source_documents=True # We need this to list sources
-        )
-        logger.debug(f"RetrievalQA chain created for user {user_id}.")
+        question_vector, results = await _aretrieve(question, user_id, top_k, filters)
     except Exception as e:
-        logger.error(f"Error creating RetrievalQA chain for user {user_id}: {e}", exc_info=True)
-        return "Error setting up the question answering process.", []
-
-    # 3. Invoke the chain to get the result
+        logger.error(f"Error retrieving documents for user {user_id} with question '{question}': {e}", exc_info=True)
+        return AnswerResult("An error occurred while trying to find an answer.", [])
+    if results is None:
+        logger.warning(f"Could not search the vector store for user {user_id}.")
+        return AnswerResult("Could not access your documents to answer the question. Please ensure documents are processed.", [])
+    timings["retrieve"] = _elapsed_ms(started)
+
+    # 2. Rerank
+    reranked = await _arerank(question, results, timings)
+
+    # 3. Format the prompt
+    stage_started = time.perf_counter()
+    packed, prompt, prompt_tokens, tokens_saved = _build_prompt(question, results, top_k, reranked)
+    source_documents = packed.documents
+    chunk_ids = [doc.metadata["chunk_id"] for doc in source_documents]
+    timings["format"] = _elapsed_ms(stage_started)
+
+    cached = answer_cache.lookup_answer(user_id, question_vector, chunk_ids, bypass_cache)
+    if cached is not None:
+        timings["total"] = _elapsed_ms(started)
+        logger.info(f"Serving cached answer for user '{user_id}' (originally asked as '{cached.question}'), timings (ms): {timings}")
+        return AnswerResult(cached.answer, cached.sources, from_cache=True, timings_ms=timings)
+
+    # 4. Generate
+    stage_started = time.perf_counter()
     try:
-        result = qa_chain.invoke({"query": question}) # 'query' is the default input key for RetrievalQA
-        answer = result.get("result")
-
-        source_documents_data = []
-        if result.get("source_documents"):
-            for doc in result["source_documents"]:
-                source_info = {
-                    "filename": doc.metadata.get("original_source", doc.metadata.get("source", "Unknown")),
-                    "page": doc.metadata.get("page", None), # PyPDFLoader adds 'page'
-                    "content_type": doc.metadata.get("content_type", "text"),
-                    "section_title": doc.metadata.get("section_title", None), # If from section splitting
-                    "table_page": doc.metadata.get("table_page", None), # If from table extraction
-                    "preview": doc.page_content[:200] + "..." # Short preview
-                }
-                # Filter out None values from metadata for cleaner output
-                source_info = {k: v for k, v in source_info.items() if v is not None}
-                source_documents_data.append(source_info)
-
-        logger.info(f"Successfully generated answer for user '{user_id}'. Answer length: {len(answer) if answer else 0}, Sources found: {len(source_documents_data)}")
-        return answer, source_documents_data
+        answer = (await llm.ainvoke(prompt)).content
+    except Exception as e:
+        logger.error(f"Error generating answer for user {user_id} with question '{question}': {e}", exc_info=True)
+        return AnswerResult("An error occurred while trying to find an answer.", [])
+    timings["generate"] = _elapsed_ms(stage_started)
+
+    source_documents_data = [_source_info(doc) for doc in source_documents]
+    answer_cache.store_answer(user_id, question, question_vector, chunk_ids, answer, source_documents_data)
+    timings["total"] = _elapsed_ms(started)
+    logger.info(f"Successfully generated answer for user '{user_id}'. Answer length: {len(answer) if answer else 0}, Sources found: {len(source_documents_data)}, prompt tokens: {prompt_tokens} ({tokens_saved} saved by reranking), timings (ms): {timings}")
+    return AnswerResult(answer, source_documents_data, timings_ms=timings, prompt_tokens=prompt_tokens, prompt_tokens_saved=tokens_saved)
+
+
+async def astream_answer(
+    question: str,
+    user_id: str,
+    top_k: int = DEFAULT_TOP_K,
+    bypass_cache: bool = False,
+    filters: Optional[ChunkFilter] = None
+) -> AsyncIterator[Tuple[str, object]]:
+    """
+    Streaming variant of aget_answer. Yields (event, data) pairs:
+        ("sources", list[dict])  once, as soon as retrieval finishes
+        ("token", str)           for every piece of the answer streamed by the LLM
+                                 (a cached answer is sent as a single token)
+        ("done", dict)           per-stage timings in ms (retrieve, rerank, format, generate, total,
+                                 time_to_first_token), prompt tokens (and tokens saved by
+                                 reranking) and whether the answer was cached
+        ("error", str)           instead of the remaining events if something fails
+
+    Retrieval (including `filters`), prompt and answer cache are the same as in
+    aget_answer. Closing the generator (e.g. when the client disconnects) aborts the
+    LLM request, so no further tokens are generated for an abandoned query.
+    """
+    if not llm:
+        logger.error(f"LLM not available for user {user_id}. Cannot generate answer.")
+        yield "error", "LLM is not configured or available."
+        return
+
+    logger.info(f"Received streaming question from user '{user_id}': '{question}'")
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
 
+    try:
+        question_vector, results = await _aretrieve(question, user_id, top_k, filters)
     except Exception as e:
-        logger.error(f"Error invoking RetrievalQA chain for user {user_id} with question '{question}': {e}", exc_info=True)
-        return "An error occurred while trying to find an answer.", []
+        logger.error(f"Error retrieving documents for user {user_id} with question '{question}': {e}", exc_info=True)
+        yield "error", "An error occurred while searching your documents."
+        return
+    if results is None:
+        logger.warning(f"Could not search the vector store for user {user_id}. Cannot stream an answer.")
+        yield "error", "Could not access your documents to answer the question. Please ensure documents are processed."
+        return
+    timings["retrieve"] = _elapsed_ms(started)
+
+    reranked = await _arerank(question, results, timings)
+    stage_started = time.perf_counter()
+    packed, prompt, prompt_tokens, tokens_saved = _build_prompt(question, results, top_k, reranked)
+    source_documents = packed.documents
+    chunk_ids = [doc.metadata["chunk_id"] for doc in source_documents]
+    source_documents_data = [_source_info(doc) for doc in source_documents]
+    timings["format"] = _elapsed_ms(stage_started)
+
+    cached = answer_cache.lookup_answer(user_id, question_vector, chunk_ids, bypass_cache)
+    if cached is not None:
+        logger.info(f"Streaming cached answer for user '{user_id}' (originally asked as '{cached.question}').")
+        yield "sources", cached.sources
+        yield "token", cached.answer
+        timings["time_to_first_token"] = timings["total"] = _elapsed_ms(started)
+        yield "done", {"timings_ms": timings, "prompt_tokens": 0, "prompt_tokens_saved": 0, "from_cache": True}
+        return
+    yield "sources", source_documents_data
+
+    # The LLM stream is consumed in its own task: when the client disconnects, the request
+    # task is cancelled by the server and every await in it keeps failing, which would
+    # leave the LLM response open. Cancelling this task instead lets the response close.
+    chunks: asyncio.Queue = asyncio.Queue()
+
+    async def pump_llm_stream() -> None:
+        try:
+            async for chunk in llm.astream(prompt):
+                if chunk.content:
+                    chunks.put_nowait(chunk.content)
+            chunks.put_nowait(None)
+        except Exception as e:
+            chunks.put_nowait(e)
+
+    stage_started = time.perf_counter()
+    producer = asyncio.create_task(pump_llm_stream())
+    answer_parts: List[str] = []
+    try:
+        while (item := await chunks.get()) is not None:
+            if isinstance(item, Exception):
+                logger.error(f"Error streaming answer for user {user_id} with question '{question}': {item}", exc_info=item)
+                yield "error", "An error occurred while trying to find an answer."
+                return
+            if not answer_parts:
+                timings["time_to_first_token"] = _elapsed_ms(started)
+            answer_parts.append(item)
+            yield "token", item
+    finally:
+        producer.cancel() # No-op if the answer is complete; aborts the LLM request otherwise
+    timings["generate"] = _elapsed_ms(stage_started)
+
+    # Only complete answers reach this point, so only those are cached
+    answer_cache.store_answer(user_id, question, question_vector, chunk_ids, "".join(answer_parts), source_documents_data)
+    timings["total"] = _elapsed_ms(started)
+    logger.info(f"Streamed answer for user '{user_id}' in {len(answer_parts)} chunk(s), sources: {len(source_documents)}, prompt tokens: {prompt_tokens} ({tokens_saved} saved by reranking), timings (ms): {timings}")
+    yield "done", {"timings_ms": timings, "prompt_tokens": prompt_tokens, "prompt_tokens_saved": tokens_saved, "from_cache": False}
 
 
 if __name__ == '__main__':
@@ -140,14 +396,11 @@ if __name__ == '__main__':
 
         # Let's first add some dummy data using vectorstore_service directly for this test
         from ..core.config import settings as vs_settings # to avoid name clash
-        from .vectorstore_service import add_documents_to_store, get_vectorstore, delete_documents_from_store
+        from .vectorstore_service import add_documents_to_store, get_vectorstore, delete_documents_from_store, delete_user_store
         from langchain.docstore.document import Document as LangchainDocument
-        import shutil
 
         # Clean up and set up dummy store for qa_service test
-        user_chroma_dir_qa = vs_settings.CHROMA_STORE_DIR / test_user_id_qa
-        if user_chroma_dir_qa.exists():
-            shutil.rmtree(user_chroma_dir_qa)
+        delete_user_store(test_user_id_qa)
 
         vs_qa = get_vectorstore(test_user_id_qa) # Create if not exists
         if vs_qa:
@@ -192,7 +445,6 @@ if __name__ == '__main__':
             print(f"Could not initialize vector store for qa_service test user '{test_user_id_qa}'. Skipping QA tests.")
 
         # Clean up test user data after QA tests
-        if user_chroma_dir_qa.exists():
-            shutil.rmtree(user_chroma_dir_qa)
+        delete_user_store(test_user_id_qa)
         print(f"Cleaned up test data for user {test_user_id_qa} after QA tests.")
         print("qa_service tests completed.")
@@ -0,0 +1,186 @@
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from ..core.config import settings # Relative import from core
+from .vector_codec import code_scores, quantize
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=settings.LOG_LEVEL)
+
+_WRITE_BATCH_SIZE = 500
+
+
+class QuantizedIndex:
+    """
+    Per-user compact codes (int8 or binary, see vector_codec) of the stored chunk vectors,
+    kept in SQLite next to the vector store. A search scans a user's codes for candidates,
+    which the caller re-scores with the float vectors from Chroma, so a query reads 4x
+    (int8) or 32x (binary) fewer bytes than a scan of float vectors and never needs the
+    store's HNSW index in memory. The codes are stored in addition to the float vectors,
+    which Chroma keeps for re-scoring, so the index costs disk rather than saving it.
+
+    It is written together with the Chroma records (`add` upserts by chunk ID) and `remove`
+    drops chunks when Chroma does. The codes of the most recently searched users are kept
+    in memory (`max_cached_users`) until one of their chunks changes.
+    """
+
+    def __init__(self, db_path: Path, scheme: str, max_cached_users: int = 64):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.scheme = scheme
+        self.max_cached_users = max(1, max_cached_users)
+        self._cache: "OrderedDict[str, tuple[list[str], list[bytes], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS codes (
+                user_id TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                scheme TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                code BLOB NOT NULL,
+                PRIMARY KEY (user_id, chunk_id)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.commit()
+
+    def add(self, user_id: str, chunk_ids: list[str], vectors) -> None:
+        """Upserts the codes of chunk vectors (as stored in Chroma)."""
+        if not chunk_ids:
+            return
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        rows = [
+            (user_id, chunk_id, self.scheme, vectors.shape[1], code)
+            for chunk_id, code in zip(chunk_ids, quantize(vectors, self.scheme))
+        ]
+        with self._lock:
+            self._cache.pop(user_id, None)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO codes (user_id, chunk_id, scheme, dimensions, code) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def remove(self, user_id: str, chunk_ids: list[str]) -> None:
+        with self._lock:
+            self._cache.pop(user_id, None)
+            for start in range(0, len(chunk_ids), _WRITE_BATCH_SIZE):
+                batch = chunk_ids[start:start + _WRITE_BATCH_SIZE]
+                self._conn.execute(
+                    f"DELETE FROM codes WHERE user_id = ? AND chunk_id IN ({','.join('?' * len(batch))})", [user_id, *batch]
+                )
+            self._conn.commit()
+
+    def remove_user(self, user_id: str) -> None:
+        with self._lock:
+            self._cache.pop(user_id, None)
+            self._conn.execute("DELETE FROM codes WHERE user_id = ?", (user_id,))
+            self._conn.commit()
+
+    def chunk_count(self, user_id: str, dimensions: int) -> int:
+        """Chunks with a code of the current scheme and vector width (codes left from another scheme or width do not count)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM codes WHERE user_id = ? AND scheme = ? AND dimensions = ?", (user_id, self.scheme, dimensions)
+            ).fetchone()
+        return row[0]
+
+    def chunk_ids(self, user_id: str, dimensions: Optional[int] = None) -> set[str]:
+        """IDs of the user's chunks with a code of the current scheme and, if given, vector width."""
+        query, params = "SELECT chunk_id FROM codes WHERE user_id = ? AND scheme = ?", [user_id, self.scheme]
+        if dimensions is not None:
+            query, params = query + " AND dimensions = ?", params + [dimensions]
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return {row[0] for row in rows}
+
+    def rebuild(self, user_id: str, records: Iterable[tuple[str, list[float]]]) -> int:
+        """Replaces a user's codes with those of (chunk ID, vector) records; returns the number of chunks."""
+        self.remove_user(user_id)
+        count, batch = 0, []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= _WRITE_BATCH_SIZE:
+                self.add(user_id, [chunk_id for chunk_id, _ in batch], [vector for _, vector in batch])
+                count, batch = count + len(batch), []
+        if batch:
+            self.add(user_id, [chunk_id for chunk_id, _ in batch], [vector for _, vector in batch])
+            count += len(batch)
+        return count
+
+    def _user_codes(self, user_id: str, dimensions: int) -> tuple[list[str], list[bytes]]:
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is not None and entry[2] == dimensions:
+                self._cache.move_to_end(user_id)
+                return entry[0], entry[1]
+            rows = self._conn.execute(
+                "SELECT chunk_id, code FROM codes WHERE user_id = ? AND scheme = ? AND dimensions = ?", (user_id, self.scheme, dimensions)
+            ).fetchall()
+            entry = ([row[0] for row in rows], [row[1] for row in rows], dimensions)
+            self._cache[user_id] = entry
+            while len(self._cache) > self.max_cached_users:
+                self._cache.popitem(last=False)
+            return entry[0], entry[1]
+
+    def search(self, user_id: str, query_vector: list[float], limit: int, candidate_ids: Optional[set[str]] = None) -> list[tuple[str, float]]:
+        """
+        The `limit` chunks whose codes score highest against the query vector, best first,
+        as (chunk ID, approximate inner product). `candidate_ids` restricts the scan (e.g.
+        to the chunks matching a metadata filter). Only codes of vectors as wide as the query
+        are scanned.
+        """
+        dimensions = len(query_vector)
+        chunk_ids, codes = self._user_codes(user_id, dimensions)
+        if candidate_ids is not None:
+            kept = [i for i, chunk_id in enumerate(chunk_ids) if chunk_id in candidate_ids]
+            chunk_ids, codes = [chunk_ids[i] for i in kept], [codes[i] for i in kept]
+        if not chunk_ids or limit <= 0:
+            return []
+        scores = code_scores(query_vector, codes, self.scheme, dimensions)
+        top = np.argsort(-scores, kind="stable")[:limit]
+        return [(chunk_ids[i], float(scores[i])) for i in top]
+
+
+quantized_index: Optional[QuantizedIndex] = None
+if settings.VECTOR_QUANTIZATION != "none":
+    quantized_index = QuantizedIndex(settings.QUANTIZED_INDEX_PATH, settings.VECTOR_QUANTIZATION)
+
+
+if __name__ == '__main__':
+    # Self-contained check on a temporary database.
+    import tempfile
+
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((300, 32)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"c{i}" for i in range(300)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for scheme in ("int8", "binary"):
+            index = QuantizedIndex(Path(tmp_dir) / f"{scheme}.sqlite3", scheme)
+            index.add("alice", ids[:200], vectors[:200])
+            assert index.rebuild("bob", zip(ids[200:], vectors[200:].tolist())) == 100
+            assert index.chunk_count("alice", 32) == 200 and index.chunk_count("bob", 32) == 100 and index.chunk_count("bob", 16) == 0
+            assert index.chunk_ids("bob", 32) == set(ids[200:]) and index.chunk_ids("bob", 16) == set() and len(index.chunk_ids("alice")) == 200
+
+            hits = index.search("alice", vectors[42].tolist(), 5)
+            assert hits[0][0] == "c42" and len(hits) == 5
+            assert all(chunk_id in ids[200:] for chunk_id, _ in index.search("bob", vectors[42].tolist(), 10)), "Codes are per user."
+            assert [chunk_id for chunk_id, _ in index.search("alice", vectors[42].tolist(), 5, {"c1", "c2"})] in (["c1", "c2"], ["c2", "c1"])
+
+            index.remove("alice", ["c42"]) # Invalidates the cached codes
+            assert index.search("alice", vectors[42].tolist(), 1)[0][0] != "c42" and index.chunk_count("alice", 32) == 199
+            assert index.search("alice", vectors[42, :16].tolist(), 5) == [], "Codes of another width are not scanned."
+            index.remove_user("alice")
+            assert index.search("alice", vectors[0].tolist(), 5) == []
+    print("quantized_index tests completed.")
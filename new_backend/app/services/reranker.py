@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document as LangchainDocument
+
+from ..core.config import settings # Relative import from core
+from .lexical_index import tokenize
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=settings.LOG_LEVEL)
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError: # Only needed for RERANKER=cross-encoder
+    CrossEncoder = None
+
+
+class Reranker(ABC):
+    """Scores how well candidate texts answer a query, in [0, 1] (higher is better)."""
+    name = "base"
+
+    def candidate_stats(self, query: str, texts: List[str]) -> Optional[object]:
+        """
+        Statistics over the whole candidate set that `score` needs so that batches of it
+        are scored on one scale (None if each candidate is scored on its own).
+        """
+        return None
+
+    @abstractmethod
+    def score(self, query: str, texts: List[str], stats: Optional[object] = None) -> np.ndarray:
+        """Scores `texts`, a batch of the candidates `stats` was computed over (or all of them if it is None)."""
+        ...
+
+
+@dataclass
+class CandidateStats:
+    """Corpus statistics of a candidate set for LexicalReranker: its query terms (those some candidate contains), their idf and the mean length."""
+    terms: List[str]
+    idf: np.ndarray
+    avg_length: float
+
+
+class LexicalReranker(Reranker):
+    """
+    BM25 over the candidate set blended with term proximity: the best share of the query's
+    idf weight found within `window` consecutive terms. BM25 alone cannot tell "In 2019,
+    Acme reported revenue growth" from a chunk that mentions Acme, revenue growth and 2019
+    in different places; proximity is what a cross-encoder would pick up. Both parts are
+    normalized to [0, 1]. Pure CPU, microseconds per candidate.
+    """
+    name = "lexical"
+
+    def __init__(self, k1: float = settings.BM25_K1, b: float = settings.BM25_B, window: int = 12, proximity_weight: float = 0.7):
+        self.k1 = k1
+        self.b = b
+        self.window = window
+        self.proximity_weight = proximity_weight
+
+    def _best_window(self, tokens: List[str], term_weights: dict) -> float:
+        """Largest sum of distinct query term weights within `window` consecutive tokens."""
+        hits = [(position, token) for position, token in enumerate(tokens) if token in term_weights]
+        best, start, in_window = 0.0, 0, Counter()
+        for position, token in hits:
+            in_window[token] += 1
+            while position - hits[start][0] >= self.window:
+                dropped = hits[start][1]
+                in_window[dropped] -= 1
+                if not in_window[dropped]:
+                    del in_window[dropped]
+                start += 1
+            best = max(best, sum(term_weights[term] for term in in_window))
+        return best
+
+    def candidate_stats(self, query: str, texts: List[str]) -> Optional[CandidateStats]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not texts:
+            return None
+        tokenized = [tokenize(text) for text in texts]
+        vocabularies = [set(tokens) for tokens in tokenized]
+        df = np.array([sum(term in vocabulary for vocabulary in vocabularies) for term in terms], dtype=np.float64)
+        # Terms no candidate contains cannot reorder them; they would only shrink every score
+        present = df > 0
+        if not present.any():
+            return None
+        return CandidateStats(
+            terms=[term for term, keep in zip(terms, present) if keep],
+            idf=np.log(1 + (len(texts) - df[present] + 0.5) / (df[present] + 0.5)),
+            avg_length=max(float(np.mean([len(tokens) for tokens in tokenized])), 1.0)
+        )
+
+    def score(self, query: str, texts: List[str], stats: Optional[CandidateStats] = None) -> np.ndarray:
+        if stats is None:
+            stats = self.candidate_stats(query, texts)
+        if stats is None or not texts:
+            return np.zeros(len(texts))
+        terms, idf = stats.terms, stats.idf
+        tokenized = [tokenize(text) for text in texts]
+        counts = [Counter(tokens) for tokens in tokenized]
+        tf = np.array([[doc[term] for doc in counts] for term in terms], dtype=np.float64) # terms x candidates
+        lengths = np.array([len(tokens) for tokens in tokenized], dtype=np.float64)
+        norm = self.k1 * (1 - self.b + self.b * lengths / stats.avg_length)
+        saturation = tf * (self.k1 + 1) / (tf + norm) # In [0, k1 + 1)
+        bm25 = (idf @ saturation) / ((self.k1 + 1) * idf.sum())
+
+        term_weights = dict(zip(terms, (idf / idf.sum()).tolist()))
+        proximity = np.array([self._best_window(tokens, term_weights) for tokens in tokenized])
+        return (1 - self.proximity_weight) * bm25 + self.proximity_weight * proximity
+
+
+class CrossEncoderReranker(Reranker):
+    """A local sentence-transformers cross-encoder (e.g. a MiniLM MS MARCO model), run on CPU; scores are sigmoid(logit)."""
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str = settings.RERANK_MODEL_NAME):
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def score(self, query: str, texts: List[str], stats: Optional[object] = None) -> np.ndarray:
+        if not texts:
+            return np.zeros(0)
+        logits = np.asarray(self.model.predict([(query, text) for text in texts], batch_size=len(texts)), dtype=np.float64)
+        return 1 / (1 + np.exp(-logits))
+
+
+@dataclass
+class RerankResult:
+    """Candidates in reranked order and how the stage went."""
+    results: List[Tuple[LangchainDocument, float]] = field(default_factory=list)
+    scored: int = 0 # Candidates scored before the latency budget ran out
+    dropped_low_score: int = 0
+    budget_exceeded: bool = False
+    elapsed_ms: float = 0.0
+
+
+def rerank(
+    query: str,
+    results: List[Tuple[LangchainDocument, float]],
+    reranker: Optional[Reranker] = None,
+    batch_size: int = settings.RERANK_BATCH_SIZE,
+    budget_ms: float = settings.RERANK_BUDGET_MS,
+    min_score: float = settings.RERANK_MIN_SCORE
+) -> RerankResult:
+    """
+    Reorders (document, distance) search results by reranker score. Statistics the scores
+    depend on (e.g. idf) are computed once over all candidates, then candidates are scored
+    in batches of `batch_size`, in retrieval order; once `budget_ms` is used up, the
+    remaining candidates are not scored and follow the scored ones in retrieval order.
+    Scored candidates below `min_score` are dropped (the best one is always kept).
+    Ties keep their retrieval order.
+    """
+    reranker = reranker or active_reranker
+    started = time.perf_counter()
+    outcome = RerankResult()
+    scores: List[float] = []
+    stats = reranker.candidate_stats(query, [doc.page_content for doc, _ in results]) # One scale for every batch
+    for start in range(0, len(results), max(1, batch_size)):
+        if scores and (time.perf_counter() - started) * 1000 > budget_ms:
+            outcome.budget_exceeded = True
+            break
+        batch = results[start:start + batch_size]
+        scores.extend(reranker.score(query, [doc.page_content for doc, _ in batch], stats).tolist())
+    outcome.scored = len(scores)
+
+    order = sorted(range(len(scores)), key=lambda i: -scores[i])
+    kept = [i for rank, i in enumerate(order) if rank == 0 or scores[i] >= min_score]
+    outcome.dropped_low_score = len(order) - len(kept)
+    outcome.results = [results[i] for i in kept] + results[len(scores):]
+    outcome.elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+    if outcome.budget_exceeded:
+        logger.warning(f"Reranking hit its {budget_ms} ms budget after {outcome.scored} of {len(results)} candidate(s).")
+    return outcome
+
+
+async def arerank(query: str, results: List[Tuple[LangchainDocument, float]]) -> RerankResult:
+    """rerank() in a worker thread, so scoring (a model forward pass) never blocks the event loop."""
+    return await asyncio.to_thread(rerank, query, results)
+
+
+def _build_reranker(kind: str) -> Optional[Reranker]:
+    if kind == "none":
+        return None
+    if kind == "cross-encoder":
+        if CrossEncoder is not None:
+            try:
+                reranker = CrossEncoderReranker()
+                logger.info(f"Loaded cross-encoder reranker {settings.RERANK_MODEL_NAME}.")
+                return reranker
+            except Exception as e:
+                logger.error(f"Failed to load cross-encoder {settings.RERANK_MODEL_NAME}: {e}. Using the lexical reranker.", exc_info=True)
+        else:
+            logger.warning("sentence-transformers not installed. The cross-encoder reranker falls back to the lexical reranker.")
+        return LexicalReranker()
+    if kind != "lexical":
+        logger.warning(f"Unknown RERANKER '{kind}'. Using the lexical reranker.")
+    return LexicalReranker()
+
+
+# The reranker used by the QA path (None when RERANKER=none)
+active_reranker: Optional[Reranker] = _build_reranker(settings.RERANKER)
+
+
+if __name__ == '__main__':
+    # Self-contained check with the lexical reranker (no model download).
+    def make(text: str) -> LangchainDocument:
+        return LangchainDocument(page_content=text, metadata={})
+
+    candidates = [
+        (make("The office kitchen is cleaned on Fridays."), 0.3),
+        (make("Operating margin in the third quarter was 14 percent."), 0.4),
+        (make("Revenue grew 12 percent in the third quarter, margin was flat."), 0.5),
+        (make("Unrelated appendix text."), 0.6),
+    ]
+    lexical = LexicalReranker()
+    result = rerank("How did revenue and margin develop in the third quarter?", candidates, reranker=lexical)
+    assert [doc.page_content[:7] for doc, _ in result.results[:2]] == ["Revenue", "Operati"], result.results
+    assert result.scored == 4 and not result.budget_exceeded
+
+    result = rerank("third quarter revenue", candidates, reranker=lexical, min_score=0.05)
+    assert result.dropped_low_score == 2 and len(result.results) == 2
+
+    result = rerank("third quarter revenue", candidates, reranker=lexical, batch_size=1, budget_ms=0)
+    assert result.budget_exceeded and result.scored == 1 and len(result.results) == 4, "Unscored candidates must be kept."
+    assert all(0 < score < 1 for score in lexical.score("revenue", ["revenue", "revenue revenue growth"]))
+
+    # An off-topic candidate scored alone in a later batch must not be promoted over relevant ones
+    relevant = [
+        (make(f"Acme revenue growth was {i} percent in segment {i}, as the board noted when it reviewed the plan "
+              f"for each region and the outlook for the year; figures are for 2019."), 0.1)
+        for i in range(16)
+    ]
+    off_topic = (make("The 2019 holiday party was held at the lake."), 0.9)
+    for size in (16, 64):
+        result = rerank("What revenue growth did Acme report in 2019?", relevant + [off_topic], reranker=lexical, batch_size=size, budget_ms=1000)
+        assert result.results[-1] is off_topic, f"Batch size {size} promoted an off-topic candidate."
+    print("reranker tests completed.")
@@ -0,0 +1,174 @@
+import hashlib
+from typing import Any, Optional
+
+import numpy as np
+
+# Metadata field that carries the owner of every record in a shared collection
+TENANT_FIELD = "user_id"
+# Record IDs in a shared collection are "<user_id><separator><chunk ID>"
+_ID_SEPARATOR = "/"
+
+
+def shard_collection_name(user_id: str, shards: int) -> str:
+    """Name of the shared collection that holds a user's records (stable for a given shard count)."""
+    shard = int.from_bytes(hashlib.sha256(user_id.encode("utf-8")).digest()[:8], "big") % max(1, shards)
+    return f"tenants_{shard:03d}"
+
+
+class TenantCollection:
+    """
+    One user's view of a Chroma collection shared by many users. It has the collection
+    methods used by vectorstore_service and LangChain's Chroma wrapper (get, query, upsert,
+    update, delete, count), each scoped to the user:
+    - record IDs are stored as "<user_id>/<chunk ID>", so two users never share or overwrite
+      a record, and callers only ever see the chunk IDs,
+    - writes stamp metadata["user_id"],
+    - every read, query and delete is ANDed with a filter on metadata["user_id"].
+    Nothing else of the underlying collection is exposed, so no call can reach another
+    user's records.
+
+    A filtered query on the collection's HNSW index gets slower with every tenant added to
+    it, however few records the user has. So when the user has at most
+    `exact_search_max_records` records matching the query's filter, query scores them
+    exactly (fetching only their embeddings) instead; larger tenants use the index.
+    """
+
+    def __init__(self, collection: Any, user_id: str, exact_search_max_records: int = 0):
+        self._shared = collection
+        self.user_id = user_id
+        self.exact_search_max_records = exact_search_max_records
+        self._prefix = f"{user_id}{_ID_SEPARATOR}"
+        self.name = collection.name
+        self.metadata = collection.metadata
+        configuration = getattr(collection, "configuration", None) or {}
+        self._space = (configuration.get("hnsw") or {}).get("space", "l2")
+
+    def _stored_ids(self, ids: Optional[list[str]]) -> Optional[list[str]]:
+        return None if ids is None else [self._prefix + chunk_id for chunk_id in ids]
+
+    def _chunk_ids(self, ids: list[str]) -> list[str]:
+        return [stored_id[len(self._prefix):] for stored_id in ids]
+
+    def _where(self, where: Optional[dict]) -> dict:
+        tenant = {TENANT_FIELD: self.user_id}
+        return {"$and": [tenant, where]} if where else tenant
+
+    def _stamped(self, metadatas: Optional[list[Optional[dict]]], count: int) -> list[dict]:
+        return [{**(metadata or {}), TENANT_FIELD: self.user_id} for metadata in (metadatas or [None] * count)]
+
+    def count(self) -> int:
+        """Number of this user's records (reads their IDs; use is_empty to test for none)."""
+        return len(self._shared.get(where=self._where(None), include=[])["ids"])
+
+    def is_empty(self) -> bool:
+        return not self._shared.get(where=self._where(None), limit=1, include=[])["ids"]
+
+    def get(self, ids: Optional[list[str]] = None, where: Optional[dict] = None, **kwargs) -> dict:
+        result = self._shared.get(ids=self._stored_ids(ids), where=self._where(where), **kwargs)
+        result["ids"] = self._chunk_ids(result["ids"])
+        return result
+
+    def query(self, query_embeddings: Any = None, n_results: int = 10, where: Optional[dict] = None, **kwargs) -> dict:
+        kwargs.pop("query_texts", None) # Shared collections have no embedding function; callers embed
+        if self.exact_search_max_records > 0 and query_embeddings is not None and set(kwargs) <= {"include", "where_document"}:
+            result = self._exact_query(query_embeddings, n_results, where, **kwargs)
+            if result is not None:
+                return result
+        result = self._shared.query(query_embeddings=query_embeddings, n_results=n_results, where=self._where(where), **kwargs)
+        result["ids"] = [self._chunk_ids(ids) for ids in result["ids"]]
+        return result
+
+    def _distances(self, embeddings: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Distances as the collection's HNSW index reports them (squared L2, 1 - cosine or 1 - inner product)."""
+        if self._space == "cosine":
+            norms = np.linalg.norm(embeddings, axis=1) * (np.linalg.norm(query) or 1.0)
+            return 1.0 - (embeddings @ query) / np.where(norms > 0, norms, 1.0)
+        if self._space == "ip":
+            return 1.0 - embeddings @ query
+        return np.sum((embeddings - query) ** 2, axis=1)
+
+    def _exact_query(
+        self, query_embeddings: Any, n_results: int, where: Optional[dict],
+        include: Optional[list] = None, where_document: Optional[dict] = None
+    ) -> Optional[dict]:
+        """query by an exact scan of the user's matching records; None if they are more than exact_search_max_records."""
+        candidate_ids = self._shared.get(
+            where=self._where(where), where_document=where_document, include=[], limit=self.exact_search_max_records + 1
+        )["ids"]
+        if len(candidate_ids) > self.exact_search_max_records:
+            return None
+        candidates = self._shared.get(ids=candidate_ids, include=["embeddings"]) if candidate_ids else {"ids": [], "embeddings": []}
+        include = list(include) if include is not None else ["documents", "metadatas", "distances"]
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float64))
+        embeddings = np.asarray(candidates["embeddings"], dtype=np.float64).reshape(-1, queries.shape[1])
+        nearest = []
+        for query_embedding in queries:
+            distances = self._distances(embeddings, query_embedding)
+            order = np.argsort(distances, kind="stable")[:n_results]
+            nearest.append([(candidates["ids"][i], float(distances[i])) for i in order])
+
+        fields = [field for field in ("documents", "metadatas", "embeddings") if field in include]
+        records = {}
+        wanted = list(dict.fromkeys(stored_id for hits in nearest for stored_id, _ in hits))
+        if fields and wanted:
+            fetched = self._shared.get(ids=wanted, include=fields)
+            records = {stored_id: {field: fetched[field][i] for field in fields} for i, stored_id in enumerate(fetched["ids"])}
+        result = {"ids": [self._chunk_ids([stored_id for stored_id, _ in hits]) for hits in nearest], "included": include}
+        result["distances"] = [[distance for _, distance in hits] for hits in nearest] if "distances" in include else None
+        for field in ("documents", "metadatas", "embeddings"):
+            result[field] = [[records[stored_id][field] for stored_id, _ in hits] for hits in nearest] if field in fields else None
+        return result
+
+    def upsert(self, ids: list[str], embeddings: Any = None, metadatas: Optional[list] = None, documents: Optional[list] = None, **kwargs) -> None:
+        self._shared.upsert(
+            ids=self._stored_ids(ids), embeddings=embeddings, metadatas=self._stamped(metadatas, len(ids)), documents=documents, **kwargs
+        )
+
+    def update(self, ids: list[str], embeddings: Any = None, metadatas: Optional[list] = None, documents: Optional[list] = None, **kwargs) -> None:
+        self._shared.update(
+            ids=self._stored_ids(ids),
+            embeddings=embeddings,
+            metadatas=self._stamped(metadatas, len(ids)) if metadatas is not None else None,
+            documents=documents,
+            **kwargs
+        )
+
+    def delete(self, ids: Optional[list[str]] = None, where: Optional[dict] = None, **kwargs) -> None:
+        if ids is None and where is None and not kwargs:
+            raise ValueError("Pass ids or a where clause to delete records (delete_all removes all of a user's records).")
+        self._shared.delete(ids=self._stored_ids(ids), where=self._where(where), **kwargs)
+
+    def delete_all(self) -> None:
+        """Removes every record of this user from the shared collection."""
+        self._shared.delete(where=self._where(None))
+
+
+if __name__ == '__main__':
+    # Self-contained check on an in-memory Chroma collection.
+    import chromadb
+
+    collection = chromadb.EphemeralClient().get_or_create_collection(shard_collection_name("test", 4))
+    alice, bob = TenantCollection(collection, "alice"), TenantCollection(collection, "bob", exact_search_max_records=10)
+    alice.upsert(ids=["c1", "c2"], embeddings=[[1.0, 0.0], [0.0, 1.0]], metadatas=[{"content_type": "text_section"}, None], documents=["a1", "a2"])
+    bob.upsert(ids=["c1"], embeddings=[[1.0, 0.0]], metadatas=[{"user_id": "alice"}], documents=["b1"]) # Same chunk ID, spoofed owner
+
+    assert collection.count() == 3 and alice.count() == 2 and bob.count() == 1
+    assert bob.get(ids=["c1", "c2"])["documents"] == ["b1"], "A user must only read their own records."
+    assert bob.get(ids=["c1"])["metadatas"][0]["user_id"] == "bob", "Writes must stamp the owner."
+    nearest = alice.query(query_embeddings=[[1.0, 0.0]], n_results=5)
+    assert nearest["ids"][0] == ["c1", "c2"] and nearest["documents"][0][0] == "a1"
+    assert alice.get(where={"content_type": "text_section"})["ids"] == ["c1"]
+    exact = bob.query(query_embeddings=[[0.6, 0.8]], n_results=5, include=["documents", "distances"])
+    indexed = TenantCollection(collection, "bob").query(query_embeddings=[[0.6, 0.8]], n_results=5, include=["documents", "distances"])
+    assert exact["ids"] == indexed["ids"] == [["c1"]] and exact["documents"] == [["b1"]] and exact["metadatas"] is None
+    assert abs(exact["distances"][0][0] - indexed["distances"][0][0]) < 1e-5, "Exact distances must match the index's."
+    assert bob.query(query_embeddings=[[1.0, 0.0]], where={"content_type": "table_chunk"})["ids"] == [[]]
+
+    alice.update(ids=["c2"], metadatas=[{"content_type": "table_chunk"}])
+    assert alice.get(ids=["c2"])["metadatas"][0] == {"content_type": "table_chunk", "user_id": "alice"}
+    bob.delete(ids=["c2"]) # Not bob's: nothing happens
+    assert alice.count() == 2
+    alice.delete_all()
+    assert alice.is_empty() and bob.count() == 1
+    assert len({shard_collection_name(f"user{i}", 4) for i in range(100)}) == 4
+    print("tenant_collection tests completed.")
@@ -0,0 +1,300 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from ..core.config import settings # Relative import from core
+from .blob_store import BlobStore, StoredBlob, blob_store
+from .chunk_manifest import file_content_hash
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=settings.LOG_LEVEL)
+
+# Request bodies arrive in small pieces; they are buffered up to this size per disk write
+_WRITE_BUFFER_BYTES = 1024 * 1024
+_MIN_CHUNK_BYTES = 64 * 1024
+
+
+class UploadSessionError(Exception):
+    """A chunk or finalize request that does not fit the session (bad offset, size or checksum)."""
+
+
+class UploadSessionNotFound(UploadSessionError):
+    """The session does not exist, has expired or was already finalized."""
+
+
+def _pwrite_all(fd: int, data: bytes, offset: int, digest) -> None:
+    digest.update(data)
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+class UploadSessionStore:
+    """
+    Resumable, chunked uploads: a client creates a session for a file of known size, sends
+    fixed-size chunks at their byte offsets (in any order, in parallel, retrying as needed)
+    and finalizes the upload with the file's sha256.
+
+    Chunks are written in place into one preallocated file per session, next to the blob
+    store, so the finalized file is moved into the store without another copy. Sessions and
+    their received chunks are persisted in SQLite, so an interrupted upload can resume after
+    a dropped connection or a restart; sessions idle for longer than `ttl_seconds` expire.
+    """
+
+    def __init__(self, db_path: Path, sessions_dir: Path, blob_store: BlobStore, ttl_seconds: float, max_sessions_per_user: int):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.sessions_dir = Path(sessions_dir)
+        self.sessions_dir.mkdir(parents=True, exist_ok=True)
+        self.blob_store = blob_store
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions_per_user = max(1, max_sessions_per_user)
+        self._lock = threading.Lock()
+        self._active_writes: Counter = Counter() # session_id -> chunk writes in flight
+        self._finalizing: set = set()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                chunk_size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                session_id TEXT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+                chunk_index INTEGER NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                PRIMARY KEY (session_id, chunk_index)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)")
+        self._conn.commit()
+
+    def session_path(self, session_id: str) -> Path:
+        return self.sessions_dir / session_id
+
+    def _session_dict(self, row: sqlite3.Row) -> dict:
+        session = dict(row)
+        received = [
+            r["chunk_index"] for r in self._conn.execute(
+                "SELECT chunk_index FROM chunks WHERE session_id = ? ORDER BY chunk_index", (session["id"],)
+            )
+        ]
+        chunk_count = max(1, -(-session["size_bytes"] // session["chunk_size"]))
+        received_set = set(received)
+        session["chunk_count"] = chunk_count
+        session["received_chunks"] = received
+        session["missing_chunks"] = [i for i in range(chunk_count) if i not in received_set]
+        session["expires_at"] = session["updated_at"] + self.ttl_seconds
+        return session
+
+    def purge_expired(self) -> int:
+        """Removes sessions (and their partial files) idle for longer than the TTL."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [
+                row["id"] for row in self._conn.execute("SELECT id FROM sessions WHERE updated_at < ?", (cutoff,))
+                if row["id"] not in self._active_writes and row["id"] not in self._finalizing
+            ]
+            with self._conn:
+                self._conn.executemany("DELETE FROM sessions WHERE id = ?", [(session_id,) for session_id in expired])
+        for session_id in expired:
+            self.session_path(session_id).unlink(missing_ok=True)
+        if expired:
+            logger.info(f"Purged {len(expired)} expired upload session(s).")
+        return len(expired)
+
+    def create(self, user_id: str, filename: str, size_bytes: int, chunk_size: Optional[int] = None) -> dict:
+        """Opens a session and preallocates its file. Raises UploadSessionError if the user has too many open sessions."""
+        self.purge_expired()
+        chunk_size = min(max(chunk_size or settings.UPLOAD_SESSION_CHUNK_BYTES, _MIN_CHUNK_BYTES), settings.UPLOAD_SESSION_MAX_CHUNK_BYTES)
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            open_sessions = self._conn.execute("SELECT COUNT(*) FROM sessions WHERE user_id = ?", (user_id,)).fetchone()[0]
+            if open_sessions >= self.max_sessions_per_user:
+                raise UploadSessionError(f"User already has {open_sessions} open upload session(s); finalize or abort some first.")
+            with open(self.session_path(session_id), "wb") as f:
+                f.truncate(size_bytes) # Sparse on most filesystems; chunks fill it in place
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO sessions (id, user_id, filename, size_bytes, chunk_size, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (session_id, user_id, filename, size_bytes, chunk_size, now, now),
+                )
+            row = self._conn.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            return self._session_dict(row)
+
+    def get(self, session_id: str) -> dict:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None or row["updated_at"] < time.time() - self.ttl_seconds:
+                raise UploadSessionNotFound(f"Upload session '{session_id}' not found or expired.")
+            return self._session_dict(row)
+
+    def _record_chunk(self, session_id: str, chunk_index: int, size_bytes: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunks (session_id, chunk_index, size_bytes) VALUES (?, ?, ?)",
+                (session_id, chunk_index, size_bytes),
+            )
+            self._conn.execute("UPDATE sessions SET updated_at = ? WHERE id = ?", (time.time(), session_id))
+
+    async def write_chunk(self, session_id: str, offset: int, body: AsyncIterator[bytes], chunk_sha256: Optional[str] = None) -> dict:
+        """
+        Streams one chunk of a request body to its place in the session file. `offset` must be
+        a multiple of the session's chunk size and the body exactly one chunk long (the last
+        chunk may be shorter). A chunk that is cut off or fails `chunk_sha256` is not recorded,
+        so the client simply sends it again. Returns the updated session.
+        """
+        session = await asyncio.to_thread(self.get, session_id)
+        chunk_size, size_bytes = session["chunk_size"], session["size_bytes"]
+        if offset < 0 or offset >= size_bytes or offset % chunk_size:
+            raise UploadSessionError(f"Offset {offset} is not the start of a chunk (chunk size {chunk_size}, file size {size_bytes}).")
+        chunk_index = offset // chunk_size
+        expected_bytes = min(chunk_size, size_bytes - offset)
+
+        with self._lock:
+            if session_id in self._finalizing:
+                raise UploadSessionError(f"Upload session '{session_id}' is being finalized.")
+            self._active_writes[session_id] += 1
+        try:
+            digest = hashlib.sha256()
+            written = 0
+            buffer = bytearray()
+            fd = await asyncio.to_thread(os.open, self.session_path(session_id), os.O_WRONLY)
+            try:
+                async for data in body:
+                    if written + len(buffer) + len(data) > expected_bytes:
+                        raise UploadSessionError(f"Chunk {chunk_index} is longer than {expected_bytes} bytes.")
+                    buffer += data
+                    if len(buffer) >= _WRITE_BUFFER_BYTES:
+                        await asyncio.to_thread(_pwrite_all, fd, bytes(buffer), offset + written, digest)
+                        written += len(buffer)
+                        buffer.clear()
+                if buffer:
+                    await asyncio.to_thread(_pwrite_all, fd, bytes(buffer), offset + written, digest)
+                    written += len(buffer)
+            finally:
+                await asyncio.to_thread(os.close, fd)
+            if written != expected_bytes:
+                raise UploadSessionError(f"Chunk {chunk_index} has {written} bytes, expected {expected_bytes}.")
+            if chunk_sha256 and digest.hexdigest() != chunk_sha256.lower():
+                raise UploadSessionError(f"Checksum mismatch for chunk {chunk_index}.")
+            await asyncio.to_thread(self._record_chunk, session_id, chunk_index, written)
+        finally:
+            with self._lock:
+                self._active_writes[session_id] -= 1
+                if not self._active_writes[session_id]:
+                    del self._active_writes[session_id]
+        return await asyncio.to_thread(self.get, session_id)
+
+    def finalize(self, session_id: str, sha256: str) -> tuple[dict, StoredBlob]:
+        """
+        Checks that every chunk arrived and that the assembled file has the given sha256,
+        then moves it into the blob store and closes the session. Returns (session, blob).
+        """
+        with self._lock:
+            if self._active_writes[session_id] or session_id in self._finalizing:
+                raise UploadSessionError(f"Upload session '{session_id}' still has chunk uploads in progress.")
+            self._finalizing.add(session_id)
+        try:
+            session = self.get(session_id)
+            if session["missing_chunks"]:
+                raise UploadSessionError(f"Upload session '{session_id}' is missing {len(session['missing_chunks'])} chunk(s).")
+            session_path = self.session_path(session_id)
+            content_hash = file_content_hash(session_path)
+            if content_hash != sha256.lower():
+                raise UploadSessionError(f"Checksum mismatch: the assembled file has sha256 {content_hash}.")
+            blob = self.blob_store.store_file(session_path, content_hash)
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            return session, blob
+        finally:
+            with self._lock:
+                self._finalizing.discard(session_id)
+
+    def abort(self, session_id: str) -> None:
+        self.get(session_id) # Raises if unknown
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        self.session_path(session_id).unlink(missing_ok=True)
+
+
+upload_sessions = UploadSessionStore(
+    settings.UPLOAD_SESSION_DB_PATH,
+    settings.UPLOAD_SESSION_DIR,
+    blob_store,
+    ttl_seconds=settings.UPLOAD_SESSION_TTL_SECONDS,
+    max_sessions_per_user=settings.UPLOAD_SESSION_MAX_PER_USER
+)
+
+
+if __name__ == '__main__':
+    # Self-contained check on temporary directories (chunks sent out of order and retried).
+    import tempfile
+
+    async def body(data: bytes, piece: int = 10_000):
+        for start in range(0, len(data), piece):
+            yield data[start:start + piece]
+
+    async def main() -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = Path(tmp_dir)
+            store = UploadSessionStore(root / "sessions.sqlite3", root / "blobs" / "sessions", BlobStore(root / "blobs", 64 * 1024, 0), 3600, 2)
+            content = os.urandom(150 * 1024)
+            session = store.create("u1", "big.pdf", len(content), chunk_size=64 * 1024)
+            assert session["chunk_count"] == 3 and session["missing_chunks"] == [0, 1, 2]
+
+            chunk = lambda i: content[i * 65536:(i + 1) * 65536]
+            await asyncio.gather(
+                store.write_chunk(session["id"], 2 * 65536, body(chunk(2))),
+                store.write_chunk(session["id"], 0, body(chunk(0)), hashlib.sha256(chunk(0)).hexdigest()),
+            )
+            for bad in (store.write_chunk(session["id"], 65536, body(chunk(1)[:-1])), # Cut off
+                        store.write_chunk(session["id"], 65536, body(chunk(1)), "0" * 64), # Corrupted
+                        store.write_chunk(session["id"], 100, body(chunk(1)))): # Not a chunk boundary
+                try:
+                    await bad
+                    raise AssertionError("Invalid chunk was accepted.")
+                except UploadSessionError:
+                    pass
+            try:
+                store.finalize(session["id"], hashlib.sha256(content).hexdigest())
+                raise AssertionError("Incomplete upload was finalized.")
+            except UploadSessionError:
+                pass
+
+            resumed = await store.write_chunk(session["id"], 65536, body(chunk(1)))
+            assert resumed["missing_chunks"] == []
+            _, blob = store.finalize(session["id"], hashlib.sha256(content).hexdigest())
+            assert blob.path.read_bytes() == content and not store.session_path(session["id"]).exists()
+            try:
+                store.get(session["id"])
+                raise AssertionError("Finalized session is still open.")
+            except UploadSessionNotFound:
+                pass
+        print("upload_sessions tests completed.")
+
+    asyncio.run(main())
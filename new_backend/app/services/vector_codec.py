@@ -0,0 +1,126 @@
+from typing import Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Quantization schemes for the compact codes of the quantized candidate index
+QUANTIZATION_SCHEMES = ("none", "int8", "binary")
+
+
+def truncate_embeddings(vectors, dimensions: int) -> np.ndarray:
+    """
+    Keeps the first `dimensions` components of each vector and rescales it to unit length
+    (float32). text-embedding-3 models are trained so that such a prefix is itself an
+    embedding; it is what the API returns for its `dimensions` parameter. Vectors already
+    that short, or `dimensions` <= 0, are returned unchanged (as float32).
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    if dimensions <= 0 or vectors.shape[1] <= dimensions:
+        return vectors
+    truncated = vectors[:, :dimensions]
+    norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+    return truncated / np.where(norms > 0, norms, 1.0)
+
+
+def code_size(scheme: str, dimensions: int) -> int:
+    """Bytes per vector: float32 for "none", a float32 scale plus one byte per component for int8, one bit per component for binary."""
+    if scheme == "int8":
+        return 4 + dimensions
+    if scheme == "binary":
+        return (dimensions + 7) // 8
+    return 4 * dimensions
+
+
+def quantize(vectors, scheme: str) -> list[bytes]:
+    """
+    Encodes vectors as compact codes:
+    - int8: each vector scaled by its largest absolute component to [-127, 127], with the
+      scale stored in front as float32,
+    - binary: one sign bit per component.
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    if scheme == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(vectors / scales[:, None]).astype(np.int8)
+        return [scale.tobytes() + code.tobytes() for scale, code in zip(scales.astype(np.float32), codes)]
+    if scheme == "binary":
+        return [code.tobytes() for code in np.packbits(vectors > 0, axis=1)]
+    raise ValueError(f"Unknown quantization scheme {scheme!r}; expected int8 or binary.")
+
+
+def code_scores(query, codes: list[bytes], scheme: str, dimensions: int) -> np.ndarray:
+    """
+    Approximate inner products of a float query with coded vectors (higher is closer).
+    int8 codes are dequantized; binary codes are scored asymmetrically (the query stays
+    float and each stored component counts as +1 or -1), which ranks much better than
+    comparing sign bits alone.
+    """
+    query = np.asarray(query, dtype=np.float32)
+    if not codes:
+        return np.empty(0, dtype=np.float32)
+    buffer = np.frombuffer(b"".join(codes), dtype=np.uint8).reshape(len(codes), -1)
+    if scheme == "int8":
+        scales = buffer[:, :4].copy().view(np.float32).ravel()
+        return (buffer[:, 4:].view(np.int8).astype(np.float32) @ query) * scales
+    if scheme == "binary":
+        bits = np.unpackbits(buffer, axis=1, count=dimensions).astype(np.float32)
+        return 2.0 * (bits @ query) - query.sum()
+    raise ValueError(f"Unknown quantization scheme {scheme!r}; expected int8 or binary.")
+
+
+class TruncatedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that truncates every vector to `dimensions` (see truncate_embeddings),
+    so vectors LangChain's Chroma wrapper embeds itself match the vectors stored by
+    vectorstore_service. The wrapped embedder (and its cache) keep full vectors.
+    """
+
+    def __init__(self, underlying: Embeddings, dimensions: int):
+        self.underlying = underlying
+        self.dimensions = dimensions
+
+    def _truncate(self, vectors: list[list[float]]) -> list[list[float]]:
+        return truncate_embeddings(vectors, self.dimensions).tolist() if vectors else []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._truncate(self.underlying.embed_documents(texts))
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._truncate([self.underlying.embed_query(text)])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._truncate(await self.underlying.aembed_documents(texts))
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return self._truncate([await self.underlying.aembed_query(text)])[0]
+
+
+def rescore_order(query, vectors, candidates: Optional[np.ndarray] = None) -> np.ndarray:
+    """Indices of `vectors` (or of the `candidates` subset) by increasing squared L2 distance to the query, as Chroma ranks them."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    candidates = np.arange(len(vectors)) if candidates is None else np.asarray(candidates)
+    distances = np.sum((vectors[candidates] - np.asarray(query, dtype=np.float32)) ** 2, axis=1)
+    return candidates[np.argsort(distances, kind="stable")]
+
+
+if __name__ == '__main__':
+    # Self-contained check on random unit vectors.
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 64)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    query = vectors[7] + 0.05 * rng.standard_normal(64).astype(np.float32)
+
+    truncated = truncate_embeddings(vectors, 16)
+    assert truncated.shape == (500, 16) and np.allclose(np.linalg.norm(truncated, axis=1), 1.0, atol=1e-5)
+    assert truncate_embeddings(vectors, 0).shape == (500, 64) and truncate_embeddings(vectors[0], 128).shape == (1, 64)
+
+    for scheme in ("int8", "binary"):
+        codes = quantize(vectors, scheme)
+        assert len(codes[0]) == code_size(scheme, 64)
+        scores = code_scores(query, codes, scheme, 64)
+        assert int(np.argmax(scores)) == 7, f"{scheme} codes must rank the nearest vector first."
+    exact = vectors @ query
+    assert np.allclose(code_scores(query, quantize(vectors, "int8"), "int8", 64), exact, atol=0.02)
+    assert rescore_order(query, vectors, np.array([3, 7, 9]))[0] == 7
+    print("vector_codec tests completed.")
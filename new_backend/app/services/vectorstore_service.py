@@ -1,14 +1,35 @@
+import asyncio
+import hashlib
+import json
 import logging
-import os
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+import chromadb
+import numpy as np
+from chromadb.api.shared_system_client import SharedSystemClient
 from langchain_community.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings
 from langchain.docstore.document import Document as LangchainDocument # For type hinting
 from ..core.config import settings # Relative import from core
+from ..core.http_client import openai_async_http_client
+from ..core.utils import estimate_token_count
+from . import answer_cache
+from .chunk_filter import ChunkFilter, normalize_chunk_metadata
+from .chunk_manifest import ManifestChunk, chunk_manifest, file_content_hash
+from .embedding_cache import CachedEmbeddings, EmbeddingCacheStats
+from .embedding_pipeline import EmbeddingPipelineMetrics, run_embedding_pipeline
+from .lexical_index import lexical_index, reciprocal_rank_fusion
+from .quantized_index import quantized_index
+from .tenant_collection import TenantCollection, shard_collection_name
+from .vector_codec import TruncatedEmbeddings, truncate_embeddings
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=settings.LOG_LEVEL)
 
-from typing import Optional
+from typing import Callable, Optional
 
 # Initialize OpenAI Embeddings
 # This will use the OPENAI_API_KEY from environment variables (via settings)
@@ -17,25 +38,263 @@ try:
 
     embeddings_model = OpenAIEmbeddings(
         model=settings.EMBEDDING_MODEL_NAME,
-        openai_api_key=settings.OPENAI_API_KEY
+        openai_api_key=settings.OPENAI_API_KEY,
+        openai_api_base=settings.OPENAI_BASE_URL
     )
     logger.info(f"Successfully initialized OpenAIEmbeddings model: {settings.EMBEDDING_MODEL_NAME}")
 except Exception as e:
     logger.error(f"Failed to initialize OpenAIEmbeddings: {e}. Ensure OPENAI_API_KEY is set.", exc_info=True)
     embeddings_model = None # Application might not function correctly without embeddings
 
+# Same model for the async query path: its async HTTP client is the shared pool bound to
+# the application's event loop, while embeddings_model is used from the indexing loop.
+try:
+    query_embeddings_model = OpenAIEmbeddings(
+        model=settings.EMBEDDING_MODEL_NAME,
+        openai_api_key=settings.OPENAI_API_KEY,
+        openai_api_base=settings.OPENAI_BASE_URL,
+        http_async_client=openai_async_http_client
+    )
+except Exception as e:
+    logger.error(f"Failed to initialize query OpenAIEmbeddings: {e}. Ensure OPENAI_API_KEY is set.", exc_info=True)
+    query_embeddings_model = None
+
+# Embedding function used by the vector stores: the raw model behind a persistent
+# content-addressed cache, so only cache misses reach the embeddings API.
+store_embeddings = embeddings_model
+if embeddings_model and settings.EMBEDDING_CACHE_ENABLED:
+    try:
+        store_embeddings = CachedEmbeddings(
+            underlying=embeddings_model,
+            model_name=settings.EMBEDDING_MODEL_NAME,
+            db_path=settings.EMBEDDING_CACHE_PATH,
+            async_underlying=query_embeddings_model
+        )
+        logger.info(f"Embedding cache enabled at {settings.EMBEDDING_CACHE_PATH}")
+    except Exception as e:
+        logger.error(f"Failed to open embedding cache at {settings.EMBEDDING_CACHE_PATH}: {e}. Embedding without cache.", exc_info=True)
+
+
+def _chroma_embeddings():
+    """Embedding function for the LangChain Chroma wrappers: store_embeddings, truncated like the stored vectors."""
+    if store_embeddings is not None and settings.EMBEDDING_DIMENSIONS > 0:
+        return TruncatedEmbeddings(store_embeddings, settings.EMBEDDING_DIMENSIONS)
+    return store_embeddings
+
+
+def _stored_vectors(vectors: list[list[float]]) -> list[list[float]]:
+    """Embeddings as they are stored and searched: truncated to EMBEDDING_DIMENSIONS when it is set."""
+    if settings.EMBEDDING_DIMENSIONS <= 0 or not len(vectors):
+        return vectors
+    return truncate_embeddings(vectors, settings.EMBEDDING_DIMENSIONS).tolist()
+
+
+# Maximum number of records written to Chroma in a single upsert call
+CHROMA_WRITE_BATCH_SIZE = 1000
+# Maximum number of records read from / deleted in Chroma in a single call
+CHROMA_READ_BATCH_SIZE = 5000
+
+class VectorStoreRegistry:
+    """
+    Process-wide, thread-safe cache of open per-user Chroma handles (in the shared
+    layout: the user's tenant-scoped view of their shard).
+
+    Opening a persisted Chroma store means reloading its SQLite and HNSW files,
+    so handles are kept around between requests. The registry is bounded: the
+    least recently used handle is evicted once `max_handles` is reached, and
+    handles unused for `idle_timeout` seconds are dropped on the next access.
+    """
+
+    def __init__(self, max_handles: int, idle_timeout: float):
+        self.max_handles = max(1, max_handles)
+        self.idle_timeout = idle_timeout
+        self._handles: "OrderedDict[str, tuple[Chroma, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _evict_idle(self, now: float) -> None:
+        # Entries are kept in recency order, so idle ones are always at the front.
+        while self._handles:
+            user_id, (_, last_used) = next(iter(self._handles.items()))
+            if now - last_used < self.idle_timeout:
+                break
+            self._handles.popitem(last=False)
+            self.evictions += 1
+            logger.debug(f"Evicted idle vector store handle for user {user_id}.")
+
+    def get(self, user_id: str) -> Optional[Chroma]:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._handles.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._handles[user_id] = (entry[0], now)
+            self._handles.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, user_id: str, vectorstore: Chroma) -> Chroma:
+        """
+        Registers a freshly opened handle. If another thread registered one for the
+        same user in the meantime, that handle wins and is returned instead.
+        """
+        now = time.monotonic()
+        with self._lock:
+            existing = self._handles.get(user_id)
+            if existing is not None:
+                self._handles[user_id] = (existing[0], now)
+                self._handles.move_to_end(user_id)
+                return existing[0]
+            self._handles[user_id] = (vectorstore, now)
+            while len(self._handles) > self.max_handles:
+                evicted_user, _ = self._handles.popitem(last=False)
+                self.evictions += 1
+                logger.debug(f"Evicted least recently used vector store handle for user {evicted_user}.")
+            return vectorstore
+
+    def invalidate(self, user_id: str) -> bool:
+        """Drops the cached handle for a user. Returns True if one was cached."""
+        with self._lock:
+            if self._handles.pop(user_id, None) is None:
+                return False
+            self.invalidations += 1
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self.invalidations += len(self._handles)
+            self._handles.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "open_handles": len(self._handles),
+                "max_handles": self.max_handles,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+_store_registry = VectorStoreRegistry(
+    max_handles=settings.VECTORSTORE_CACHE_MAX_HANDLES,
+    idle_timeout=settings.VECTORSTORE_CACHE_IDLE_TIMEOUT_SECONDS,
+)
+
+
+def get_vectorstore_cache_stats() -> dict:
+    """Returns hit/miss counters and the number of open handles in the store registry."""
+    return _store_registry.stats()
+
+
+def invalidate_vectorstore(user_id: str) -> None:
+    """
+    Forgets the cached Chroma handle for a user. Must be called whenever the user's
+    store is deleted or rebuilt on disk, so the next access reopens it.
+    """
+    if _store_registry.invalidate(user_id):
+        logger.info(f"Invalidated cached vector store handle for user {user_id}.")
+
+
+def delete_user_store(user_id: str) -> bool:
+    """
+    Removes a user's whole persisted vector store and its cached handle.
+    Returns True if a store directory (or, in the shared layout, any record) existed and was removed.
+    """
+    invalidate_vectorstore(user_id)
+    answer_cache.invalidate_user(user_id)
+    chunk_manifest.remove_user(user_id)
+    if lexical_index is not None:
+        lexical_index.remove_user(user_id)
+        _lexical_verified_users.discard(user_id)
+    if quantized_index is not None:
+        quantized_index.remove_user(user_id)
+        _quantized_verified_users.pop(user_id, None)
+    if settings.VECTORSTORE_MODE == "shared":
+        tenant = _tenant_collection(user_id)
+        if tenant.is_empty():
+            return False
+        tenant.delete_all()
+        logger.info(f"Deleted the records of user {user_id} from shared collection {tenant.name}.")
+        return True
+    user_persist_directory = settings.CHROMA_STORE_DIR / user_id
+    if not user_persist_directory.exists():
+        return False
+    shutil.rmtree(user_persist_directory)
+    logger.info(f"Deleted vector store for user {user_id} at {user_persist_directory}.")
+    return True
+
+
+_shared_client: Optional[chromadb.ClientAPI] = None
+_shared_client_lock = threading.Lock()
+
+
+def _get_shared_client() -> chromadb.ClientAPI:
+    """The one Chroma client of the shared layout (opened on first use)."""
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            settings.SHARED_CHROMA_STORE_DIR.mkdir(parents=True, exist_ok=True)
+            _shared_client = chromadb.PersistentClient(path=str(settings.SHARED_CHROMA_STORE_DIR))
+            logger.info(f"Opened shared vector store at {settings.SHARED_CHROMA_STORE_DIR} ({settings.VECTORSTORE_SHARDS} shard(s)).")
+    return _shared_client
+
+
+def _tenant_collection(user_id: str) -> TenantCollection:
+    """A user's scoped view of their shard in the shared layout."""
+    name = shard_collection_name(user_id, settings.VECTORSTORE_SHARDS)
+    return TenantCollection(
+        _get_shared_client().get_or_create_collection(name), user_id, exact_search_max_records=settings.VECTORSTORE_EXACT_SEARCH_MAX_RECORDS
+    )
+
+
+def _get_tenant_store(user_id: str, create_if_not_exists: bool) -> Optional[Chroma]:
+    """
+    get_vectorstore for the shared layout: a LangChain Chroma wrapper whose collection is
+    the user's TenantCollection. A user without records has no store unless it is created.
+    """
+    cached_vectorstore = _store_registry.get(user_id)
+    if cached_vectorstore is not None:
+        return cached_vectorstore
+    try:
+        tenant = _tenant_collection(user_id)
+        if not create_if_not_exists and tenant.is_empty():
+            logger.info(f"User {user_id} has no records in the shared vector store and create_if_not_exists is False.")
+            return None
+        vectorstore = Chroma(client=_get_shared_client(), collection_name=tenant.name, embedding_function=_chroma_embeddings())
+        vectorstore._collection = tenant # Every collection call LangChain or this module makes is scoped to the user
+        return _store_registry.put(user_id, vectorstore)
+    except Exception as e:
+        logger.error(f"Error opening the shared vector store for user {user_id}: {e}", exc_info=True)
+        return None
+
+
 def get_vectorstore(user_id: str, create_if_not_exists: bool = True) -> Optional[Chroma]:
     """
     Loads an existing ChromaDB vector store for a user or creates one if it doesn't exist.
-    Data is persisted in user-specific directories.
+    Data is persisted in user-specific directories, or in the user's shard of the shared
+    collections (VECTORSTORE_MODE=shared). Open handles are cached in a process-wide
+    registry, so repeated calls for the same user reuse the same instance.
     """
     if not embeddings_model:
         logger.error(f"Embeddings model not available for user {user_id}. Cannot get/create vector store.")
         return None
+    if settings.VECTORSTORE_MODE == "shared":
+        return _get_tenant_store(user_id, create_if_not_exists)
 
     user_persist_directory = settings.CHROMA_STORE_DIR / user_id
 
     if not user_persist_directory.exists():
+        # The store may have been removed from disk while a handle was still cached.
+        invalidate_vectorstore(user_id)
         if create_if_not_exists:
             logger.info(f"No existing vector store found for user {user_id} at {user_persist_directory}. Creating new one.")
             user_persist_directory.mkdir(parents=True, exist_ok=True)
@@ -46,12 +305,12 @@ def get_vectorstore(user_id: str, create_if_not_exists: bool = True) -> Optional
             # A simple way to initialize an empty one that can be persisted:
             try:
                 db = Chroma(
-                    embedding_function=embeddings_model,
+                    embedding_function=_chroma_embeddings(),
                     persist_directory=str(user_persist_directory)
                 )
                 # db.persist() # Ensure the directory structure is made if not already.
                 logger.info(f"Created empty vector store for user {user_id} at {user_persist_directory}")
-                return db
+                return _store_registry.put(user_id, db)
             except Exception as e:
                 logger.error(f"Error creating empty vector store for user {user_id}: {e}", exc_info=True)
                 return None
@@ -59,16 +318,21 @@ def get_vectorstore(user_id: str, create_if_not_exists: bool = True) -> Optional
             logger.info(f"Vector store for user {user_id} does not exist and create_if_not_exists is False.")
             return None
 
+    cached_vectorstore = _store_registry.get(user_id)
+    if cached_vectorstore is not None:
+        logger.debug(f"Reusing cached vector store handle for user {user_id}.")
+        return cached_vectorstore
+
     try:
         logger.info(f"Loading existing vector store for user {user_id} from {user_persist_directory}.")
         vectorstore = Chroma(
             persist_directory=str(user_persist_directory),
-            embedding_function=embeddings_model
+            embedding_function=_chroma_embeddings()
         )
         # Test if the collection is accessible (e.g. by trying a dummy get)
         # vectorstore.get(limit=1) # This might raise an error if collection doesn't exist or is empty
         logger.info(f"Successfully loaded vector store for user {user_id}.")
-        return vectorstore
+        return _store_registry.put(user_id, vectorstore)
     except Exception as e:
         # This can happen if the directory exists but is corrupted or not a valid Chroma store
         logger.error(f"Error loading vector store for user {user_id} from {user_persist_directory}: {e}", exc_info=True)
@@ -76,10 +340,233 @@ def get_vectorstore(user_id: str, create_if_not_exists: bool = True) -> Optional
         return None
 
 
-def add_documents_to_store(user_id: str, documents: list[LangchainDocument]) -> bool:
+def list_store_users() -> list[str]:
+    """Users with a vector store: per-user store directories, or the users of the chunk manifest in the shared layout."""
+    if settings.VECTORSTORE_MODE == "shared":
+        return chunk_manifest.list_users()
+    return sorted(path.name for path in settings.CHROMA_STORE_DIR.iterdir() if path.is_dir())
+
+
+def migrate_user_to_shared(user_id: str, delete_source: bool = False) -> int:
+    """
+    Copies a user's per-user store (CHROMA_STORE_DIR/<user_id>) into their shard of the
+    shared layout, with the stored embeddings (nothing is re-embedded), documents, metadata
+    and chunk IDs, so the chunk manifest and lexical index stay valid. Records are
+    upserted, so an interrupted migration can simply be run again. The copy is checked by
+    count before `delete_source` removes the per-user directory. Returns the records copied.
+    """
+    source_directory = settings.CHROMA_STORE_DIR / user_id
+    if not source_directory.is_dir():
+        return 0
+    tenant = _tenant_collection(user_id)
+    client = chromadb.PersistentClient(path=str(source_directory))
+    try:
+        try:
+            source = client.get_collection(Chroma._LANGCHAIN_DEFAULT_COLLECTION_NAME)
+        except chromadb.errors.NotFoundError:
+            logger.info(f"Per-user store of {user_id} has no collection; nothing to migrate.")
+            return 0
+        copied, expected = 0, source.count()
+        while True:
+            page = source.get(include=["embeddings", "documents", "metadatas"], limit=CHROMA_WRITE_BATCH_SIZE, offset=copied)
+            if not page["ids"]:
+                break
+            tenant.upsert(ids=page["ids"], embeddings=page["embeddings"], metadatas=page["metadatas"], documents=page["documents"])
+            copied += len(page["ids"])
+    finally:
+        client.close()
+
+    migrated = tenant.count()
+    if migrated < expected:
+        raise RuntimeError(f"Migrated store of user {user_id} has {migrated} of {expected} record(s); the source was kept.")
+    invalidate_vectorstore(user_id)
+    answer_cache.invalidate_user(user_id)
+    if delete_source:
+        shutil.rmtree(source_directory)
+    logger.info(f"Migrated {copied} record(s) of user {user_id} into shared collection {tenant.name}.")
+    return copied
+
+
+def _reset_chroma_clients() -> None:
+    """
+    Closes every Chroma client of the process and forgets the cached handles. Chroma keeps
+    one open system per store path, which would go on reading a store directory that was
+    replaced on disk.
+    """
+    global _shared_client
+    _store_registry.clear()
+    with _shared_client_lock:
+        _shared_client = None
+    SharedSystemClient.clear_system_cache()
+
+
+def _copy_reencoded(source, target) -> int:
+    """
+    Copies every record of a Chroma collection into another one, with its vector re-encoded
+    at EMBEDDING_DIMENSIONS: from the full vector in the embedding cache when it has the
+    chunk text (so a store can also be widened again), else from the stored vector.
+    Returns the records copied.
+    """
+    copied = 0
+    while True:
+        page = source.get(include=["embeddings", "documents", "metadatas"], limit=CHROMA_WRITE_BATCH_SIZE, offset=copied)
+        if not page["ids"]:
+            return copied
+        vectors = list(page["embeddings"])
+        if isinstance(store_embeddings, CachedEmbeddings):
+            cached = store_embeddings.lookup(page["documents"])
+            vectors = [full if full is not None else stored for full, stored in zip(cached, vectors)]
+        target.upsert(ids=page["ids"], embeddings=_stored_vectors(vectors), metadatas=page["metadatas"], documents=page["documents"])
+        copied += len(page["ids"])
+
+
+def reencode_user_store(user_id: str) -> int:
+    """
+    Rewrites a per-user store with its vectors at the current EMBEDDING_DIMENSIONS (Chroma
+    fixes a collection's width, so the store is rebuilt next to the old one and swapped in
+    once its count is verified) and rebuilds the user's quantized codes. Chunk IDs,
+    documents and metadata are kept, so the chunk manifest and lexical index stay valid.
+    Returns the records re-encoded.
+    """
+    source_directory = settings.CHROMA_STORE_DIR / user_id
+    if not source_directory.is_dir():
+        return 0
+    staging_directory = settings.CHROMA_STORE_DIR.with_name(f"{settings.CHROMA_STORE_DIR.name}_reencode") / user_id
+    shutil.rmtree(staging_directory, ignore_errors=True)
+    invalidate_vectorstore(user_id)
+    source_client = chromadb.PersistentClient(path=str(source_directory))
+    target_client = chromadb.PersistentClient(path=str(staging_directory))
+    copied = 0
+    try:
+        try:
+            source = source_client.get_collection(Chroma._LANGCHAIN_DEFAULT_COLLECTION_NAME)
+        except chromadb.errors.NotFoundError:
+            source = None
+            logger.info(f"Per-user store of {user_id} has no collection; nothing to re-encode.")
+        if source is not None:
+            target = target_client.create_collection(Chroma._LANGCHAIN_DEFAULT_COLLECTION_NAME, metadata=source.metadata)
+            copied = _copy_reencoded(source, target)
+            if target.count() != source.count():
+                raise RuntimeError(f"Re-encoded store of user {user_id} has {target.count()} of {source.count()} record(s); the original was kept.")
+    finally:
+        source_client.close()
+        target_client.close()
+
+    if copied:
+        shutil.rmtree(source_directory)
+        staging_directory.rename(source_directory)
+        _reset_chroma_clients()
+    shutil.rmtree(staging_directory, ignore_errors=True)
+    rebuild_quantized_codes(user_id)
+    logger.info(f"Re-encoded {copied} vector(s) of user {user_id} at {settings.EMBEDDING_DIMENSIONS or 'full'} dimensions.")
+    return copied
+
+
+def reencode_shared_shard(name: str) -> int:
+    """
+    reencode_user_store for one collection of the shared layout, which holds the records
+    of many users: the shard is copied into a new collection that replaces it once its
+    count is verified. Quantized codes are rebuilt per user (rebuild_quantized_codes).
+    Returns the records re-encoded.
+    """
+    client = _get_shared_client()
+    try:
+        source = client.get_collection(name)
+    except chromadb.errors.NotFoundError:
+        return 0
+    staging_name = f"{name}_reencode"
+    try:
+        client.delete_collection(staging_name)
+    except chromadb.errors.NotFoundError:
+        pass
+    target = client.create_collection(staging_name, metadata=source.metadata)
+    copied = _copy_reencoded(source, target)
+    if target.count() != source.count():
+        raise RuntimeError(f"Re-encoded shard {name} has {target.count()} of {source.count()} record(s); the original was kept.")
+    client.delete_collection(name)
+    target.modify(name=name)
+    _store_registry.clear() # Cached tenant views still point at the deleted collection
+    logger.info(f"Re-encoded {copied} vector(s) of shared collection {name} at {settings.EMBEDDING_DIMENSIONS or 'full'} dimensions.")
+    return copied
+
+
+def rebuild_quantized_codes(user_id: str) -> int:
+    """Replaces a user's quantized codes with those of their stored vectors (no-op without VECTOR_QUANTIZATION); returns the codes written."""
+    if quantized_index is None:
+        return 0
+    quantized_index.remove_user(user_id)
+    _quantized_verified_users.pop(user_id, None)
+    vectorstore = get_vectorstore(user_id, create_if_not_exists=False)
+    if vectorstore is None:
+        return 0
+    sample = vectorstore._collection.get(limit=1, include=["embeddings"])
+    if not len(sample["ids"]):
+        return 0
+    _ensure_quantized_index(user_id, vectorstore, len(sample["embeddings"][0]))
+    return quantized_index.chunk_count(user_id, len(sample["embeddings"][0]))
+
+
+def get_embedding_cache_stats() -> Optional[dict]:
+    """Returns cumulative embedding cache counters, or None if the cache is disabled."""
+    if isinstance(store_embeddings, CachedEmbeddings):
+        return store_embeddings.get_stats()
+    return None
+
+
+def _upsert_embedded_documents(
+    vectorstore: Chroma,
+    ids: list[str],
+    documents: list[LangchainDocument],
+    vectors: list[list[float]]
+) -> None:
+    """Writes documents with precomputed embeddings into the underlying Chroma collection."""
+    for start in range(0, len(documents), CHROMA_WRITE_BATCH_SIZE):
+        end = start + CHROMA_WRITE_BATCH_SIZE
+        vectorstore._collection.upsert(
+            ids=ids[start:end],
+            embeddings=vectors[start:end],
+            metadatas=[doc.metadata or None for doc in documents[start:end]],
+            documents=[doc.page_content for doc in documents[start:end]]
+        )
+
+
+def compute_chunk_ids(filename: str, documents: list[LangchainDocument]) -> list[str]:
+    """
+    Derives deterministic chunk IDs from the file name, chunk content and metadata.
+    Re-indexing the same file therefore upserts the same records instead of adding
+    duplicates. Identical chunks within a file are told apart by an occurrence counter.
+    """
+    seen: Counter = Counter()
+    ids = []
+    for doc in documents:
+        # The 'source' path changes when a file moves between directories, so it is not part of the identity
+        stable_metadata = {k: v for k, v in doc.metadata.items() if k != "source"}
+        digest = hashlib.sha256(
+            "\x00".join([filename, json.dumps(stable_metadata, sort_keys=True, default=str), doc.page_content]).encode("utf-8")
+        ).hexdigest()[:40]
+        ids.append(f"{digest}-{seen[digest]}")
+        seen[digest] += 1
+    return ids
+
+
+async def aadd_documents_to_store(
+    user_id: str,
+    documents: list[LangchainDocument],
+    ids: Optional[list[str]] = None,
+    cache_stats: Optional[EmbeddingCacheStats] = None,
+    pipeline_metrics: Optional[EmbeddingPipelineMetrics] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None
+) -> bool:
     """
     Adds a list of Langchain Document objects to the user's ChromaDB vector store.
     If the store doesn't exist, it will be created.
+
+    Embeddings are looked up in the embedding cache first. Cache misses go through the
+    batched embedding pipeline, and each batch is written to Chroma as soon as it is
+    embedded. Records are upserted, so passing the same `ids` again (see
+    `compute_chunk_ids`) overwrites instead of duplicating; random IDs are used otherwise.
+    If `cache_stats` / `pipeline_metrics` are given, this call's counters are added to
+    them, and `progress_callback(written, total)` is called after every write.
     """
     if not embeddings_model:
         logger.error(f"Embeddings model not available for user {user_id}. Cannot add documents.")
@@ -88,38 +575,213 @@ def add_documents_to_store(user_id: str, documents: list[LangchainDocument]) ->
         logger.warning(f"No documents provided to add for user {user_id}.")
         return True # Or False, depending on desired behavior for empty list
 
-    user_persist_directory = str(settings.CHROMA_STORE_DIR / user_id)
-    os.makedirs(user_persist_directory, exist_ok=True) # Ensure directory exists
-
+    written = 0
     try:
-        # Chroma.from_documents handles creation if store/collection doesn't exist,
-        # or adds to existing if it does (though this behavior can vary with Chroma versions/config).
-        # For more explicit control, one might load then add.
-        # However, to ensure it appends or creates robustly:
-
-        # Try to load existing store first
-        vectorstore = get_vectorstore(user_id, create_if_not_exists=True) # It will create an empty one if not found
-        if vectorstore:
-            vectorstore.add_documents(documents=documents)
-            logger.info(f"Added {len(documents)} documents to existing store for user {user_id}.")
-        else: # Should not happen if get_vectorstore creates one, but as a fallback
-            logger.info(f"No existing store, creating new store with documents for user {user_id}.")
-            vectorstore = Chroma.from_documents(
-                documents=documents,
-                embedding=embeddings_model,
-                persist_directory=user_persist_directory
-            )
+        vectorstore = await asyncio.to_thread(get_vectorstore, user_id, True) # Creates an empty store if not found
+        if vectorstore is None:
+            logger.error(f"Could not open or create vector store for user {user_id}. Cannot add documents.")
+            return False
+
+        texts = [doc.page_content for doc in documents]
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in documents]
+        token_counts = [estimate_token_count(text) for text in texts]
+        write_lock = asyncio.Lock() # Serialize writes into the collection
+
+        async def write_batch(indices: list[int], vectors: list[list[float]]) -> None:
+            nonlocal written
+            vectors = _stored_vectors(vectors) # The embedding cache keeps the full vectors
+            async with write_lock:
+                await asyncio.to_thread(
+                    _upsert_embedded_documents,
+                    vectorstore,
+                    [ids[i] for i in indices],
+                    [documents[i] for i in indices],
+                    vectors
+                )
+                if lexical_index is not None:
+                    await asyncio.to_thread(
+                        lexical_index.add, user_id, [ids[i] for i in indices], [texts[i] for i in indices], [documents[i].metadata for i in indices]
+                    )
+                if quantized_index is not None:
+                    await asyncio.to_thread(quantized_index.add, user_id, [ids[i] for i in indices], vectors)
+                written += len(indices)
+                if progress_callback is not None:
+                    progress_callback(written, len(documents))
+
+        # 1. Serve what we can from the embedding cache and write those chunks right away
+        call_stats = EmbeddingCacheStats()
+        miss_indices = list(range(len(documents)))
+        if isinstance(store_embeddings, CachedEmbeddings):
+            cached_vectors = await asyncio.to_thread(store_embeddings.lookup, texts)
+            hit_indices = [i for i, v in enumerate(cached_vectors) if v is not None]
+            miss_indices = [i for i, v in enumerate(cached_vectors) if v is None]
+            call_stats.hits = len(hit_indices)
+            call_stats.tokens_saved = sum(token_counts[i] for i in hit_indices)
+            if hit_indices:
+                await write_batch(hit_indices, [cached_vectors[i] for i in hit_indices])
+
+        # 2. Embed cache misses in token-budgeted batches, streaming each batch into the store
+        async def embed_batch(batch_texts: list[str]) -> list[list[float]]:
+            return await embeddings_model.aembed_documents(batch_texts)
+
+        async def on_batch_done(batch_indices: list[int], vectors: list[list[float]]) -> None:
+            doc_indices = [miss_indices[i] for i in batch_indices]
+            if isinstance(store_embeddings, CachedEmbeddings):
+                await asyncio.to_thread(store_embeddings.store, [texts[i] for i in doc_indices], vectors)
+            await write_batch(doc_indices, vectors)
+
+        run_metrics = await run_embedding_pipeline(
+            texts=[texts[i] for i in miss_indices],
+            token_counts=[token_counts[i] for i in miss_indices],
+            embed_batch=embed_batch,
+            on_batch_done=on_batch_done
+        )
+        call_stats.misses = len(miss_indices)
+        call_stats.tokens_embedded = run_metrics.tokens
+
+        if isinstance(store_embeddings, CachedEmbeddings):
+            store_embeddings.record(call_stats)
+        if cache_stats is not None:
+            cache_stats.merge(call_stats)
+        if pipeline_metrics is not None:
+            pipeline_metrics.merge(run_metrics)
 
-        vectorstore.persist() # Ensure changes are saved
-        logger.info(f"Successfully added {len(documents)} documents and persisted store for user {user_id}.")
+        logger.info(
+            f"Successfully added {len(documents)} documents for user {user_id} "
+            f"({call_stats.hits} from embedding cache, {call_stats.misses} embedded in {run_metrics.batches} batch(es))."
+        )
         return True
     except Exception as e:
         logger.error(f"Error adding documents to vector store for user {user_id}: {e}", exc_info=True)
         return False
+    finally:
+        if written:
+            answer_cache.invalidate_user(user_id) # The corpus changed, even if only partially written
+
+
+_indexing_loop: Optional[asyncio.AbstractEventLoop] = None
+_indexing_loop_lock = threading.Lock()
+
+
+def _get_indexing_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the background event loop used by synchronous indexing callers.
+    All of them share one long-lived loop, so the embeddings model's async HTTP client
+    is always used from the loop it was created on.
+    """
+    global _indexing_loop
+    with _indexing_loop_lock:
+        if _indexing_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="indexing-event-loop", daemon=True).start()
+            _indexing_loop = loop
+    return _indexing_loop
+
+
+def add_documents_to_store(
+    user_id: str,
+    documents: list[LangchainDocument],
+    ids: Optional[list[str]] = None,
+    cache_stats: Optional[EmbeddingCacheStats] = None,
+    pipeline_metrics: Optional[EmbeddingPipelineMetrics] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None
+) -> bool:
+    """
+    Synchronous wrapper around `aadd_documents_to_store` for worker threads and scripts.
+    Blocks until the documents are stored; the pipeline itself runs on the shared
+    background indexing loop. Must not be called from a coroutine.
+    """
+    coro = aadd_documents_to_store(user_id, documents, ids, cache_stats, pipeline_metrics, progress_callback)
+    return asyncio.run_coroutine_threadsafe(coro, _get_indexing_loop()).result()
+
+def _delete_ids(user_id: str, vectorstore: Chroma, ids: list[str]) -> None:
+    """Deletes records from the user's collection and from their lexical and quantized indexes."""
+    for start in range(0, len(ids), CHROMA_READ_BATCH_SIZE):
+        vectorstore._collection.delete(ids=ids[start:start + CHROMA_READ_BATCH_SIZE])
+    if lexical_index is not None:
+        lexical_index.remove(user_id, ids)
+    if quantized_index is not None:
+        quantized_index.remove(user_id, ids)
+
+
+def chunk_page(metadata: dict) -> Optional[int]:
+    """
+    First 0-based page a chunk depends on: tables carry a 1-based 'table_page', text sections
+    their section's first page (all of a section's chunks change when any of its pages does).
+    """
+    if metadata.get("content_type") == "table_chunk":
+        table_page = metadata.get("table_page")
+        return int(table_page) - 1 if table_page is not None else None
+    page = metadata.get("section_page_start", metadata.get("page"))
+    return int(page) if page is not None else None
+
+
+def chunk_page_end(metadata: dict) -> Optional[int]:
+    """Last 0-based page a chunk depends on (see chunk_page)."""
+    if metadata.get("content_type") != "table_chunk" and metadata.get("section_page_end") is not None:
+        return int(metadata["section_page_end"])
+    return chunk_page(metadata)
+
+
+def record_indexed_file(
+    user_id: str,
+    filename: str,
+    content_hash: Optional[str],
+    ids: list[str],
+    documents: list[LangchainDocument],
+    page_hashes: Optional[list[str]] = None,
+    document_hash: Optional[str] = None,
+    kept_chunks: Optional[list[ManifestChunk]] = None
+) -> int:
+    """
+    Records a freshly indexed file in the chunk manifest and deletes the chunks of its
+    previous version that were neither upserted again nor kept (`kept_chunks`, the chunks
+    of unchanged pages in an incremental re-index). Returns the number of stale chunks deleted.
+    """
+    chunks = list(kept_chunks or []) + [
+        ManifestChunk(chunk_id, chunk_page(doc.metadata), doc.metadata.get("content_type"), chunk_page_end(doc.metadata))
+        for chunk_id, doc in zip(ids, documents)
+    ]
+    stale_ids = chunk_manifest.record_file(user_id, filename, content_hash, chunks, page_hashes, document_hash)
+    if stale_ids:
+        vectorstore = get_vectorstore(user_id, create_if_not_exists=False)
+        if vectorstore is not None:
+            _delete_ids(user_id, vectorstore, stale_ids)
+            answer_cache.invalidate_user(user_id)
+        logger.info(f"Deleted {len(stale_ids)} stale chunk(s) of the previous version of '{filename}' for user {user_id}.")
+    return len(stale_ids)
+
+
+def update_chunk_metadata(user_id: str, ids: list[str], metadata_updates: dict) -> None:
+    """
+    Merges `metadata_updates` into the metadata of existing chunks without re-embedding
+    them (used when a re-uploaded file's document-level metadata changed but the pages
+    of these chunks did not).
+    """
+    vectorstore = get_vectorstore(user_id, create_if_not_exists=False)
+    if vectorstore is None or not ids:
+        return
+    for start in range(0, len(ids), CHROMA_READ_BATCH_SIZE):
+        batch = vectorstore._collection.get(ids=ids[start:start + CHROMA_READ_BATCH_SIZE], include=["metadatas"])
+        vectorstore._collection.update(
+            ids=batch["ids"],
+            metadatas=[{**(metadata or {}), **metadata_updates} for metadata in batch["metadatas"]]
+        )
+    answer_cache.invalidate_user(user_id) # Cached sources carry the old metadata
+
+
+def list_indexed_files(user_id: str) -> list[dict]:
+    """The user's indexed files as recorded in the chunk manifest."""
+    return chunk_manifest.list_files(user_id)
+
 
 def delete_documents_from_store(user_id: str, filenames: list[str]) -> bool:
     """
-    Deletes documents from the user's ChromaDB where the 'source' metadata field matches any of the given filenames.
+    Deletes the chunks of the given files from the user's ChromaDB.
+
+    Chunk IDs come from the chunk manifest. Files indexed before the manifest existed
+    are found through their 'original_source' metadata instead.
     """
     if not filenames:
         logger.info(f"No filenames provided for deletion for user {user_id}.")
@@ -131,36 +793,429 @@ def delete_documents_from_store(user_id: str, filenames: list[str]) -> bool:
         return False # Or True if no store means documents are "deleted"
 
     try:
-        # To delete by metadata, we typically need the document IDs.
-        # We fetch documents that match the source metadata and then delete by their IDs.
+        manifest_ids = chunk_manifest.get_chunk_ids(user_id, filenames)
         ids_to_delete_all_files = []
         for filename_to_delete in filenames:
-            # Chroma's get method can filter by metadata using `where` clause
-            # Example: where={"source": filename_to_delete}
-            # This is more efficient than fetching all and filtering in Python.
-            retrieved_docs = vectorstore.get(
-                where={"source": filename_to_delete},
-                include=[] # We only need IDs for deletion
-            )
-            ids_for_current_file = retrieved_docs.get("ids", [])
+            ids_for_current_file = manifest_ids.get(filename_to_delete)
+            if ids_for_current_file is None:
+                ids_for_current_file = vectorstore.get(
+                    where={"original_source": filename_to_delete},
+                    include=[] # We only need IDs for deletion
+                ).get("ids", [])
             if ids_for_current_file:
                 logger.info(f"Found {len(ids_for_current_file)} embedding(s) for file '{filename_to_delete}' for user {user_id}.")
                 ids_to_delete_all_files.extend(ids_for_current_file)
             else:
                 logger.info(f"No embeddings found for file '{filename_to_delete}' for user {user_id}.")
 
+        if ids_to_delete_all_files:
+            _delete_ids(user_id, vectorstore, ids_to_delete_all_files)
+            answer_cache.invalidate_user(user_id)
+        chunk_manifest.remove_files(user_id, filenames)
+
         if not ids_to_delete_all_files:
             logger.info(f"No embeddings found matching any of the provided filenames for user {user_id}. Nothing to delete.")
             return True # Successfully "deleted" nothing
-
-        vectorstore.delete(ids=ids_to_delete_all_files)
-        vectorstore.persist() # Persist changes after deletion
         logger.info(f"Successfully deleted {len(ids_to_delete_all_files)} embeddings for user {user_id} corresponding to {len(filenames)} file(s).")
         return True
     except Exception as e:
         logger.error(f"Error deleting documents from vector store for user {user_id}: {e}", exc_info=True)
         return False
 
+
+def _is_empty(vectorstore: Chroma) -> bool:
+    """Whether a store has no records (without counting them, which is a scan in the shared layout)."""
+    return not vectorstore._collection.get(limit=1, include=[])["ids"]
+
+
+def _iter_store_records(vectorstore: Chroma, include: list[str]):
+    """Yields (id, metadata) for every record of a collection, reading it in pages."""
+    offset = 0
+    while True:
+        page = vectorstore._collection.get(include=include, limit=CHROMA_READ_BATCH_SIZE, offset=offset)
+        ids = page["ids"]
+        if not ids:
+            return
+        metadatas = page.get("metadatas") or [None] * len(ids)
+        yield from zip(ids, metadatas)
+        offset += len(ids)
+
+
+def check_index_consistency(user_id: str, repair: bool = False) -> dict:
+    """
+    Compares a user's vector store with their chunk manifest and reports:
+    - orphaned embeddings: records in the store that no manifest entry owns,
+    - missing embeddings: manifest chunk IDs that are not in the store,
+    - lexical drift (with hybrid search): stored chunks missing from the lexical index
+      and lexical index entries whose chunk is not in the store,
+    - quantized drift (with VECTOR_QUANTIZATION): stored chunks without a code of the
+      current scheme and stored width, and codes whose chunk is not in the store.
+
+    With `repair`, files indexed before the manifest existed (orphans carrying an
+    'original_source' of a file that has no manifest entry) are adopted into the
+    manifest, the remaining orphans are deleted from the store, missing chunk
+    IDs are dropped from the manifest, and a drifted lexical index or set of codes is
+    rebuilt from the store.
+    """
+    report = {
+        "user_id": user_id,
+        "store_chunks": 0,
+        "manifest_files": len(chunk_manifest.list_files(user_id)),
+        "manifest_chunks": 0,
+        "orphaned_embeddings": [],
+        "missing_embeddings": [],
+        "lexical_missing": [],
+        "lexical_orphaned": [],
+        "quantized_missing": [],
+        "quantized_orphaned": [],
+        "adopted_files": [],
+        "deleted_orphans": 0,
+        "rebuilt_indexes": [],
+        "repaired": repair,
+    }
+    manifest_owners = chunk_manifest.all_chunk_ids(user_id)
+    report["manifest_chunks"] = len(manifest_owners)
+
+    vectorstore = get_vectorstore(user_id, create_if_not_exists=False)
+    store_ids = set()
+    orphan_metadata: dict[str, dict] = {}
+    if vectorstore is not None:
+        for chunk_id, metadata in _iter_store_records(vectorstore, include=["metadatas"]):
+            store_ids.add(chunk_id)
+            if chunk_id not in manifest_owners:
+                orphan_metadata[chunk_id] = metadata or {}
+    report["store_chunks"] = len(store_ids)
+    report["orphaned_embeddings"] = sorted(orphan_metadata)
+    report["missing_embeddings"] = sorted(set(manifest_owners) - store_ids)
+    if lexical_index is not None:
+        lexical_ids = lexical_index.chunk_ids(user_id)
+        report["lexical_missing"] = sorted(store_ids - lexical_ids)
+        report["lexical_orphaned"] = sorted(lexical_ids - store_ids)
+    if quantized_index is not None:
+        coded_ids = set()
+        if store_ids:
+            sample = vectorstore._collection.get(limit=1, include=["embeddings"])
+            coded_ids = quantized_index.chunk_ids(user_id, len(sample["embeddings"][0]))
+        report["quantized_missing"] = sorted(store_ids - coded_ids)
+        report["quantized_orphaned"] = sorted(quantized_index.chunk_ids(user_id) - store_ids)
+
+    if not repair:
+        return report
+
+    if report["missing_embeddings"]:
+        chunk_manifest.remove_chunks(user_id, report["missing_embeddings"])
+
+    legacy_files: dict[str, list[str]] = {}
+    known_files = {f["filename"] for f in chunk_manifest.list_files(user_id)}
+    for chunk_id, metadata in orphan_metadata.items():
+        source = metadata.get("original_source")
+        if source and source not in known_files:
+            legacy_files.setdefault(source, []).append(chunk_id)
+    for filename, ids in legacy_files.items():
+        processed_file_path = settings.UPLOADED_FILES_DIR / user_id / filename
+        chunk_manifest.record_file(
+            user_id,
+            filename,
+            file_content_hash(processed_file_path) if processed_file_path.exists() else None,
+            [
+                ManifestChunk(
+                    chunk_id,
+                    chunk_page(orphan_metadata[chunk_id]),
+                    orphan_metadata[chunk_id].get("content_type"),
+                    chunk_page_end(orphan_metadata[chunk_id])
+                )
+                for chunk_id in ids
+            ]
+        ) # Adopted without page hashes, so the next re-upload of the file is a full re-index
+    report["adopted_files"] = sorted(legacy_files)
+
+    adopted_ids = {chunk_id for ids in legacy_files.values() for chunk_id in ids}
+    unowned_ids = [chunk_id for chunk_id in report["orphaned_embeddings"] if chunk_id not in adopted_ids]
+    if unowned_ids:
+        _delete_ids(user_id, vectorstore, unowned_ids)
+        answer_cache.invalidate_user(user_id)
+    report["deleted_orphans"] = len(unowned_ids)
+    if report["lexical_missing"] or report["lexical_orphaned"]:
+        _rebuild_lexical_index(user_id, vectorstore)
+        report["rebuilt_indexes"].append("lexical")
+    if report["quantized_missing"] or report["quantized_orphaned"]:
+        rebuild_quantized_codes(user_id)
+        report["rebuilt_indexes"].append("quantized")
+    logger.info(
+        f"Repaired index of user {user_id}: adopted {len(legacy_files)} file(s), deleted {len(unowned_ids)} orphaned "
+        f"embedding(s), dropped {len(report['missing_embeddings'])} missing chunk(s) from the manifest, "
+        f"rebuilt indexes: {', '.join(report['rebuilt_indexes']) or 'none'}."
+    )
+    return report
+
+def normalize_stored_metadata(user_id: str) -> int:
+    """
+    Rewrites the metadata of a user's stored chunks with normalize_chunk_metadata (chunks
+    indexed before the filter fields were typed, e.g. tables without page numbers) and
+    rebuilds their lexical index with it, so metadata filters see every chunk. Embeddings
+    and chunk IDs are unchanged. Returns the number of chunks whose metadata changed.
+    """
+    vectorstore = get_vectorstore(user_id, create_if_not_exists=False)
+    if vectorstore is None:
+        return 0
+    changed_ids, changed_metadatas = [], []
+    for chunk_id, metadata in _iter_store_records(vectorstore, ["metadatas"]):
+        normalized = normalize_chunk_metadata(metadata or {})
+        if normalized != (metadata or {}):
+            changed_ids.append(chunk_id)
+            changed_metadatas.append(normalized)
+    for start in range(0, len(changed_ids), CHROMA_READ_BATCH_SIZE):
+        vectorstore._collection.update(
+            ids=changed_ids[start:start + CHROMA_READ_BATCH_SIZE],
+            metadatas=changed_metadatas[start:start + CHROMA_READ_BATCH_SIZE]
+        )
+    if lexical_index is not None:
+        _rebuild_lexical_index(user_id, vectorstore) # Now with the filter fields
+    if changed_ids:
+        answer_cache.invalidate_user(user_id) # Cached sources carry the old metadata
+    logger.info(f"Normalized the metadata of {len(changed_ids)} chunk(s) of user {user_id}.")
+    return len(changed_ids)
+
+
+def _query_collection(vectorstore: Chroma, query_vector: list[float], k: int, where: Optional[ChunkFilter] = None) -> list[tuple[LangchainDocument, float]]:
+    """
+    Nearest-neighbour query on the raw collection, restricted to chunks matching `where`
+    (pushed down as a Chroma where clause); the record ID is exposed as metadata['chunk_id'].
+    """
+    if _is_empty(vectorstore):
+        return []
+    result = vectorstore._collection.query(
+        query_embeddings=[query_vector],
+        n_results=k,
+        where=where.chroma_where() if where is not None else None,
+        include=["documents", "metadatas", "distances"]
+    )
+    return [
+        (LangchainDocument(page_content=text, metadata={**(metadata or {}), "chunk_id": chunk_id}), distance)
+        for chunk_id, text, metadata, distance in zip(
+            result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0]
+        )
+    ]
+
+
+_lexical_backfill_lock = threading.Lock()
+# Users whose lexical index was checked against their store in this process; from then on
+# every write and delete updates both, so the check is not repeated on every query
+_lexical_verified_users: set[str] = set()
+
+
+def _ensure_lexical_index(user_id: str, vectorstore: Chroma) -> None:
+    """
+    Rebuilds a user's lexical index from their vector store if it does not hold as many
+    chunks as the store (stores indexed before hybrid search was enabled, or written while
+    it was off, even if chunks were added since). Checked once per user and process.
+    """
+    if user_id in _lexical_verified_users:
+        return
+    with _lexical_backfill_lock:
+        if user_id in _lexical_verified_users:
+            return
+        if lexical_index.chunk_count(user_id) == vectorstore._collection.count():
+            _lexical_verified_users.add(user_id)
+            return
+
+        def records():
+            offset = 0
+            while True:
+                page = vectorstore._collection.get(include=["documents", "metadatas"], limit=CHROMA_READ_BATCH_SIZE, offset=offset)
+                if not page["ids"]:
+                    return
+                yield from zip(page["ids"], page["documents"], page["metadatas"])
+                offset += len(page["ids"])
+
+        count = lexical_index.rebuild(user_id, records())
+        _lexical_verified_users.add(user_id)
+        logger.info(f"Built the lexical index of user {user_id} from {count} stored chunk(s).")
+
+
+def _rebuild_lexical_index(user_id: str, vectorstore: Optional[Chroma]) -> None:
+    """Rebuilds a user's lexical index from their vector store (or drops it when they have no store)."""
+    lexical_index.remove_user(user_id)
+    _lexical_verified_users.discard(user_id)
+    if vectorstore is not None:
+        _ensure_lexical_index(user_id, vectorstore)
+
+
+_quantized_backfill_lock = threading.Lock()
+# Vector width at which each user's codes were checked against their store in this process
+_quantized_verified_users: dict[str, int] = {}
+
+
+def _ensure_quantized_index(user_id: str, vectorstore: Chroma, dimensions: int) -> None:
+    """
+    Rebuilds a user's codes from their stored vectors if fewer or more of their chunks have
+    a code of the current scheme and width than the store holds (stores indexed before
+    quantization was enabled or written while it was off, even if chunks were added since,
+    and stores re-encoded since). Checked once per user, width and process.
+    """
+    if _quantized_verified_users.get(user_id) == dimensions:
+        return
+    with _quantized_backfill_lock:
+        if _quantized_verified_users.get(user_id) == dimensions:
+            return
+        if quantized_index.chunk_count(user_id, dimensions) == vectorstore._collection.count():
+            _quantized_verified_users[user_id] = dimensions
+            return
+        if _is_empty(vectorstore):
+            quantized_index.remove_user(user_id)
+            _quantized_verified_users[user_id] = dimensions
+            return
+        stored_width = len(vectorstore._collection.get(limit=1, include=["embeddings"])["embeddings"][0])
+        if stored_width != dimensions:
+            raise ValueError(
+                f"The vectors of user {user_id} are stored with {stored_width} dimensions, queries have {dimensions}; "
+                f"re-encode the store for EMBEDDING_DIMENSIONS (tools/reencode_vectors.py)."
+            )
+
+        def records():
+            offset = 0
+            while True:
+                page = vectorstore._collection.get(include=["embeddings"], limit=CHROMA_READ_BATCH_SIZE, offset=offset)
+                if not len(page["ids"]):
+                    return
+                yield from zip(page["ids"], page["embeddings"])
+                offset += len(page["ids"])
+
+        count = quantized_index.rebuild(user_id, records())
+        _quantized_verified_users[user_id] = dimensions
+        logger.info(f"Built the {quantized_index.scheme} codes of user {user_id} from {count} stored vector(s).")
+
+
+def _query_quantized(user_id: str, vectorstore: Chroma, query_vector: list[float], k: int, where: Optional[ChunkFilter] = None) -> list[tuple[LangchainDocument, float]]:
+    """
+    _query_collection through the quantized index: the best k * QUANTIZED_RESCORE_FACTOR
+    chunks by their codes (among those matching `where`) are re-scored with their float
+    vectors from the store, and the k closest are returned with their distances.
+    """
+    _ensure_quantized_index(user_id, vectorstore, len(query_vector))
+    candidate_ids = None
+    if where is not None:
+        candidate_ids = set(vectorstore._collection.get(where=where.chroma_where(), include=[])["ids"])
+        if not candidate_ids:
+            return []
+    hits = quantized_index.search(user_id, query_vector, k * max(1, settings.QUANTIZED_RESCORE_FACTOR), candidate_ids)
+    if not hits:
+        return []
+    rescored = _get_with_distance(vectorstore, [chunk_id for chunk_id, _ in hits], query_vector)
+    return sorted(rescored.values(), key=lambda result: result[1])[:k]
+
+
+def _get_with_distance(vectorstore: Chroma, ids: list[str], query_vector: list[float]) -> dict[str, tuple[LangchainDocument, float]]:
+    """Records by ID with their (squared L2, as Chroma reports it) distance to the query vector."""
+    result = vectorstore._collection.get(ids=ids, include=["documents", "metadatas", "embeddings"])
+    query = np.asarray(query_vector, dtype=np.float64)
+    found = {}
+    for chunk_id, text, metadata, embedding in zip(result["ids"], result["documents"], result["metadatas"], result["embeddings"]):
+        distance = float(np.sum((np.asarray(embedding, dtype=np.float64) - query) ** 2))
+        found[chunk_id] = (LangchainDocument(page_content=text, metadata={**(metadata or {}), "chunk_id": chunk_id}), distance)
+    return found
+
+
+def _search(
+    user_id: str,
+    vectorstore: Chroma,
+    query: Optional[str],
+    query_vector: list[float],
+    k: int,
+    where: Optional[ChunkFilter] = None
+) -> list[tuple[LangchainDocument, float]]:
+    """
+    Vector search, fused with BM25 hits from the lexical index when hybrid search is enabled
+    and the question text is known. Both rankings are `k` deep and merged by reciprocal
+    rank fusion; the best `k` chunks are returned in fused order, with their distances.
+    `where` restricts both searches to matching chunks. The query vector is truncated like
+    the stored ones, and searched through the quantized index when VECTOR_QUANTIZATION is set.
+    """
+    if where is not None and where.is_empty():
+        where = None
+    query_vector = _stored_vectors([query_vector])[0]
+    if quantized_index is not None:
+        vector_results = _query_quantized(user_id, vectorstore, query_vector, k, where)
+    else:
+        vector_results = _query_collection(vectorstore, query_vector, k, where)
+    if lexical_index is None or not query:
+        return vector_results
+    _ensure_lexical_index(user_id, vectorstore)
+    lexical_hits = lexical_index.search(user_id, query, k, where)
+    if not lexical_hits:
+        return vector_results
+
+    by_id = {doc.metadata["chunk_id"]: (doc, distance) for doc, distance in vector_results}
+    fused_ids = reciprocal_rank_fusion(
+        [list(by_id), [chunk_id for chunk_id, _ in lexical_hits]],
+        weights=[settings.HYBRID_VECTOR_WEIGHT, settings.HYBRID_LEXICAL_WEIGHT],
+        k=settings.HYBRID_RRF_K
+    )[:k]
+    lexical_only = [chunk_id for chunk_id in fused_ids if chunk_id not in by_id]
+    if lexical_only:
+        by_id.update(_get_with_distance(vectorstore, lexical_only, query_vector))
+    # IDs the store does not have (e.g. a write that failed halfway) are skipped
+    return [by_id[chunk_id] for chunk_id in fused_ids if chunk_id in by_id]
+
+
+def similarity_search_with_score(
+    user_id: str,
+    query: str,
+    k: int = 15,
+    where: Optional[ChunkFilter] = None
+) -> Optional[list[tuple[LangchainDocument, float]]]:
+    """Synchronous counterpart of asimilarity_search_with_score, for scripts and worker threads."""
+    vectorstore = get_vectorstore(user_id, create_if_not_exists=False)
+    if vectorstore is None:
+        logger.warning(f"Vector store not found for user {user_id}. Cannot search.")
+        return None
+    return _search(user_id, vectorstore, query, store_embeddings.embed_query(query), k, where)
+
+
+async def asimilarity_search_with_score(
+    user_id: str,
+    query: str,
+    k: int = 15,
+    where: Optional[ChunkFilter] = None
+) -> Optional[list[tuple[LangchainDocument, float]]]:
+    """
+    Async retrieval for the query path: the question is embedded through the async
+    embeddings client (via the embedding cache) and the local Chroma lookup runs in a
+    worker thread, so the event loop is never blocked. Returns (document, distance)
+    pairs in relevance order (closest first, or fused with BM25 hits under hybrid search),
+    or None if the user has no vector store. `where` restricts the search to chunks
+    matching a metadata filter.
+    """
+    vectorstore = await asyncio.to_thread(get_vectorstore, user_id, False)
+    if vectorstore is None:
+        logger.warning(f"Vector store not found for user {user_id}. Cannot search.")
+        return None
+    query_vector = await aembed_query(query)
+    return await asyncio.to_thread(_search, user_id, vectorstore, query, query_vector, k, where)
+
+
+async def aembed_query(query: str) -> list[float]:
+    """Embeds a question with the async client, through the embedding cache when enabled."""
+    if isinstance(store_embeddings, CachedEmbeddings):
+        return await store_embeddings.aembed_query(query)
+    return await query_embeddings_model.aembed_query(query)
+
+
+async def asimilarity_search_by_vector_with_score(
+    user_id: str,
+    query_vector: list[float],
+    k: int = 15,
+    query: Optional[str] = None,
+    where: Optional[ChunkFilter] = None
+) -> Optional[list[tuple[LangchainDocument, float]]]:
+    """Same as asimilarity_search_with_score, for a question that is already embedded (pass its text for hybrid search)."""
+    vectorstore = await asyncio.to_thread(get_vectorstore, user_id, False)
+    if vectorstore is None:
+        logger.warning(f"Vector store not found for user {user_id}. Cannot search.")
+        return None
+    return await asyncio.to_thread(_search, user_id, vectorstore, query, query_vector, k, where)
+
+
 def get_retriever(user_id: str, search_type: str = "similarity", search_kwargs: Optional[dict] = None):
     """
     Returns a retriever object from the user's vector store.
@@ -194,10 +1249,7 @@ if __name__ == '__main__':
         test_user = "test_user_vs"
 
         # Cleanup previous test data if any
-        import shutil
-        user_chroma_dir = settings.CHROMA_STORE_DIR / test_user
-        if user_chroma_dir.exists():
-            shutil.rmtree(user_chroma_dir)
+        delete_user_store(test_user)
 
         # Test get/create
         vs = get_vectorstore(test_user)
@@ -206,14 +1258,18 @@ if __name__ == '__main__':
 
         # Test add documents
         docs_to_add = [
-            LangchainDocument(page_content="This is document 1 about apples.", metadata={"source": "doc1.txt"}),
-            LangchainDocument(page_content="Document 2 discusses bananas.", metadata={"source": "doc2.txt"}),
-            LangchainDocument(page_content="Another part of document 1 about red apples.", metadata={"source": "doc1.txt"}),
+            LangchainDocument(page_content="This is document 1 about apples.", metadata={"source": "/tmp/doc1.txt", "original_source": "doc1.txt"}),
+            LangchainDocument(page_content="Document 2 discusses bananas.", metadata={"source": "/tmp/doc2.txt", "original_source": "doc2.txt"}),
+            LangchainDocument(page_content="Another part of document 1 about red apples.", metadata={"source": "/tmp/doc1.txt", "original_source": "doc1.txt"}),
         ]
         added = add_documents_to_store(test_user, docs_to_add)
         assert added, "Failed to add documents."
         print(f"Added {len(docs_to_add)} documents.")
 
+        # Test that the handle is served from the registry on subsequent calls
+        assert get_vectorstore(test_user) is get_vectorstore(test_user), "Vector store handle was not cached."
+        print(f"Vector store cache stats: {get_vectorstore_cache_stats()}")
+
         # Test retriever and similarity search
         retriever = get_retriever(test_user)
         assert retriever is not None, "Failed to get retriever."
@@ -232,17 +1288,23 @@ if __name__ == '__main__':
         results_after_delete = retriever_after_delete.invoke("Tell me about apples")
 
         # Check if any remaining results are from doc1.txt
-        found_doc1_after_delete = any(doc.metadata.get("source") == "doc1.txt" for doc in results_after_delete)
+        found_doc1_after_delete = any(doc.metadata.get("original_source") == "doc1.txt" for doc in results_after_delete)
         assert not found_doc1_after_delete, "doc1.txt found after deletion."
         print("Verified doc1.txt is no longer retrieved for 'apples' query.")
 
+        # Test that the consistency checker adopts files indexed without a manifest entry
+        report = check_index_consistency(test_user, repair=True)
+        assert report["adopted_files"] == ["doc2.txt"] and report["deleted_orphans"] == 0, f"Unexpected repair: {report}"
+        assert not check_index_consistency(test_user)["orphaned_embeddings"], "Repaired store still has orphans."
+        print("Consistency check adopted the remaining file into the manifest.")
+
         # Test deleting a non-existent document
         deleted_non_existent = delete_documents_from_store(test_user, ["non_existent.txt"])
         assert deleted_non_existent, "Deleting non-existent document should be 'successful' (no error)."
         print("Attempted to delete non-existent document, processed successfully.")
 
         # Clean up test user data
-        if user_chroma_dir.exists():
-            shutil.rmtree(user_chroma_dir)
+        delete_user_store(test_user)
+        assert get_vectorstore(test_user, create_if_not_exists=False) is None, "Deleted store was still served."
         print(f"Cleaned up test data for user {test_user}.")
         print("vectorstore_service tests completed.")
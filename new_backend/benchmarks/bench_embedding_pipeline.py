@@ -0,0 +1,83 @@
+"""
+Throughput of the batched embedding pipeline against the local fake OpenAI server.
+
+    cd new_backend
+    python -m benchmarks.bench_embedding_pipeline --chunks 2000 --latency-ms 80 --rate-limit-every 25
+
+Prints batches/s and tokens/s for several worker-pool sizes, so the effect of
+EMBEDDING_MAX_CONCURRENCY and EMBEDDING_BATCH_MAX_TOKENS can be compared.
+"""
+import argparse
+import asyncio
+import random
+
+from langchain_openai import OpenAIEmbeddings
+
+from app.core.utils import estimate_token_count
+from app.services.embedding_pipeline import run_embedding_pipeline
+from benchmarks.fake_openai_server import FakeOpenAIConfig, FakeOpenAIServer
+
+WORDS = "revenue margin quarter forecast invoice table section results method analysis growth cost".split()
+
+
+def synthetic_chunks(n_chunks: int, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(50, 600))) for _ in range(n_chunks)]
+
+
+async def run_once(embeddings: OpenAIEmbeddings, texts: list[str], token_counts: list[int], concurrency: int, batch_tokens: int):
+    received = 0
+
+    async def embed_batch(batch: list[str]) -> list[list[float]]:
+        return await embeddings.aembed_documents(batch)
+
+    async def on_batch_done(indices: list[int], vectors: list[list[float]]) -> None:
+        nonlocal received
+        received += len(vectors)
+
+    metrics = await run_embedding_pipeline(
+        texts, token_counts, embed_batch, on_batch_done,
+        max_concurrency=concurrency, max_tokens_per_batch=batch_tokens
+    )
+    assert received == len(texts)
+    return metrics
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--batch-tokens", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--port", type=int, default=8900)
+    args = parser.parse_args()
+
+    texts = synthetic_chunks(args.chunks)
+    token_counts = [estimate_token_count(t) for t in texts]
+    print(f"{len(texts)} chunks, {sum(token_counts)} tokens, batch budget {args.batch_tokens} tokens")
+
+    async def run_all(base_url: str) -> None:
+        # One event loop for all runs: the async HTTP client is bound to the loop it was first used on.
+        embeddings = OpenAIEmbeddings(
+            model="text-embedding-3-large",
+            openai_api_key="fake-key",
+            openai_api_base=base_url,
+            check_embedding_ctx_length=False, # Avoids downloading tokenizer files; inputs are already sized
+            max_retries=0 # Retries are the pipeline's job here
+        )
+        print(f"{'workers':>8} {'batches':>8} {'retries':>8} {'seconds':>8} {'batches/s':>10} {'tokens/s':>10}")
+        for concurrency in args.concurrency:
+            metrics = await run_once(embeddings, texts, token_counts, concurrency, args.batch_tokens)
+            print(
+                f"{concurrency:>8} {metrics.batches:>8} {metrics.retries:>8} {metrics.elapsed_seconds:>8.2f} "
+                f"{metrics.batches_per_second:>10.2f} {metrics.tokens_per_second:>10.0f}"
+            )
+
+    config = FakeOpenAIConfig(latency_ms=args.latency_ms, rate_limit_every=args.rate_limit_every)
+    with FakeOpenAIServer(config, port=args.port) as server:
+        asyncio.run(run_all(server.base_url))
+
+
+if __name__ == "__main__":
+    main()
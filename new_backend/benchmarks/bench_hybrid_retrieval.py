@@ -0,0 +1,148 @@
+"""
+Recall and latency of vector-only, BM25-only and hybrid (reciprocal rank fusion) retrieval
+on a synthetic corpus of report sections and invoice tables.
+
+    cd new_backend
+    python -m benchmarks.bench_hybrid_retrieval --chunks 5000 --queries 200 --k 10
+
+The corpus goes through vectorstore_service into a throwaway Chroma store and lexical
+index. Embeddings come from a local hashing embedder (word and character-trigram
+features), not the OpenAI model, so the numbers show the mechanics rather than real
+embedding quality: like dense embeddings, it places invoice numbers that differ in a
+digit or two close together. Each query asks for one invoice number or SKU; a hit is
+the chunk that contains it appearing in the top k. Prints recall@k and latency
+percentiles per mode, and the indexing throughput of the lexical index.
+"""
+import argparse
+import hashlib
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+WORDS = "revenue margin quarter forecast invoice customer supplier payment balance growth cost region".split()
+
+
+class HashingEmbeddings(Embeddings):
+    """Unit-length hashed bag of words and character trigrams (a stand-in for an embedding API)."""
+
+    def __init__(self, size: int = 384):
+        self.size = size
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.size)
+        text = text.lower()
+        features = re.findall(r"\w+", text) + [text[i:i + 3] for i in range(len(text) - 2)]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.size] += 1 if digest[4] & 1 else -1
+        return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+def synthetic_corpus(n_chunks: int, seed: int = 5) -> tuple[list[str], list[str]]:
+    """Returns (chunk texts, codes), where codes[i] is the invoice number or SKU only chunk i contains ('' for prose)."""
+    rng = random.Random(seed)
+    texts, codes = [], []
+    for i in range(n_chunks):
+        if i % 3 == 0:
+            code = f"INV-2023-{i:05d}" if i % 2 else f"SKU-{rng.choice('ABCDEFGH')}{i:05d}"
+            rows = [f"| {code} | {rng.choice(WORDS)} {rng.choice(WORDS)} | {rng.uniform(10, 9999):,.2f} |"]
+            rows += [f"| ITEM-{rng.randint(0, 99)} | {rng.choice(WORDS)} | {rng.uniform(10, 9999):,.2f} |" for _ in range(8)]
+            rng.shuffle(rows)
+            texts.append("| Reference | Description | Amount |\n|---|---|---|\n" + "\n".join(rows))
+            codes.append(code)
+        else:
+            texts.append("# Results\n\n" + " ".join(rng.choice(WORDS) for _ in range(rng.randint(60, 160))) + ".")
+            codes.append("")
+    return texts, codes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=3000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    # Settings are read at import time, so the environment must be set before importing the app
+    tmp_dir = Path(tempfile.mkdtemp(prefix="bench_hybrid_"))
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+    os.environ["LEXICAL_INDEX_PATH"] = str(tmp_dir / "lexical.sqlite3")
+    os.environ["HYBRID_SEARCH_ENABLED"] = "true"
+    from app.core.config import settings
+    settings.CHROMA_STORE_DIR = tmp_dir / "chroma"
+    from langchain.docstore.document import Document as LangchainDocument
+    from app.services import vectorstore_service
+    from app.services.lexical_index import LexicalIndex
+
+    embedder = HashingEmbeddings()
+    vectorstore_service.embeddings_model = vectorstore_service.store_embeddings = embedder
+    user_id = "bench_hybrid_user"
+
+    texts, codes = synthetic_corpus(args.chunks)
+    documents = [
+        LangchainDocument(page_content=text, metadata={"original_source": "bench.pdf", "content_type": "table_chunk" if code else "text_section"})
+        for text, code in zip(texts, codes)
+    ]
+    ids = vectorstore_service.compute_chunk_ids("bench.pdf", documents)
+    started = time.perf_counter()
+    if not vectorstore_service.add_documents_to_store(user_id, documents, ids=ids):
+        raise RuntimeError("Could not index the benchmark corpus.")
+    print(f"Indexed {len(documents)} chunks in {time.perf_counter() - started:.1f} s (embedding, Chroma and lexical index)")
+
+    scratch = LexicalIndex(tmp_dir / "scratch.sqlite3")
+    started = time.perf_counter()
+    scratch.add("scratch", ids, texts)
+    lexical_seconds = time.perf_counter() - started
+    print(f"Lexical index alone: {len(ids) / lexical_seconds:,.0f} chunks/s, "
+          f"{(tmp_dir / 'scratch.sqlite3').stat().st_size / 1e6:.1f} MB on disk")
+
+    rng = random.Random(9)
+    coded = [i for i, code in enumerate(codes) if code]
+    targets = [rng.choice(coded) for _ in range(args.queries)]
+    questions = [f"What is the amount for {codes[i]}?" for i in targets]
+    vectorstore = vectorstore_service.get_vectorstore(user_id, create_if_not_exists=False)
+    lexical_index = vectorstore_service.lexical_index
+    query_vectors = [embedder.embed_query(question) for question in questions]
+
+    modes = {
+        "vector": lambda q, v: [doc.metadata["chunk_id"] for doc, _ in vectorstore_service._query_collection(vectorstore, v, args.k)],
+        "bm25": lambda q, v: [chunk_id for chunk_id, _ in lexical_index.search(user_id, q, args.k)],
+        "hybrid": lambda q, v: [doc.metadata["chunk_id"] for doc, _ in vectorstore_service._search(user_id, vectorstore, q, v, args.k)],
+    }
+    print(f"{'mode':>8} {'recall@' + str(args.k):>10} {'hit@1':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode, search in modes.items():
+        hits, first, latencies = 0, 0, []
+        for question, vector, target in zip(questions, query_vectors, targets):
+            started = time.perf_counter()
+            found = search(question, vector)
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += ids[target] in found
+            first += bool(found) and found[0] == ids[target]
+        latencies.sort()
+        print(f"{mode:>8} {hits / len(questions):>10.1%} {first / len(questions):>7.1%} "
+              f"{statistics.median(latencies):>8.2f} {latencies[int(len(latencies) * 0.95) - 1]:>8.2f}")
+
+    vectorstore_service.delete_user_store(user_id)
+
+
+if __name__ == "__main__":
+    main()
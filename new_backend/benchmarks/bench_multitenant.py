@@ -0,0 +1,137 @@
+"""
+Cold and warm query latency of the per-user and shared vector store layouts as the
+number of tenants grows.
+
+    cd new_backend
+    python -m benchmarks.bench_multitenant --tenants 1000 10000 --chunks-per-tenant 20
+    python -m benchmarks.bench_multitenant --tenants 1000 --layouts shared --shards 1 4
+
+For every tenant count and layout, a throwaway store is filled with that many tenants of
+random unit vectors (written straight into Chroma: the embedder is not what is measured),
+each tenant in its own per-user directory or in its shard of the shared collections
+(VECTORSTORE_SHARDS). Tenants this small are searched by an exact scan in the shared
+layout unless --exact-search-max-records 0 makes every query use the shard's index.
+Then, for a sample of tenants, through vectorstore_service:
+    cold  first query of a tenant in the process (get_vectorstore opens its handle)
+    warm  the same query again on the cached handle
+Prints build time, latency percentiles, the file descriptors the queries left open and the
+size of the store on disk.
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+DIMENSIONS = 384
+
+
+def _unit_vectors(rng: np.random.Generator, count: int) -> list[list[float]]:
+    vectors = rng.standard_normal((count, DIMENSIONS))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).tolist()
+
+
+def _open_fds() -> int:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError: # Not Linux
+        return -1
+
+
+def _disk_mb(path: Path) -> float:
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file()) / 1e6
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def build(vectorstore_service, layout: str, tenants: list[str], chunks_per_tenant: int) -> None:
+    import chromadb
+    from langchain_community.vectorstores import Chroma
+    from app.core.config import settings
+
+    rng = np.random.default_rng(11)
+    for user_id in tenants:
+        ids = [f"{user_id}-chunk-{i}" for i in range(chunks_per_tenant)]
+        records = dict(
+            ids=ids,
+            embeddings=_unit_vectors(rng, chunks_per_tenant),
+            documents=[f"chunk {i} of {user_id}" for i in range(chunks_per_tenant)],
+            metadatas=[{"original_source": "bench.pdf", "content_type": "text_section", "chunk_id": chunk_id} for chunk_id in ids],
+        )
+        if layout == "shared":
+            vectorstore_service._tenant_collection(user_id).upsert(**records)
+        else:
+            client = chromadb.PersistentClient(path=str(settings.CHROMA_STORE_DIR / user_id))
+            client.get_or_create_collection(Chroma._LANGCHAIN_DEFAULT_COLLECTION_NAME).upsert(**records)
+            client.close()
+
+
+def measure(vectorstore_service, sample: list[str]) -> tuple[list[float], list[float], int]:
+    rng = np.random.default_rng(13)
+    cold, warm, fds_before = [], [], _open_fds()
+    for user_id in sample:
+        query_vector = _unit_vectors(rng, 1)[0]
+        for latencies in (cold, warm):
+            started = time.perf_counter()
+            vectorstore = vectorstore_service.get_vectorstore(user_id, create_if_not_exists=False)
+            results = vectorstore_service._query_collection(vectorstore, query_vector, 5)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if len(results) != 5 or not all(doc.metadata["chunk_id"].startswith(f"{user_id}-") for doc, _ in results):
+                raise RuntimeError(f"Query of {user_id} returned the wrong records.")
+    return cold, warm, _open_fds() - fds_before
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, nargs="+", default=[1000])
+    parser.add_argument("--chunks-per-tenant", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200, help="Tenants sampled for the cold/warm queries")
+    parser.add_argument("--layouts", nargs="+", choices=["per_user", "shared"], default=["per_user", "shared"])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1], help="VECTORSTORE_SHARDS values for the shared layout")
+    parser.add_argument("--exact-search-max-records", type=int, help="VECTORSTORE_EXACT_SEARCH_MAX_RECORDS (0 always queries the index)")
+    args = parser.parse_args()
+
+    # Settings are read at import time, so the environment must be set before importing the app
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+    from app.core.config import settings
+    from app.services import vectorstore_service
+
+    if args.exact_search_max_records is not None:
+        settings.VECTORSTORE_EXACT_SEARCH_MAX_RECORDS = args.exact_search_max_records
+    print(f"{'tenants':>8} {'layout':>12} {'build s':>8} {'cold p50':>9} {'cold p95':>9} {'warm p50':>9} {'warm p95':>9} {'new fds':>8} {'disk MB':>8}")
+    for tenant_count in args.tenants:
+        tenants = [f"tenant{i:06d}" for i in range(tenant_count)]
+        sample = random.Random(17).sample(tenants, min(args.queries, tenant_count))
+        configurations = [("per_user", 1)] if "per_user" in args.layouts else []
+        configurations += [("shared", shards) for shards in args.shards] if "shared" in args.layouts else []
+        for layout, shards in configurations:
+            tmp_dir = Path(tempfile.mkdtemp(prefix="bench_multitenant_"))
+            settings.VECTORSTORE_MODE, settings.VECTORSTORE_SHARDS = layout, shards
+            settings.CHROMA_STORE_DIR = tmp_dir / "chroma"
+            settings.SHARED_CHROMA_STORE_DIR = tmp_dir / "chroma_shared"
+            settings.CHROMA_STORE_DIR.mkdir(parents=True)
+            vectorstore_service._shared_client = None
+            vectorstore_service._store_registry.clear()
+
+            started = time.perf_counter()
+            build(vectorstore_service, layout, tenants, args.chunks_per_tenant)
+            build_seconds = time.perf_counter() - started
+            cold, warm, open_fds = measure(vectorstore_service, sample)
+            label = layout if layout == "per_user" else f"shared/{shards}"
+            print(f"{tenant_count:>8} {label:>12} {build_seconds:>8.1f} {statistics.median(cold):>9.2f} {_percentile(cold, 0.95):>9.2f} "
+                  f"{statistics.median(warm):>9.2f} {_percentile(warm, 0.95):>9.2f} {open_fds:>8} {_disk_mb(tmp_dir):>8.1f}")
+            vectorstore_service._store_registry.clear()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    print("Latencies in ms per query (get_vectorstore + vector query, top 5).")
+
+
+if __name__ == "__main__":
+    main()
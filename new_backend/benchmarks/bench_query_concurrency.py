@@ -0,0 +1,90 @@
+"""
+Concurrency scaling of the query endpoint against the local fake OpenAI server.
+
+    cd new_backend
+    python -m benchmarks.bench_query_concurrency --latency-ms 200 --concurrency 1 4 16 64
+
+For each concurrency level, N clients send questions to one backend worker and the
+script reports throughput and latency percentiles. Every question is different, so
+each one embeds the query and calls the chat model (no cache hits).
+
+With --sync-baseline the same load is also sent to a route that calls the blocking
+qa_service.get_answer from an async handler, which is how the query endpoint used to
+work: there the event loop is blocked, so throughput stays flat as concurrency grows.
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+
+import httpx
+
+from benchmarks.fake_openai_server import BackgroundServer, FakeOpenAIConfig, FakeOpenAIServer
+from benchmarks.query_backend import BENCH_USER_ID, cleanup_backend, configure_backend
+
+
+async def run_load(base_url: str, path: str, concurrency: int, n_requests: int, run_label: str) -> tuple[float, list[float]]:
+    """Sends n_requests distinct questions with `concurrency` clients; returns (elapsed seconds, latencies in ms)."""
+    counter = itertools.count()
+    latencies: list[float] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+
+        async def client_loop() -> None:
+            while (i := next(counter)) < n_requests:
+                body = {"user_id": BENCH_USER_ID, "question": f"How did revenue change in quarter {i} ({run_label})?"}
+                started = time.perf_counter()
+                response = await client.post(path, json=body)
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        return time.perf_counter() - started, latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Fake API delay per request")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests-per-client", type=int, default=4)
+    parser.add_argument("--sync-baseline", action="store_true")
+    parser.add_argument("--fake-port", type=int, default=8900)
+    parser.add_argument("--app-port", type=int, default=8901)
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig()
+    with FakeOpenAIServer(config, port=args.fake_port) as fake:
+        app = configure_backend(fake.base_url)
+        config.latency_ms = args.latency_ms
+
+        paths = {"async": "/api/v2/query/"}
+        if args.sync_baseline:
+            from app.services import qa_service
+
+            @app.post("/bench/blocking-query")
+            async def blocking_query(body: dict):
+                answer, sources = qa_service.get_answer(body["question"], body["user_id"]) # Blocks the event loop
+                return {"answer": answer, "sources": sources}
+
+            paths["blocking"] = "/bench/blocking-query"
+
+        with BackgroundServer(app, port=args.app_port) as backend:
+            print(f"fake API latency {args.latency_ms} ms per call (query embedding + chat completion)")
+            print(f"{'path':>9} {'clients':>8} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9}")
+            for label, path in paths.items():
+                for concurrency in args.concurrency:
+                    n_requests = concurrency * args.requests_per_client
+                    elapsed, latencies = asyncio.run(run_load(backend.url, path, concurrency, n_requests, f"{label}-{concurrency}"))
+                    p95 = sorted(latencies)[int(0.95 * (len(latencies) - 1))]
+                    print(
+                        f"{label:>9} {concurrency:>8} {n_requests:>9} {n_requests / elapsed:>8.1f} "
+                        f"{statistics.median(latencies):>9.1f} {p95:>9.1f}"
+                    )
+
+        cleanup_backend()
+
+
+if __name__ == "__main__":
+    main()
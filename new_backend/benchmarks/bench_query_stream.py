@@ -0,0 +1,109 @@
+"""
+Time to first token of the streaming query endpoint, against the local fake OpenAI server.
+
+    cd new_backend
+    python -m benchmarks.bench_query_stream --queries 20 --latency-ms 300 --token-latency-ms 20
+
+Starts the fake OpenAI API and the backend (see benchmarks/query_backend.py), then compares, per query:
+  - blocking /api/v2/query/: time until the full answer arrives
+  - streaming /api/v2/query/stream: time to the sources event and to the first token
+Finally it abandons a stream after a few tokens and checks that the fake LLM saw the
+stream being closed early (no tokens generated for a client that went away).
+"""
+import argparse
+import json
+import statistics
+import time
+
+import httpx
+
+from benchmarks.fake_openai_server import BackgroundServer, FakeOpenAIConfig, FakeOpenAIServer
+from benchmarks.query_backend import BENCH_USER_ID, cleanup_backend, configure_backend
+
+QUESTION = "How did revenue change in the third quarter?"
+
+
+def iter_sse(response: httpx.Response):
+    """Yields (event, data) pairs from a text/event-stream response."""
+    event = None
+    for line in response.iter_lines():
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield event, json.loads(line[len("data: "):])
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(label: str, values: list[float]) -> None:
+    print(f"{label:<32} p50 {statistics.median(values):8.1f} ms   p95 {percentile(values, 95):8.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Fake API delay per request (LLM time to first token)")
+    parser.add_argument("--token-latency-ms", type=float, default=20.0)
+    parser.add_argument("--completion-tokens", type=int, default=100)
+    parser.add_argument("--fake-port", type=int, default=8900)
+    parser.add_argument("--app-port", type=int, default=8901)
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(completion_tokens=args.completion_tokens, token_latency_ms=args.token_latency_ms)
+    with FakeOpenAIServer(config, port=args.fake_port) as fake:
+        app = configure_backend(fake.base_url)
+        config.latency_ms = args.latency_ms # Seeding done; from here every API call is slowed down
+
+        with BackgroundServer(app, port=args.app_port) as backend, httpx.Client(base_url=backend.url, timeout=60) as client:
+            body = {"user_id": BENCH_USER_ID, "question": QUESTION}
+            blocking, to_sources, to_first_token, streamed_total = [], [], [], []
+            for _ in range(args.queries):
+                started = time.perf_counter()
+                client.post("/api/v2/query/", json=body).raise_for_status()
+                blocking.append((time.perf_counter() - started) * 1000)
+
+                started = time.perf_counter()
+                first_token = None
+                with client.stream("POST", "/api/v2/query/stream", json=body) as response:
+                    response.raise_for_status()
+                    for event, data in iter_sse(response):
+                        now = (time.perf_counter() - started) * 1000
+                        if event == "sources":
+                            to_sources.append(now)
+                        elif event == "token" and first_token is None:
+                            first_token = now
+                        elif event == "error":
+                            raise RuntimeError(data)
+                to_first_token.append(first_token)
+                streamed_total.append((time.perf_counter() - started) * 1000)
+
+            print(f"{args.queries} queries, LLM first-token latency {args.latency_ms} ms, "
+                  f"{args.completion_tokens} tokens at {args.token_latency_ms} ms/token")
+            summarize("blocking: full answer", blocking)
+            summarize("stream: sources event", to_sources)
+            summarize("stream: first token", to_first_token)
+            summarize("stream: full answer", streamed_total)
+
+            # Abandon a stream after a few tokens; the backend should close the LLM stream early
+            aborted_before = config.chat_streams_aborted
+            with client.stream("POST", "/api/v2/query/stream", json=body) as response:
+                tokens_read = 0
+                for event, _ in iter_sse(response):
+                    if event == "token":
+                        tokens_read += 1
+                        if tokens_read == 3:
+                            break
+            deadline = time.monotonic() + 5
+            while config.chat_streams_aborted == aborted_before and time.monotonic() < deadline:
+                time.sleep(0.05)
+            cancelled = config.chat_streams_aborted > aborted_before
+            print(f"client disconnect cancels LLM stream: {'yes' if cancelled else 'NO'}")
+
+        cleanup_backend()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Context tokens per answer and answer-chunk recall with and without the rerank stage.
+
+    cd new_backend
+    python -m benchmarks.bench_rerank --chunks 3000 --queries 200 --top-k 5
+
+The corpus is made of report paragraphs that each state one fact ("In 2019, Acme
+reported operating margin of 14.2 percent.") amid filler that shares most of its words
+with the other paragraphs. It goes through vectorstore_service into a throwaway Chroma
+store and lexical index, embedded with the local hashing embedder of
+bench_hybrid_retrieval (not the OpenAI model). Each query asks for one fact; the gold
+chunk is the one paragraph that states it.
+
+For every query, top_k * RERANK_OVERFETCH candidates are retrieved once, then packed the
+way qa_service does it:
+    baseline  the first top_k * QA_RETRIEVAL_OVERFETCH candidates, packed in retrieval order
+    reranked  all candidates, reranked, best top_k (or RERANK_TOP_N if lower) packed
+Prints how often the gold chunk is in the context and first in it, the context tokens per
+answer (and tokens saved), and the rerank latency percentiles.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_hybrid_retrieval import HashingEmbeddings
+
+ENTITIES = "Acme Globex Initech Umbrella Hooli Vandelay Soylent Stark Wayne Tyrell Cyberdyne Wonka Gringotts Oscorp Aperture".split()
+ATTRIBUTES = ["revenue growth", "operating margin", "net debt", "customer churn", "headcount growth", "gross margin", "capital spending", "energy use"]
+FILLER = ("the board reviewed results for the period and noted that performance in each region followed the plan "
+          "while costs and investment were kept under review and the outlook for the coming year remained cautious").split()
+
+
+def synthetic_corpus(n_chunks: int, seed: int = 3) -> tuple[list[str], list[tuple[str, str, int]]]:
+    """Returns (chunk texts, facts), where facts[i] = (entity, attribute, year) is stated only in chunk i."""
+    rng = random.Random(seed)
+    facts = [(entity, attribute, year) for entity in ENTITIES for attribute in ATTRIBUTES for year in range(2000, 2025)]
+    rng.shuffle(facts)
+    facts = facts[:n_chunks]
+    texts = []
+    for entity, attribute, year in facts:
+        filler = [rng.choice(FILLER) for _ in range(rng.randint(80, 200))]
+        fact = f"In {year}, {entity} reported {attribute} of {rng.uniform(1, 40):.1f} percent."
+        filler.insert(rng.randint(0, len(filler)), fact)
+        # Distractors: the same company or measure in passing, as real report chunks have
+        filler.insert(rng.randint(0, len(filler)), f"{rng.choice(ENTITIES)} {rng.choice(ATTRIBUTES)} was discussed.")
+        texts.append(" ".join(filler))
+    return texts, facts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    # Settings are read at import time, so the environment must be set before importing the app
+    tmp_dir = Path(tempfile.mkdtemp(prefix="bench_rerank_"))
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+    os.environ["LEXICAL_INDEX_PATH"] = str(tmp_dir / "lexical.sqlite3")
+    os.environ.setdefault("RERANKER", "lexical")
+    from app.core.config import settings
+    settings.CHROMA_STORE_DIR = tmp_dir / "chroma"
+    settings.QA_MIN_RELEVANCE = -1.0 # Hashing embeddings are far apart; keep packing about ranks only
+    from langchain.docstore.document import Document as LangchainDocument
+    from app.services import qa_service, reranker, vectorstore_service
+
+    if reranker.active_reranker is None:
+        raise SystemExit("Set RERANKER to lexical or cross-encoder to benchmark the rerank stage.")
+    embedder = HashingEmbeddings()
+    vectorstore_service.embeddings_model = vectorstore_service.store_embeddings = embedder
+    user_id = "bench_rerank_user"
+
+    texts, facts = synthetic_corpus(args.chunks)
+    documents = [LangchainDocument(page_content=text, metadata={"original_source": "bench.pdf", "content_type": "text_section"}) for text in texts]
+    ids = vectorstore_service.compute_chunk_ids("bench.pdf", documents)
+    if not vectorstore_service.add_documents_to_store(user_id, documents, ids=ids):
+        raise RuntimeError("Could not index the benchmark corpus.")
+    vectorstore = vectorstore_service.get_vectorstore(user_id, create_if_not_exists=False)
+    depth = qa_service._retrieval_depth(args.top_k)
+    print(f"{len(documents)} chunks, reranker {reranker.active_reranker.name}, {depth} candidates per query, "
+          f"top_k {args.top_k}, reranked context {qa_service._rerank_top_n(args.top_k)} chunk(s)")
+
+    rng = random.Random(7)
+    targets = [rng.randrange(len(facts)) for _ in range(args.queries)]
+    stats = {mode: {"in_context": 0, "first": 0, "tokens": []} for mode in ("baseline", "reranked")}
+    latencies, saved = [], []
+    for target in targets:
+        entity, attribute, year = facts[target]
+        question = f"What {attribute} did {entity} report in {year}?"
+        results = vectorstore_service._search(user_id, vectorstore, question, embedder.embed_query(question), depth)
+
+        started = time.perf_counter()
+        reranked = reranker.rerank(question, results)
+        latencies.append((time.perf_counter() - started) * 1000)
+        baseline_packed, _, _, _ = qa_service._build_prompt(question, results, args.top_k)
+        reranked_packed, _, _, tokens_saved = qa_service._build_prompt(question, results, args.top_k, reranked)
+        saved.append(tokens_saved)
+        for mode, packed in (("baseline", baseline_packed), ("reranked", reranked_packed)):
+            context_ids = [doc.metadata["chunk_id"] for doc in packed.documents]
+            stats[mode]["in_context"] += ids[target] in context_ids
+            stats[mode]["first"] += bool(context_ids) and context_ids[0] == ids[target]
+            stats[mode]["tokens"].append(packed.context_tokens)
+
+    print(f"{'mode':>9} {'gold in context':>16} {'gold first':>11} {'context tokens':>15}")
+    for mode, mode_stats in stats.items():
+        print(f"{mode:>9} {mode_stats['in_context'] / len(targets):>16.1%} {mode_stats['first'] / len(targets):>11.1%} "
+              f"{statistics.mean(mode_stats['tokens']):>15.0f}")
+    latencies.sort()
+    print(f"Prompt tokens saved per answer: mean {statistics.mean(saved):.0f} "
+          f"({statistics.mean(saved) / statistics.mean(stats['baseline']['tokens']):.0%} of the context)")
+    print(f"Rerank latency: p50 {statistics.median(latencies):.2f} ms, p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f} ms "
+          f"(budget {settings.RERANK_BUDGET_MS:.0f} ms)")
+
+    vectorstore_service.delete_user_store(user_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Token-aware sub-chunking of sections: throughput and chunk-size distribution.
+
+    cd new_backend
+    python -m benchmarks.bench_section_chunker --pages 2000 --max-tokens 800 --overlap 100
+
+Builds a synthetic document (sentences, line-wrapped paragraphs and a section header on
+about one page in --header-every), splits it into sections and chunks them with
+split_texts_by_tokens, once for all sections in one batch (as the processing service
+does) and once per section. Prints the time and throughput of both, the number of chunks,
+the chunk size percentiles in tokens (counted separately per chunk), how many exceed the
+limit, and the share of chunks that end at a paragraph or sentence break.
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from app.core.utils import SECTION_KEYWORDS, estimate_token_counts, split_document_sections, split_texts_by_tokens
+
+WORDS = "revenue margin quarter forecast invoice table section results method analysis growth cost".split()
+
+
+def synthetic_pages(n_pages: int, header_every: int, seed: int = 11) -> list[tuple[int, str]]:
+    rng = random.Random(seed)
+    pages = []
+    for page in range(n_pages):
+        words = []
+        for _ in range(rng.randint(20, 35)): # Sentences
+            sentence = [rng.choice(WORDS) for _ in range(rng.randint(5, 25))]
+            sentence[0] = sentence[0].capitalize()
+            words.extend(sentence[:-1] + [sentence[-1] + rng.choice(".....!?")])
+            if rng.random() < 0.15:
+                words.append("\n") # Paragraph end
+        lines, line = [], []
+        for word in words: # Wrapped at ~90 characters, as extracted PDF text is
+            if word == "\n":
+                lines.append(" ".join(line) + "\n")
+                line = []
+            elif sum(len(w) + 1 for w in line) + len(word) > 90:
+                lines.append(" ".join(line))
+                line = [word]
+            else:
+                line.append(word)
+        lines.append(" ".join(line))
+        if rng.random() < 1 / header_every:
+            lines.insert(rng.randint(0, len(lines)), f"{rng.randint(1, 12)}. {rng.choice(SECTION_KEYWORDS)}")
+        pages.append((page, "\n".join(lines)))
+    return pages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--header-every", type=int, default=6, help="On average one section header per this many pages")
+    parser.add_argument("--max-tokens", type=int, default=800)
+    parser.add_argument("--overlap", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    sections = split_document_sections(synthetic_pages(args.pages, args.header_every))
+    texts = [section.text for section in sections]
+    megabytes = sum(len(text) for text in texts) / 1e6
+    section_tokens = estimate_token_counts(texts)
+    print(f"{args.pages} pages, {megabytes:.1f} MB, {len(sections)} sections "
+          f"({int((section_tokens > args.max_tokens).sum())} over {args.max_tokens} tokens, largest {int(section_tokens.max())})")
+
+    batch_seconds, single_seconds = [], []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        spans = split_texts_by_tokens(texts, args.max_tokens, args.overlap)
+        batch_seconds.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        for text in texts:
+            split_texts_by_tokens([text], args.max_tokens, args.overlap)
+        single_seconds.append(time.perf_counter() - started)
+
+    chunks = [text[start:end] for text, text_spans in zip(texts, spans) for start, end in text_spans]
+    print(f"{'mode':>12} {'seconds':>8} {'MB/s':>7} {'sections/s':>11} {'chunks/s':>9}")
+    for label, seconds in (("batch", min(batch_seconds)), ("per section", min(single_seconds))):
+        print(f"{label:>12} {seconds:>8.3f} {megabytes / seconds:>7.1f} {len(texts) / seconds:>11.0f} {len(chunks) / seconds:>9.0f}")
+
+    sizes = estimate_token_counts(chunks)
+    p5, p50, p95 = np.percentile(sizes, [5, 50, 95])
+    at_break = sum(1 for chunk, (text, end) in zip(chunks, ((t, e) for t, s in zip(texts, spans) for _, e in s))
+                   if end == len(text) or chunk.rstrip()[-1:] in ".!?" or text[end:end + 2].count("\n") == 2)
+    print(f"{len(chunks)} chunks; tokens p5 {p5:.0f}, median {p50:.0f}, p95 {p95:.0f}, max {int(sizes.max())}; "
+          f"{int((sizes > args.max_tokens).sum())} over the limit; {at_break / len(chunks):.1%} end at a sentence or paragraph")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Section splitting of large documents: per-page splitting with the regex rebuilt on every
+call (the previous behavior) versus one pass of the precompiled splitter over the whole
+document.
+
+    cd new_backend
+    python -m benchmarks.bench_section_splitter --pages 2000 --repeat 5
+
+Prints the time per document and per page for both, and how many sections each produces,
+including the "Preamble"/"Content" fragments per-page splitting creates at page breaks.
+"""
+import argparse
+import random
+import re
+import time
+
+from app.core.utils import SECTION_KEYWORDS, split_document_sections
+
+WORDS = "revenue margin quarter forecast invoice table section results method analysis growth cost".split()
+
+
+def split_page_rebuilding_regex(text: str) -> list[tuple[str, str]]:
+    """The previous split_by_sections: the alternation over all keywords is rebuilt per call (re's cache then finds it)."""
+    section_pattern = re.compile(
+        r"^\s*(\d{1,2}[\.\)]?\s*|\[\d{1,2}\]|Chapter \d{1,2}\s*[:\.\-]?\s*|Section \d{1,2}\s*[:\.\-]?\s*)?"
+        r"(" + "|".join(map(re.escape, list(SECTION_KEYWORDS))) + r")"
+        r"\s*[:\.\-]?\s*$",
+        re.IGNORECASE | re.MULTILINE
+    )
+    matches = list(section_pattern.finditer(text))
+    if not matches:
+        return [("Content", text.strip())] if text.strip() else []
+    sections = []
+    if text[:matches[0].start()].strip():
+        sections.append(("Preamble", text[:matches[0].start()].strip()))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        if text[match.end():end].strip():
+            sections.append((match.group(2).strip().title(), text[match.end():end].strip()))
+    return sections
+
+
+def synthetic_pages(n_pages: int, header_every: int, seed: int = 7) -> list[tuple[int, str]]:
+    rng = random.Random(seed)
+    pages = []
+    for page in range(n_pages):
+        lines = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14))) for _ in range(45)]
+        if rng.random() < 1 / header_every:
+            lines.insert(rng.randint(0, len(lines)), f"{rng.randint(1, 12)}. {rng.choice(SECTION_KEYWORDS)}")
+        pages.append((page, "\n".join(lines)))
+    return pages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--header-every", type=int, default=4, help="On average one section header per this many pages")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = synthetic_pages(args.pages, args.header_every)
+    print(f"{args.pages} pages, {sum(len(text) for _, text in pages) / 1e6:.1f} MB of text")
+
+    per_page_seconds, whole_seconds = [], []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        per_page = [section for _, text in pages for section in split_page_rebuilding_regex(text)]
+        per_page_seconds.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        whole = split_document_sections(pages)
+        whole_seconds.append(time.perf_counter() - started)
+
+    fragments = sum(1 for title, _ in per_page if title in ("Preamble", "Content"))
+    print(f"{'splitter':>22} {'seconds':>8} {'ms/page':>8} {'sections':>9} {'untitled':>9}")
+    for label, seconds, sections, untitled in (
+        ("per page, rebuilt", min(per_page_seconds), len(per_page), fragments),
+        ("whole doc, compiled", min(whole_seconds), len(whole), sum(1 for s in whole if s.title in ("Preamble", "Content"))),
+    ):
+        print(f"{label:>22} {seconds:>8.3f} {seconds * 1000 / args.pages:>8.3f} {sections:>9} {untitled:>9}")
+    spanning = [s for s in whole if s.page_end > s.page_start]
+    print(f"speedup {min(per_page_seconds) / min(whole_seconds):.1f}x; {len(spanning)} section(s) span pages "
+          f"(longest {max((s.page_end - s.page_start + 1 for s in spanning), default=1)} pages)")
+
+
+if __name__ == "__main__":
+    main()
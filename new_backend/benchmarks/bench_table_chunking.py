@@ -0,0 +1,68 @@
+"""
+Table chunking: per-chunk DataFrame slicing and to_markdown (the previous behavior) versus
+table_markdown_chunks, which formats all rows in one pass and cuts chunks by tokens.
+
+    cd new_backend
+    python -m benchmarks.bench_table_chunking --rows 100 1000 5000 --columns 8
+
+Prints the time per table, the number of chunks and their size in tokens (median and
+maximum) for both, and whether every chunk carries the table's header row.
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.core.utils import estimate_token_counts, table_markdown_chunks
+
+
+def legacy_chunk_table_rows(df: pd.DataFrame, rows_per_chunk: int = 10) -> list[str]:
+    """The previous chunk_table_rows: fixed row counts, one DataFrame slice and to_markdown call per chunk."""
+    return [
+        df.iloc[i * rows_per_chunk:(i + 1) * rows_per_chunk].to_markdown(index=False)
+        for i in range((len(df) + rows_per_chunk - 1) // rows_per_chunk)
+    ]
+
+
+def synthetic_table(n_rows: int, n_columns: int, seed: int = 3) -> list[list[str]]:
+    """A financial-statement-like table as Camelot returns it: a header row, then rows of strings."""
+    rng = random.Random(seed)
+    header = ["Account"] + [f"FY{2015 + c}" for c in range(n_columns - 1)]
+    rows = [[f"{rng.choice(['Revenue', 'Cost of sales', 'Accrued liabilities', 'Deferred tax'])} {r}"]
+            + [f"{rng.uniform(-1e6, 1e7):,.2f}" for _ in range(n_columns - 1)] for r in range(n_rows)]
+    return [header] + rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--columns", type=int, default=8)
+    parser.add_argument("--max-tokens", type=int, default=settings.TABLE_CHUNK_MAX_TOKENS)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>6} {'mode':>10} {'ms':>9} {'chunks':>7} {'median tok':>11} {'max tok':>8} {'header':>7}")
+    for n_rows in args.rows:
+        rows = synthetic_table(n_rows, args.columns)
+        header = " | ".join(rows[0])
+        legacy_seconds, new_seconds = [], []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            legacy = legacy_chunk_table_rows(pd.DataFrame(rows))
+            legacy_seconds.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            new = [content for content, _, _ in table_markdown_chunks(rows, args.max_tokens)]
+            new_seconds.append(time.perf_counter() - started)
+        for label, seconds, chunks in (("legacy", min(legacy_seconds), legacy), ("tokens", min(new_seconds), new)):
+            sizes = estimate_token_counts(chunks)
+            with_header = sum(1 for chunk in chunks if header in " ".join(chunk.split()))
+            print(f"{n_rows:>6} {label:>10} {seconds * 1000:>9.1f} {len(chunks):>7} {np.median(sizes):>11.0f} "
+                  f"{int(sizes.max()):>8} {with_header / len(chunks):>7.0%}")
+        print(f"{'':>6} speedup {min(legacy_seconds) / min(new_seconds):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Table extraction with and without the table-candidate pre-pass.
+
+    cd new_backend
+    python -m benchmarks.bench_table_prepass --pages 200 --table-every 10 --workers 4
+    python -m benchmarks.bench_table_prepass --pdf path/to/report.pdf
+
+Builds a synthetic PDF (text pages, ruled-table pages and pages with decorative boxes)
+unless --pdf is given. Prints how long the pre-pass takes and which pages it selects
+(recall against the known table pages for the synthetic file), then, if Camelot is
+installed, the total Camelot time and tables found for all pages (the previous behavior)
+versus candidate pages only, and the share of all-pages tables the pre-pass kept.
+"""
+import argparse
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from pypdf import PdfReader
+
+from app.core import pdf_workers, utils
+
+WORDS = "revenue margin quarter forecast invoice table section results method analysis growth cost".split()
+
+
+def _text_ops(lines: list[str], x: float = 50, y: float = 780) -> list[str]:
+    ops = [f"BT /F1 10 Tf 13 TL {x} {y} Td"]
+    ops += [f"({line}) Tj T*" for line in lines]
+    ops.append("ET")
+    return ops
+
+
+def _table_ops(rows: int, cols: int, x: float = 60, y: float = 700, cell_w: float = 90, cell_h: float = 20) -> list[str]:
+    ops = ["0.5 w"]
+    for r in range(rows + 1): # Horizontal rulings
+        ops.append(f"{x} {y - r * cell_h} m {x + cols * cell_w} {y - r * cell_h} l S")
+    for c in range(cols + 1): # Vertical rulings
+        ops.append(f"{x + c * cell_w} {y} m {x + c * cell_w} {y - rows * cell_h} l S")
+    for r in range(rows):
+        for c in range(cols):
+            ops.append(f"BT /F1 9 Tf {x + c * cell_w + 4} {y - (r + 1) * cell_h + 6} Td (r{r}c{c} {WORDS[(r + c) % len(WORDS)]}) Tj ET")
+    return ops
+
+
+def build_pdf(path: Path, n_pages: int, table_every: int) -> set[int]:
+    """Writes a synthetic PDF and returns the 0-based pages that hold a ruled table."""
+    table_pages, streams = set(), []
+    for i in range(n_pages):
+        lines = [" ".join(WORDS[(i + j + k) % len(WORDS)] for k in range(12)) for j in range(45)]
+        if table_every and i % table_every == table_every - 1:
+            table_pages.add(i)
+            ops = _text_ops(lines[:3]) + _table_ops(rows=8, cols=5)
+        elif i % 7 == 3: # Decorative frame and header bar: rectangles that are not a table
+            ops = ["20 20 572 752 re S", "0.9 g 40 740 532 30 re f 0 g"] + _text_ops(lines, y=720)
+        else:
+            ops = _text_ops(lines)
+        streams.append("\n".join(ops))
+
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * i} 0 R' for i in range(n_pages))}] /Count {n_pages} >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, stream in enumerate(streams):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    out, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    path.write_bytes(out)
+    return table_pages
+
+
+def run_camelot(pdf_path: str, pages: list[int], workers: int, pages_per_task: int) -> tuple[float, list[dict]]:
+    tasks = [pages[i:i + pages_per_task] for i in range(0, len(pages), pages_per_task)]
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(pdf_workers.extract_camelot_tables_pages, pdf_path, task) for task in tasks]
+        raw_tables = [t for future in futures for tables in (future.result() or {}).values() for t in tables]
+    return time.perf_counter() - started, utils.camelot_table_chunks(raw_tables, "bench.pdf")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", type=str, default=None, help="Benchmark this file instead of a synthetic one.")
+    parser.add_argument("--pages", type=int, default=120)
+    parser.add_argument("--table-every", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--pages-per-task", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        expected = None
+        pdf_path = args.pdf
+        if pdf_path is None:
+            pdf_path = str(Path(tmp_dir) / "bench.pdf")
+            expected = build_pdf(Path(pdf_path), args.pages, args.table_every)
+
+        started = time.perf_counter()
+        reader = PdfReader(pdf_path)
+        candidates = [i for i, page in enumerate(reader.pages) if pdf_workers.is_table_candidate(page)]
+        prepass_seconds = time.perf_counter() - started
+        n_pages = len(reader.pages)
+        print(f"{n_pages} pages, pre-pass {prepass_seconds * 1000:.1f} ms ({prepass_seconds * 1000 / n_pages:.2f} ms/page), "
+              f"{len(candidates)} candidate page(s)")
+        if expected is not None:
+            found = expected & set(candidates)
+            print(f"pre-pass recall {len(found)}/{len(expected)} table pages, "
+                  f"{len(set(candidates) - expected)} false positive(s)")
+
+        if utils.camelot is None:
+            print("Camelot is not installed; skipping the extraction comparison.")
+            return
+        all_seconds, all_tables = run_camelot(pdf_path, list(range(n_pages)), args.workers, args.pages_per_task)
+        pre_seconds, pre_tables = run_camelot(pdf_path, candidates, args.workers, args.pages_per_task)
+        key = lambda t: (t["metadata"]["table_page"], t["metadata"]["table_order_on_page"], t["metadata"]["table_chunk_id"])
+        all_keys, pre_keys = {key(t) for t in all_tables}, {key(t) for t in pre_tables}
+        recall = len(all_keys & pre_keys) / len(all_keys) if all_keys else 1.0
+        print(f"{'mode':>12} {'seconds':>8} {'chunks':>8}")
+        print(f"{'all pages':>12} {all_seconds:>8.2f} {len(all_tables):>8}")
+        print(f"{'pre-pass':>12} {pre_seconds:>8.2f} {len(pre_tables):>8}")
+        print(f"speedup {all_seconds / pre_seconds if pre_seconds else float('inf'):.1f}x, table recall {recall:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Recall@k against size for truncated and quantized chunk embeddings.
+
+    cd new_backend
+    python -m benchmarks.bench_vector_compression --chunks 5000 --queries 200 --k 10
+    python -m benchmarks.bench_vector_compression --user alice          # a real store's vectors
+
+The ground truth of every query is its exact top k by squared L2 distance over the full
+float vectors (what Chroma returns for an uncompressed store). Each configuration is
+scored with vector_codec, as retrieval does:
+    dimensions  EMBEDDING_DIMENSIONS: vectors truncated to a prefix and renormalized
+    scheme      VECTOR_QUANTIZATION: none searches the float vectors exactly; int8 and
+                binary scan compact codes, alone ("codes") and with the best
+                k * QUANTIZED_RESCORE_FACTOR candidates re-scored with the float vectors
+                of the same width ("rescored", what retrieval returns)
+Sizes are bytes per chunk. Quantization keeps the float vectors in Chroma for re-scoring
+and stores the codes next to them, so a quantized configuration takes more space than the
+same width unquantized, not less; "total B" is the float vector plus the code (Chroma's
+HNSW links and metadata come on top in every configuration). Only truncating dimensions
+shrinks the store.
+
+Without --user the vectors are synthetic: topic clusters whose variance decays across
+dimensions, like the Matryoshka-trained text-embedding-3 models where the leading
+dimensions carry the most information, and each query is a perturbed chunk vector. With
+--user, the stored vectors of that user are used and each query is one of them, with its
+own record left out of the ground truth and of the results.
+"""
+import argparse
+import os
+import statistics
+import time
+
+import numpy as np
+
+
+def synthetic_vectors(n_chunks: int, n_queries: int, dimensions: int, seed: int = 23) -> tuple[np.ndarray, np.ndarray]:
+    """Returns (chunk vectors, query vectors), unit length, with most variance in the leading dimensions."""
+    rng = np.random.default_rng(seed)
+    scale = (np.arange(dimensions) + 1.0) ** -0.5
+    centers = rng.standard_normal((max(1, n_chunks // 20), dimensions)) * scale
+    chunks = centers[rng.integers(len(centers), size=n_chunks)] + 0.6 * rng.standard_normal((n_chunks, dimensions)) * scale
+    queries = chunks[rng.integers(n_chunks, size=n_queries)] + 0.5 * rng.standard_normal((n_queries, dimensions)) * scale
+    normalize = lambda vectors: (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    return normalize(chunks), normalize(queries)
+
+
+def stored_vectors(user_id: str) -> np.ndarray:
+    from app.services import vectorstore_service
+
+    vectorstore = vectorstore_service.get_vectorstore(user_id, create_if_not_exists=False)
+    if vectorstore is None:
+        raise SystemExit(f"User {user_id} has no vector store.")
+    pages = []
+    while True:
+        page = vectorstore._collection.get(include=["embeddings"], limit=vectorstore_service.CHROMA_READ_BATCH_SIZE, offset=sum(map(len, pages)))
+        if not len(page["ids"]):
+            return np.concatenate(pages).astype(np.float32) if pages else np.empty((0, 0), dtype=np.float32)
+        pages.append(np.asarray(page["embeddings"], dtype=np.float32))
+
+
+def top_k(query: np.ndarray, vectors: np.ndarray, k: int, exclude: int = -1) -> np.ndarray:
+    distances = np.sum((vectors - query) ** 2, axis=1)
+    if exclude >= 0:
+        distances[exclude] = np.inf
+    return np.argsort(distances, kind="stable")[:k]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimensions", type=int, default=3072, help="Width of the synthetic vectors (text-embedding-3-large: 3072)")
+    parser.add_argument("--truncate", type=int, nargs="+", default=[0, 1536, 1024, 512, 256], help="EMBEDDING_DIMENSIONS values (0: full width)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--user", help="Use the vectors stored for this user instead of synthetic ones")
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+    from app.core.config import settings
+    from app.services.vector_codec import code_scores, code_size, quantize, rescore_order, truncate_embeddings
+
+    if args.user:
+        chunks = stored_vectors(args.user)
+        sample = np.random.default_rng(29).choice(len(chunks), size=min(args.queries, len(chunks)), replace=False)
+        queries, excluded = chunks[sample], sample
+    else:
+        chunks, queries = synthetic_vectors(args.chunks, args.queries, args.dimensions)
+        excluded = np.full(len(queries), -1)
+    k, factor = args.k, settings.QUANTIZED_RESCORE_FACTOR
+    truth = [set(top_k(query, chunks, k, exclude).tolist()) for query, exclude in zip(queries, excluded)]
+    print(f"{len(chunks)} chunks of {chunks.shape[1]} dimensions, {len(queries)} queries, recall@{k}, rescoring {k * factor} candidates")
+    full_bytes = code_size("none", chunks.shape[1])
+    print(f"{'dims':>6} {'scheme':>7} {'float B':>8} {'code B':>7} {'total B':>8} {'vs full':>8} "
+          f"{'recall codes':>13} {'recall rescored':>16} {'scan ms':>8}")
+
+    for dimensions in args.truncate:
+        vectors = truncate_embeddings(chunks, dimensions)
+        truncated_queries = truncate_embeddings(queries, dimensions)
+        width = vectors.shape[1]
+        float_bytes = code_size("none", width)
+        for scheme in ("none", "int8", "binary"):
+            codes = quantize(vectors, scheme) if scheme != "none" else None
+            recall_codes, recall_rescored, latencies = [], [], []
+            for query, exclude, relevant in zip(truncated_queries, excluded, truth):
+                started = time.perf_counter()
+                if codes is None:
+                    found = top_k(query, vectors, k, exclude)
+                    coded = found
+                else:
+                    scores = code_scores(query, codes, scheme, width)
+                    if exclude >= 0:
+                        scores[exclude] = -np.inf
+                    candidates = np.argsort(-scores, kind="stable")[:k * factor]
+                    coded = candidates[:k]
+                    found = rescore_order(query, vectors, candidates)[:k]
+                latencies.append((time.perf_counter() - started) * 1000)
+                recall_codes.append(len(relevant.intersection(coded.tolist())) / k)
+                recall_rescored.append(len(relevant.intersection(found.tolist())) / k)
+            code_bytes = code_size(scheme, width) if codes is not None else 0
+            total_bytes = float_bytes + code_bytes
+            print(f"{width:>6} {scheme:>7} {float_bytes:>8} {code_bytes or '-':>7} {total_bytes:>8} {total_bytes / full_bytes:>8.2f} "
+                  f"{statistics.mean(recall_codes):>13.3f} {statistics.mean(recall_rescored):>16.3f} {statistics.median(latencies):>8.2f}")
+    print("float B: float32 vector per chunk in Chroma (kept for re-scoring); code B: quantized index; "
+          "total B: both, the bytes stored per chunk; vs full: total against the full-width float vector.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Local fake of the OpenAI HTTP API, for tests and benchmarks that must not hit the real service.
+
+Run it standalone:
+    python -m benchmarks.fake_openai_server --port 8900 --latency-ms 50 --rate-limit-every 20
+then point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:8900/v1 and any OPENAI_API_KEY.
+
+Embeddings are deterministic (seeded from a hash of the input), so repeated runs are comparable.
+Chat completions answer with a fixed number of filler tokens, streamed with a per-token delay
+when the request asks for `stream: true`.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import threading
+import time
+from array import array
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class FakeOpenAIConfig:
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        rate_limit_every: int = 0,
+        dimensions: int = 256,
+        completion_tokens: int = 50,
+        token_latency_ms: float = 0.0
+    ):
+        self.latency_ms = latency_ms # Simulated server-side latency per request (time to first token for chat)
+        self.rate_limit_every = rate_limit_every # Answer every Nth request with a 429 (0 disables)
+        self.dimensions = dimensions # Embedding size when the request does not specify one
+        self.completion_tokens = completion_tokens # Length of every chat answer
+        self.token_latency_ms = token_latency_ms # Delay between streamed chat tokens
+        self.request_counter = itertools.count(1)
+        self.embedding_requests = 0
+        self.embedded_inputs = 0
+        self.chat_requests = 0
+        self.completion_tokens_sent = 0
+        self.chat_streams_aborted = 0 # Streams the client closed before the answer was complete
+
+
+def fake_embedding(item, dimensions: int) -> list[float]:
+    """Deterministic unit-length pseudo-embedding for a string or a list of token ids."""
+    seed = hashlib.sha256(repr(item).encode("utf-8")).digest()
+    values = []
+    counter = 0
+    while len(values) < dimensions:
+        block = hashlib.sha256(seed + counter.to_bytes(4, "little")).digest()
+        values.extend((b - 127.5) / 127.5 for b in block)
+        counter += 1
+    values = values[:dimensions]
+    norm = sum(v * v for v in values) ** 0.5 or 1.0
+    return [v / norm for v in values]
+
+
+def create_app(config: FakeOpenAIConfig) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI API")
+
+    async def _simulate_server(request_kind: str):
+        """Applies the configured latency and returns a 429 response if one is due."""
+        request_number = next(config.request_counter)
+        if config.latency_ms:
+            await asyncio.sleep(config.latency_ms / 1000)
+        if config.rate_limit_every and request_number % config.rate_limit_every == 0:
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": "0.05"},
+                content={"error": {"message": f"Simulated rate limit on {request_kind}", "type": "rate_limit_exceeded"}},
+            )
+        return None
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        limited = await _simulate_server("embeddings")
+        if limited is not None:
+            return limited
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dimensions = body.get("dimensions") or config.dimensions
+        config.embedding_requests += 1
+        config.embedded_inputs += len(inputs)
+
+        data = []
+        for i, item in enumerate(inputs):
+            vector = fake_embedding(item, dimensions)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+            else:
+                embedding = vector
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        n_tokens = sum(len(item) if isinstance(item, list) else max(1, len(item) // 4) for item in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake-embedding"),
+            "usage": {"prompt_tokens": n_tokens, "total_tokens": n_tokens},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        limited = await _simulate_server("chat completions")
+        if limited is not None:
+            return limited
+        body = await request.json()
+        model = body.get("model", "fake-chat")
+        config.chat_requests += 1
+        tokens = [f"token{i} " for i in range(config.completion_tokens)]
+        created = int(time.time())
+
+        if not body.get("stream"):
+            if config.token_latency_ms:
+                await asyncio.sleep(config.token_latency_ms * len(tokens) / 1000) # Same generation time as streaming
+            config.completion_tokens_sent += len(tokens)
+            return {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            }
+
+        def chunk(delta: dict, finish_reason=None) -> str:
+            payload = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def stream():
+            sent = 0
+            try:
+                yield chunk({"role": "assistant", "content": ""})
+                for token in tokens:
+                    if await request.is_disconnected(): # Sending to a closed connection does not fail by itself
+                        break
+                    yield chunk({"content": token})
+                    sent += 1
+                    config.completion_tokens_sent += 1
+                    if config.token_latency_ms:
+                        await asyncio.sleep(config.token_latency_ms / 1000)
+                yield chunk({}, finish_reason="stop")
+                yield "data: [DONE]\n\n"
+            finally:
+                if sent < len(tokens):
+                    config.chat_streams_aborted += 1
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.get("/fake/stats")
+    async def stats():
+        return {
+            "embedding_requests": config.embedding_requests,
+            "embedded_inputs": config.embedded_inputs,
+            "chat_requests": config.chat_requests,
+            "completion_tokens_sent": config.completion_tokens_sent,
+            "chat_streams_aborted": config.chat_streams_aborted,
+        }
+
+    return app
+
+
+class BackgroundServer:
+    """Runs an ASGI app with uvicorn on a background thread (for use inside benchmark scripts)."""
+
+    def __init__(self, app, host: str = "127.0.0.1", port: int = 8900):
+        self.url = f"http://{host}:{port}"
+        self._server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Server at {self.url} did not start in time.")
+            time.sleep(0.02)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+
+class FakeOpenAIServer(BackgroundServer):
+    """The fake OpenAI API on a background thread; point clients at `.base_url`."""
+
+    def __init__(self, config: FakeOpenAIConfig, host: str = "127.0.0.1", port: int = 8900):
+        super().__init__(create_app(config), host, port)
+        self.config = config
+        self.base_url = f"{self.url}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake OpenAI API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--completion-tokens", type=int, default=50)
+    parser.add_argument("--token-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    fake_config = FakeOpenAIConfig(
+        args.latency_ms, args.rate_limit_every, args.dimensions, args.completion_tokens, args.token_latency_ms
+    )
+    uvicorn.run(create_app(fake_config), host=args.host, port=args.port)
@@ -0,0 +1,37 @@
+"""
+Shared setup for the query benchmarks: points the backend at the fake OpenAI server,
+gives it a throwaway Chroma store and seeds one user with synthetic report chunks.
+"""
+import os
+import tempfile
+from pathlib import Path
+
+BENCH_USER_ID = "bench_query_user"
+
+
+def configure_backend(openai_base_url: str, n_chunks: int = 30):
+    """Returns the FastAPI app, configured against `openai_base_url` and seeded with `n_chunks` chunks."""
+    # Settings are read at import time, so the environment must be set before importing the app
+    os.environ["OPENAI_BASE_URL"] = openai_base_url
+    os.environ["OPENAI_API_KEY"] = "fake-key"
+    from app.core.config import settings
+    settings.CHROMA_STORE_DIR = Path(tempfile.mkdtemp(prefix="bench_chroma_"))
+    from app.main import app
+    from app.services import vectorstore_service
+    from langchain.docstore.document import Document as LangchainDocument
+
+    docs = [
+        LangchainDocument(
+            page_content=f"# Results\n\nRevenue grew {i} percent in quarter {i % 4 + 1}.",
+            metadata={"original_source": "report.pdf", "page": i, "content_type": "text_section", "section_title": "Results"}
+        )
+        for i in range(n_chunks)
+    ]
+    if not vectorstore_service.add_documents_to_store(BENCH_USER_ID, docs):
+        raise RuntimeError("Could not seed the benchmark vector store.")
+    return app
+
+
+def cleanup_backend() -> None:
+    from app.services import vectorstore_service
+    vectorstore_service.delete_user_store(BENCH_USER_ID)
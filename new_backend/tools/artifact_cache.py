@@ -0,0 +1,81 @@
+"""
+Inspects and purges the extraction artifact cache.
+
+    cd new_backend
+    python -m tools.artifact_cache stats
+    python -m tools.artifact_cache list --limit 20
+    python -m tools.artifact_cache purge --hash 3fa2c1              # one file (hash prefix)
+    python -m tools.artifact_cache purge --extractor camelot         # one extractor, all files
+    python -m tools.artifact_cache purge --unused-days 30
+    python -m tools.artifact_cache purge --all
+    python -m tools.artifact_cache evict --max-mb 256
+
+Artifacts are keyed by file content hash and extractor version; `list` shows one row
+per (file, extractor) with the pages cached, their compressed size and last use.
+"""
+import argparse
+import sys
+import time
+
+from app.core.config import settings
+from app.services.artifact_cache import artifact_cache
+
+
+def _format_bytes(size: int) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Totals and size limit")
+    list_parser = commands.add_parser("list", help="Cached artifacts per file and extractor")
+    list_parser.add_argument("--limit", type=int, default=50)
+    purge_parser = commands.add_parser("purge", help="Delete artifacts matching all given filters")
+    purge_parser.add_argument("--hash", help="Content hash (or prefix) of a file")
+    purge_parser.add_argument("--extractor", help="Extractor version prefix, e.g. 'camelot' or 'ocr:150dpi'")
+    purge_parser.add_argument("--unused-days", type=float, help="Only artifacts not used for this many days")
+    purge_parser.add_argument("--all", action="store_true", help="Delete everything")
+    evict_parser = commands.add_parser("evict", help="Evict least recently used artifacts down to a size")
+    evict_parser.add_argument("--max-mb", type=float, default=settings.ARTIFACT_CACHE_MAX_BYTES / (1024 * 1024))
+    args = parser.parse_args()
+
+    if artifact_cache is None:
+        print("The artifact cache is disabled (ARTIFACT_CACHE_ENABLED=false).")
+        return 1
+
+    if args.command == "stats":
+        stats = artifact_cache.stats()
+        print(f"{settings.ARTIFACT_CACHE_PATH}")
+        print(f"{stats['artifacts']} artifact(s) for {stats['files']} file(s), "
+              f"{_format_bytes(stats['size_bytes'])} of {_format_bytes(stats['max_bytes'])}")
+    elif args.command == "list":
+        entries = artifact_cache.list_entries()
+        print(f"{'content hash':<16} {'extractor':<44} {'pages':>6} {'size':>11} {'last used':>20}")
+        for entry in entries[:args.limit]:
+            last_used = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["last_used_at"]))
+            print(f"{entry['content_hash'][:16]:<16} {entry['extractor']:<44} {entry['pages']:>6} "
+                  f"{_format_bytes(entry['size_bytes']):>11} {last_used:>20}")
+        if len(entries) > args.limit:
+            print(f"... {len(entries) - args.limit} more")
+    elif args.command == "purge":
+        if not (args.hash or args.extractor or args.unused_days is not None or args.all):
+            print("Give --hash, --extractor, --unused-days or --all.")
+            return 2
+        removed = artifact_cache.purge(
+            content_hash=args.hash,
+            extractor_prefix=args.extractor,
+            unused_for_seconds=args.unused_days * 86400 if args.unused_days is not None else None
+        )
+        print(f"Removed {removed} artifact(s).")
+    elif args.command == "evict":
+        removed = artifact_cache.evict(max_bytes=int(args.max_mb * 1024 * 1024))
+        print(f"Evicted {removed} artifact(s); {_format_bytes(artifact_cache.total_bytes())} left.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Checks that users' vector stores and chunk manifests agree.
+
+    cd new_backend
+    python -m tools.check_index                    # every user with a vector store
+    python -m tools.check_index --user alice --repair
+    python -m tools.check_index --normalize-metadata
+
+Reports orphaned embeddings (records in the store that no manifest entry owns),
+missing embeddings (manifest chunk IDs that are not in the store) and, with hybrid
+search enabled, lexical index drift (stored chunks the BM25 index lacks, or indexed
+chunks the store lacks) and, with VECTOR_QUANTIZATION, quantized code drift (the same
+for the codes). With --repair, files indexed before the manifest existed are adopted into
+it, the remaining orphans are deleted, missing chunk IDs are dropped from the manifest and
+a drifted lexical index or set of codes is rebuilt from the store. With
+--normalize-metadata, the metadata of chunks indexed before the query filter fields were
+typed is rewritten in place (no re-embedding) and the lexical index rebuilt with it.
+Exits with status 1 if an inconsistency was found and not repaired.
+"""
+import argparse
+import sys
+
+from app.services import vectorstore_service
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", action="append", dest="users", help="User to check (repeatable); defaults to all users")
+    parser.add_argument("--repair", action="store_true", help="Fix the inconsistencies that were found")
+    parser.add_argument("--normalize-metadata", action="store_true", help="Type the filter fields of older chunks' metadata")
+    parser.add_argument("--show-ids", type=int, default=5, help="Number of chunk IDs to print per problem")
+    args = parser.parse_args()
+
+    users = args.users or vectorstore_service.list_store_users()
+    inconsistent = False
+    print(f"{'user':<24} {'files':>6} {'manifest':>9} {'store':>9} {'orphaned':>9} {'missing':>8} {'lexical':>8} {'codes':>6}")
+    for user_id in users:
+        report = vectorstore_service.check_index_consistency(user_id, repair=args.repair)
+        orphaned, missing = report["orphaned_embeddings"], report["missing_embeddings"]
+        drift = {label: report[key] for label, key in (
+            ("lexical missing", "lexical_missing"), ("lexical orphaned", "lexical_orphaned"),
+            ("codes missing", "quantized_missing"), ("codes orphaned", "quantized_orphaned")
+        )}
+        lexical_drift = len(drift["lexical missing"]) + len(drift["lexical orphaned"])
+        code_drift = len(drift["codes missing"]) + len(drift["codes orphaned"])
+        print(
+            f"{user_id:<24} {report['manifest_files']:>6} {report['manifest_chunks']:>9} "
+            f"{report['store_chunks']:>9} {len(orphaned):>9} {len(missing):>8} {lexical_drift:>8} {code_drift:>6}"
+        )
+        for label, ids in (("orphaned", orphaned), ("missing", missing), *drift.items()):
+            if ids and args.show_ids:
+                print(f"    {label}: {', '.join(ids[:args.show_ids])}{' ...' if len(ids) > args.show_ids else ''}")
+        found = orphaned or missing or any(drift.values())
+        if args.repair and found:
+            print(
+                f"    repaired: adopted {len(report['adopted_files'])} file(s), "
+                f"deleted {report['deleted_orphans']} orphan(s), dropped {len(missing)} missing chunk(s), "
+                f"rebuilt indexes: {', '.join(report['rebuilt_indexes']) or 'none'}"
+            )
+        if args.normalize_metadata:
+            print(f"    normalized metadata of {vectorstore_service.normalize_stored_metadata(user_id)} chunk(s)")
+        inconsistent = inconsistent or (found and not args.repair)
+    return 1 if inconsistent else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""
+Migrates per-user Chroma stores into the shared multi-tenant layout.
+
+    cd new_backend
+    python -m tools.migrate_vectorstore                          # every per-user store
+    python -m tools.migrate_vectorstore --user alice --user bob
+    python -m tools.migrate_vectorstore --delete-source          # remove each store once copied
+
+Each store under CHROMA_STORE_DIR is copied into the user's shard (VECTORSTORE_SHARDS
+collections under SHARED_CHROMA_STORE_DIR) with its embeddings and chunk IDs, so nothing
+is re-embedded and the chunk manifest and lexical index keep working. A copy is checked
+by count before its source is deleted; re-running the tool is safe. Set
+VECTORSTORE_MODE=shared once every user is migrated. Exits with status 1 if a store
+could not be migrated.
+"""
+import argparse
+import sys
+import time
+
+from app.core.config import settings
+from app.services import vectorstore_service
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", action="append", dest="users", help="User to migrate (repeatable); defaults to all per-user stores")
+    parser.add_argument("--delete-source", action="store_true", help="Remove each per-user store directory once its copy is verified")
+    args = parser.parse_args()
+
+    users = args.users or sorted(path.name for path in settings.CHROMA_STORE_DIR.iterdir() if path.is_dir())
+    print(f"Migrating {len(users)} user(s) into {settings.SHARED_CHROMA_STORE_DIR} ({settings.VECTORSTORE_SHARDS} shard(s))")
+    failed, total, started = [], 0, time.perf_counter()
+    for user_id in users:
+        try:
+            copied = vectorstore_service.migrate_user_to_shared(user_id, delete_source=args.delete_source)
+        except Exception as e:
+            print(f"{user_id:<24} failed: {e}")
+            failed.append(user_id)
+            continue
+        total += copied
+        print(f"{user_id:<24} {copied:>9} record(s){' (source deleted)' if args.delete_source else ''}")
+    print(f"Migrated {total} record(s) of {len(users) - len(failed)} user(s) in {time.perf_counter() - started:.1f} s; {len(failed)} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
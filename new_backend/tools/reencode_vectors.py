@@ -0,0 +1,63 @@
+"""
+Re-encodes stored chunk vectors after EMBEDDING_DIMENSIONS or VECTOR_QUANTIZATION changed.
+
+    cd new_backend
+    EMBEDDING_DIMENSIONS=1024 VECTOR_QUANTIZATION=int8 python -m tools.reencode_vectors
+    python -m tools.reencode_vectors --user alice --user bob
+    VECTOR_QUANTIZATION=binary python -m tools.reencode_vectors --codes-only
+
+Every store (every shard of the shared layout) is rewritten with its vectors truncated to
+EMBEDDING_DIMENSIONS, and each user's quantized codes are rebuilt. Nothing is sent to the
+embeddings API: vectors come from the embedding cache when it has the chunk text (so a
+store can also be widened again) and from the store otherwise. Chunk IDs, documents and
+metadata are kept. Run it with the server stopped, using the settings the server will
+use. --codes-only only rebuilds the codes (after changing VECTOR_QUANTIZATION alone).
+Exits with status 1 if a store could not be re-encoded.
+"""
+import argparse
+import sys
+import time
+
+from app.core.config import settings
+from app.services import vectorstore_service
+from app.services.tenant_collection import shard_collection_name
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", action="append", dest="users", help="User to re-encode (repeatable); defaults to all users")
+    parser.add_argument("--codes-only", action="store_true", help="Only rebuild the quantized codes of the stored vectors")
+    args = parser.parse_args()
+
+    users = args.users or vectorstore_service.list_store_users()
+    shared = settings.VECTORSTORE_MODE == "shared"
+    print(f"Re-encoding {len(users)} user(s) at {settings.EMBEDDING_DIMENSIONS or 'full'} dimensions, "
+          f"quantization {settings.VECTOR_QUANTIZATION}{' (codes only)' if args.codes_only else ''}")
+    failed, started = [], time.perf_counter()
+
+    if not args.codes_only and shared:
+        # A shard holds many users' records, so it is re-encoded as a whole
+        for name in sorted({shard_collection_name(user_id, settings.VECTORSTORE_SHARDS) for user_id in users}):
+            try:
+                print(f"{name:<24} {vectorstore_service.reencode_shared_shard(name):>9} vector(s)")
+            except Exception as e:
+                print(f"{name:<24} failed: {e}")
+                failed.append(name)
+
+    for user_id in users:
+        try:
+            if args.codes_only or shared:
+                codes = vectorstore_service.rebuild_quantized_codes(user_id)
+                print(f"{user_id:<24} {codes:>9} code(s)")
+            else:
+                vectors = vectorstore_service.reencode_user_store(user_id)
+                print(f"{user_id:<24} {vectors:>9} vector(s)")
+        except Exception as e:
+            print(f"{user_id:<24} failed: {e}")
+            failed.append(user_id)
+    print(f"Done in {time.perf_counter() - started:.1f} s; {len(failed)} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())